@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 import os
+import sys
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -26,6 +27,9 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = False
 
+# Running under `manage.py test`, which keeps the suite on local and offline services
+TESTING = sys.argv[1:2] == ['test']
+
 ALLOWED_HOSTS = [
     'editor-jhayescs4300-5.devedu.io', 
     'app-jhayescs4300-5.devedu.io', 
@@ -166,16 +170,88 @@ TRUSTED_ORIGINS = ['https://todolistapp.tech']
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Cache settings
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    },
-    'select2': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+# 'locmem' keeps a separate cache in every process and is meant for tests and
+# development. 'file', 'database' and 'memcached' are shared by all workers, so run
+# one of them whenever the app is served by more than one process: the task version
+# behind the cached calendars and the suggestion jobs have to be seen by every worker.
+# 'database' is the default outside of DEBUG and the test runner, migrate creates its
+# table.
+CACHE_BACKENDS = {
+    'locmem': 'todoapp.cache_backends.CountingLocMemCache',
+    'file': 'todoapp.cache_backends.CountingFileBasedCache',
+    'database': 'todoapp.cache_backends.CountingDatabaseCache',
+    'memcached': 'todoapp.cache_backends.CountingPyMemcacheCache',
+}
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "locmem" if DEBUG or TESTING else "database")
+# Directory for 'file', table name for 'database' and host:port for 'memcached'
+CACHE_LOCATION = os.getenv("CACHE_LOCATION", {
+    'locmem': '',
+    'file': str(BASE_DIR / 'cache'),
+    'database': 'todoapp_cache',
+    'memcached': '127.0.0.1:11211',
+}[CACHE_BACKEND])
+
+
+def cache_settings(alias):
+    """Return the settings of one cache alias on the selected backend."""
+    location = CACHE_LOCATION
+    if CACHE_BACKEND == 'file':
+        # one directory per alias, so clearing one cache keeps the other
+        location = f'{CACHE_LOCATION}/{alias}'
+    elif CACHE_BACKEND == 'locmem':
+        location = alias
+    return {
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND],
+        'LOCATION': location,
+        'KEY_PREFIX': alias,
+        'STATS_ALIAS': alias,
     }
+
+
+CACHES = {
+    'default': cache_settings('default'),
+    'select2': cache_settings('select2'),
 }
 
 SELECT2_CACHE_BACKEND = 'select2'
 
+# Countries users can pick calendar holidays from, the first one is the default
+HOLIDAY_COUNTRIES = ['US', 'CA', 'MX', 'GB']
+# Precompute holidays for the current year +/- 1 at startup, off by default so
+# management commands and test runs don't pay for it; the months are cached as they
+# are first requested either way
+HOLIDAY_CACHE_WARM = os.getenv("HOLIDAY_CACHE_WARM") == "True"
+
+# Quote of the day source, 'zenquotes' or 'fixture' for the offline quotes, which the
+# test runner uses so the suite makes no requests to zenquotes.io
+QUOTE_PROVIDER = os.getenv("QUOTE_PROVIDER", "fixture" if TESTING else "zenquotes")
+
 # Used for task suggestions OPENAI API implementation
 OPENAI_TASK_SUGGESTION = os.getenv("OPENAI_TASK_SUGGESTION")
+# 'remote' asks the model, 'pattern' suggests recurring tasks offline
+TASK_SUGGESTION_ENGINE = os.getenv("TASK_SUGGESTION_ENGINE", "remote")
+# Client of the remote engine, 'openai' or 'local' for the offline stand-in client
+TASK_SUGGESTION_CLIENT = os.getenv("TASK_SUGGESTION_CLIENT", "openai")
+# Background threads generating task suggestions
+TASK_SUGGESTION_WORKERS = 4
+
+# Tasks per page of the task and archive lists, and the most a ?page_size= may ask for
+TASK_PAGE_SIZE = int(os.getenv("TASK_PAGE_SIZE", "25"))
+TASK_PAGE_SIZE_MAX = 100
+
+# Days deletions are remembered for the delta sync, older sync tokens need a full sync
+SYNC_TOMBSTONE_DAYS = 30
+# Seconds each sync token reaches back, so rows saved by transactions that were still
+# committing when it was issued are sent again instead of missed
+SYNC_TOKEN_OVERLAP = 5
+
+# Live collaboration events: broker from todoapp.events.EVENT_BROKERS, events queued per
+# open connection before it is told to resync, events kept per user for reconnects
+EVENT_BROKER = os.getenv("EVENT_BROKER", "local")
+EVENT_QUEUE_SIZE = 100
+EVENT_HISTORY_SIZE = 50
+# Seconds a long-poll waits, between keep-alive comments on a stream, and the
+# EventSource reconnect delay in milliseconds
+EVENT_LONG_POLL_TIMEOUT = 25
+EVENT_HEARTBEAT = 15
+EVENT_RETRY_MS = 2000
@@ -0,0 +1,52 @@
+"""What a user may do with a task.
+
+Every check is answered by at most one EXISTS query. Tasks loaded with
+Task.objects.with_access(user) carry the flags as annotations, so the checks on them
+cost no query at all. The creator is compared by id, which needs no query either."""
+from django.db.models import Exists, OuterRef
+
+from .models import Task, TaskCollabRequest
+
+
+def _annotated(user, task):
+    """Return True if task was loaded with Task.objects.with_access(user)."""
+    return (
+        hasattr(task, 'user_is_member')
+        and getattr(task, 'access_user_id', None) == user.pk
+    )
+
+
+def is_member(user, task):
+    """Return True if the user collaborates on the task."""
+    if not user.is_authenticated:
+        return False
+    if _annotated(user, task):
+        return task.user_is_member
+    return Task.assigned_users.through.objects.filter(task_id=task.pk, user_id=user.pk).exists()
+
+
+def can_view(user, task):
+    """Return True if the task is in the user's lists, as its creator or a collaborator.
+
+    These users may also edit and share the task, see can_manage for the rest."""
+    if not user.is_authenticated:
+        return False
+    return task.creator_id == user.pk or is_member(user, task)
+
+
+def can_manage(user, task):
+    """Return True if the user created the task and so may archive, restore or delete it."""
+    return user.is_authenticated and task.creator_id == user.pk
+
+
+def can_accept(user, task):
+    """Return True if the user may join the task through its share link: they are
+    signed in, not already in it and have no pending request for it."""
+    if not user.is_authenticated or task.creator_id == user.pk:
+        return False
+    if _annotated(user, task):
+        return not task.user_is_member and not task.user_has_request
+
+    assigned = Task.assigned_users.through.objects.filter(task=OuterRef('pk'), user_id=user.pk)
+    requested = TaskCollabRequest.objects.filter(task=OuterRef('pk'), to_user_id=user.pk)
+    return not Task.objects.filter(Exists(assigned) | Exists(requested), pk=task.pk).exists()
@@ -0,0 +1,621 @@
+"""JSON API over tasks, subtasks, categories and task collaboration requests.
+
+Rows are read with .values() restricted to the columns behind the ?fields= asked for,
+and many-to-many fields with one query on their through table per page. Lists are
+paged with a keyset cursor in ?after=.
+
+Every GET response carries a strong ETag built from the user's task version, or the
+category version for categories, and the request path. A client polling with
+If-None-Match gets a 304 as soon as the version is read from the cache, before any
+row is loaded or serialized.
+
+Collaboration events from todoapp.events are pushed over a text/event-stream, or
+returned by a long-poll for clients without EventSource."""
+# disabling django specific errors such as class has no "object" member
+# pylint: disable=E1101, W0613
+import hashlib
+import heapq
+import json
+from collections import defaultdict
+from functools import wraps
+from operator import itemgetter
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connections
+from django.db.models import Q
+from django.forms.models import model_to_dict
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.views.decorators.http import condition, require_GET, require_http_methods
+
+from . import sync
+
+from .access import can_manage, can_view
+from .caching import get_category_version, get_task_version
+from .events import format_sse, get_broker, parse_event_id
+from .forms import CategoryForm, SubTaskForm, TaskCollabForm, TaskForm
+from .models import Category, SubTask, SyncTombstone, Task, TaskCollabRequest
+from .pagination import after_cursor, decode_cursor, encode_cursor, get_page_size
+
+FIELDS_PARAM = 'fields'
+CURSOR_PARAM = 'after'
+
+
+class Resource:
+    """How one model is exposed: the fields a client may ask for and how to read them.
+
+    Attributes:
+        columns: API field name -> column or lookup read with .values()
+        relations: API field name -> (through model, source column, target column) of
+            a many-to-many field, returned as a list of ids
+        keys: the columns pages are ordered on, always read"""
+    keys = ('id',)
+
+    def __init__(self, columns, relations=None):
+        self.columns = columns
+        self.relations = relations or {}
+
+    @property
+    def fields(self):
+        """Every field of the resource."""
+        return [*self.columns, *self.relations]
+
+    def parse_fields(self, params):
+        """Return the fields asked for in params, all of them by default.
+
+        Raises ValueError on a field the resource does not have."""
+        requested = params.get(FIELDS_PARAM)
+        if not requested:
+            return self.fields
+        fields = list(dict.fromkeys(
+            name.strip() for name in requested.split(',') if name.strip()
+        ))
+        unknown = [
+            name for name in fields if name not in self.columns and name not in self.relations
+        ]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        return fields
+
+    def values(self, queryset, fields):
+        """Return queryset as dicts holding only the ordering keys and the columns
+        behind fields."""
+        columns = {self.columns[name] for name in fields if name in self.columns}
+        return queryset.values(*self.keys, *sorted(columns - set(self.keys)))
+
+    def serialize(self, rows, fields):
+        """Return the API objects of rows read by values(), one query per relation."""
+        ids = [row['id'] for row in rows]
+        related = {
+            name: self.related_ids(name, ids) for name in fields if name in self.relations
+        }
+        return [
+            {
+                name: related[name].get(row['id'], []) if name in related
+                else row[self.columns[name]]
+                for name in fields
+            }
+            for row in rows
+        ]
+
+    def related_ids(self, name, ids):
+        """Return {id: [related ids]} of relation name for the rows with the given ids."""
+        through, source, target = self.relations[name]
+        grouped = defaultdict(list)
+        if ids:
+            pairs = through.objects.filter(**{f'{source}__in': ids}).order_by(target)
+            for source_id, target_id in pairs.values_list(source, target):
+                grouped[source_id].append(target_id)
+        return grouped
+
+    def get(self, queryset, fields):
+        """Return the API object of the single row of queryset, or None."""
+        rows = list(self.values(queryset, fields)[:1])
+        return self.serialize(rows, fields)[0] if rows else None
+
+    def page(self, querysets, fields, params):
+        """Return the page of the list made of the disjoint querysets that follows the
+        cursor in params, as {'results': [...], 'next': cursor or None}."""
+        page_size = get_page_size(params)
+        cursor = self.decode_cursor(params.get(CURSOR_PARAM))
+
+        # one extra row tells whether there is a next page without a COUNT
+        parts = [
+            list(self.after(self.values(queryset, fields), cursor)[:page_size + 1])
+            for queryset in querysets
+        ]
+        rows = list(heapq.merge(*parts, key=itemgetter(*self.keys)))[:page_size + 1]
+        next_cursor = self.encode_cursor(rows[page_size - 1]) if len(rows) > page_size else None
+        return {'results': self.serialize(rows[:page_size], fields), 'next': next_cursor}
+
+    def after(self, queryset, cursor):
+        """Return the rows of queryset that follow cursor, in id order."""
+        queryset = queryset.order_by('id')
+        return queryset if cursor is None else queryset.filter(id__gt=cursor)
+
+    def decode_cursor(self, cursor):
+        """Return the id of a cursor, or None if it is missing or malformed."""
+        try:
+            return int(cursor)
+        except (TypeError, ValueError):
+            return None
+
+    def encode_cursor(self, row):
+        """Return the cursor pointing just after row."""
+        return str(row['id'])
+
+
+class TaskResource(Resource):
+    """Tasks are paged in (due_date, id) order, like the task lists of the pages."""
+    keys = ('due_date', 'id')
+
+    def after(self, queryset, cursor):
+        return after_cursor(queryset, cursor)
+
+    def decode_cursor(self, cursor):
+        return decode_cursor(cursor)
+
+    def encode_cursor(self, row):
+        return encode_cursor(row['due_date'], row['id'])
+
+
+TASKS = TaskResource(
+    {
+        'id': 'id',
+        'name': 'name',
+        'description': 'description',
+        'due_date': 'due_date',
+        'progress': 'progress',
+        'is_completed': 'is_completed',
+        'is_archived': 'is_archived',
+        'ignore_archive': 'ignore_archive',
+        'notifications_enabled': 'notifications_enabled',
+        'notification_time': 'notification_time',
+        'notification_type': 'notification_type',
+        'creator': 'creator_id',
+        'updated_at': 'updated_at',
+        'subtask_count': 'subtask_count',
+        'subtask_done_count': 'subtask_done_count',
+        'collaborator_count': 'collaborator_count',
+    },
+    {
+        'categories': (Task.categories.through, 'task_id', 'category_id'),
+        'assigned_users': (Task.assigned_users.through, 'task_id', 'user_id'),
+    },
+)
+SUBTASKS = Resource(
+    {
+        'id': 'id',
+        'task': 'task_id',
+        'name': 'name',
+        'is_completed': 'is_completed',
+        'updated_at': 'updated_at',
+    },
+    {'assigned_users': (SubTask.assigned_users.through, 'subtask_id', 'user_id')},
+)
+CATEGORIES = Resource({'id': 'id', 'name': 'name'})
+REQUESTS = Resource(
+    {
+        'id': 'id',
+        'task': 'task_id',
+        'from_user': 'from_user_id',
+        'to_user': 'to_user_id',
+        'updated_at': 'updated_at',
+    }
+)
+
+
+def api_login_required(view_func):
+    """Answer anonymous requests with a 401 instead of redirecting to the login page.
+
+    Async views get the user loaded without blocking the event loop, set on
+    request.user like async_login_required does."""
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def async_wrapper(request, *args, **kwargs):
+            user = await request.auser()
+            if not user.is_authenticated:
+                return JsonResponse({'error': 'Authentication required'}, status=401)
+            request.user = user
+            return await view_func(request, *args, **kwargs)
+        return async_wrapper
+
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'error': 'Authentication required'}, status=401)
+        return view_func(request, *args, **kwargs)
+    return wrapper
+
+
+def make_etag(request, version):
+    """Return the ETag of the response to request while the data is at version."""
+    raw = f'{request.user.pk}|{version}|{request.get_full_path()}'
+    return hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
+
+
+def task_etag(request, *args, **kwargs):
+    """ETag of responses built from what the user can see: tasks, subtasks, requests."""
+    return make_etag(request, get_task_version(request.user.pk))
+
+
+def category_etag(request, *args, **kwargs):
+    """ETag of responses built from the category list, the same for every user."""
+    return make_etag(request, get_category_version())
+
+
+def read_json(request):
+    """Return the JSON object in the request body.
+
+    Raises ValueError if the body is not a JSON object."""
+    data = json.loads(request.body.decode('utf-8') or '{}')
+    if not isinstance(data, dict):
+        raise ValueError('Expected a JSON object')
+    return data
+
+
+def error(message, status=400):
+    """Return a JSON error response."""
+    return JsonResponse({'error': message}, status=status)
+
+
+def form_error(form):
+    """Return the validation errors of form as a JSON response."""
+    return JsonResponse({'error': 'Invalid data', 'fields': form.errors.get_json_data()},
+                        status=400)
+
+
+def get_visible_task(request, task_id):
+    """Return the task if the user can view it, otherwise None.
+
+    The task and the user's access to it are loaded in one query."""
+    task = Task.objects.with_access(request.user).filter(pk=task_id).first()
+    if task is None or not can_view(request.user, task):
+        return None
+    return task
+
+
+def list_response(resource, params, querysets):
+    """Return a page of the list made of querysets with the fields asked for in params."""
+    try:
+        fields = resource.parse_fields(params)
+    except ValueError as e:
+        return error(str(e))
+    return JsonResponse(resource.page(querysets, fields, params))
+
+
+def object_response(resource, queryset, status=200):
+    """Return the single object of queryset with every field."""
+    return JsonResponse(resource.get(queryset, resource.fields), status=status)
+
+
+@api_login_required
+@require_http_methods(['GET', 'POST'])
+@condition(etag_func=task_etag)
+def task_list(request):
+    """List the user's tasks or create one.
+
+    GET lists the unarchived tasks the user created or collaborates on, or the archived
+    ones with ?archived=true. POST takes the fields of the add task form as JSON."""
+    if request.method == 'GET':
+        if request.GET.get('archived', '').lower() in ('1', 'true', 'yes'):
+            parts = Task.objects.list_parts(request.user, 'archived')
+        else:
+            parts = (Task.objects.list_parts(request.user, 'owned')
+                     + Task.objects.list_parts(request.user, 'shared'))
+        return list_response(TASKS, request.GET, parts)
+
+    try:
+        data = read_json(request)
+    except ValueError as e:
+        return error(str(e))
+    form = TaskForm(data)
+    if not form.is_valid():
+        return form_error(form)
+    task = form.save(commit=False)
+    task.creator = request.user
+    task.save()
+    form.save_m2m()
+    return object_response(TASKS, Task.objects.filter(pk=task.pk), status=201)
+
+
+@api_login_required
+@require_http_methods(['GET', 'PATCH', 'DELETE'])
+@condition(etag_func=task_etag)
+def task_detail(request, task_id):
+    """Read, update or delete one of the user's tasks.
+
+    PATCH takes any of the fields of the edit task form as JSON, which collaborators may
+    change too. Only the creator may DELETE the task."""
+    task = get_visible_task(request, task_id)
+    if task is None:
+        return error('Task not found', status=404)
+
+    if request.method == 'GET':
+        try:
+            fields = TASKS.parse_fields(request.GET)
+        except ValueError as e:
+            return error(str(e))
+        return JsonResponse(TASKS.get(Task.objects.filter(pk=task.pk), fields))
+
+    if request.method == 'DELETE':
+        if not can_manage(request.user, task):
+            return error('Only the creator can delete this task', status=403)
+        task.delete()
+        return HttpResponse(status=204)
+
+    try:
+        changes = read_json(request)
+    except ValueError as e:
+        return error(str(e))
+    data = {**model_to_dict(task, fields=TaskForm.Meta.fields), **changes}
+    data['categories'] = [getattr(category, 'pk', category) for category in data['categories']]
+    form = TaskForm(data, instance=task)
+    if not form.is_valid():
+        return form_error(form)
+    form.save()
+    return object_response(TASKS, Task.objects.filter(pk=task.pk))
+
+
+@api_login_required
+@require_http_methods(['GET', 'POST'])
+@condition(etag_func=task_etag)
+def subtask_list(request, task_id):
+    """List the subtasks of one of the user's tasks or add one."""
+    task = get_visible_task(request, task_id)
+    if task is None:
+        return error('Task not found', status=404)
+
+    if request.method == 'GET':
+        return list_response(SUBTASKS, request.GET, [task.subtasks.all()])
+
+    try:
+        data = read_json(request)
+    except ValueError as e:
+        return error(str(e))
+    form = SubTaskForm(data, task=task)
+    if not form.is_valid():
+        return form_error(form)
+    subtask = form.save()
+    return object_response(SUBTASKS, SubTask.objects.filter(pk=subtask.pk), status=201)
+
+
+@api_login_required
+@require_http_methods(['GET', 'PATCH', 'DELETE'])
+@condition(etag_func=task_etag)
+def subtask_detail(request, subtask_id):
+    """Read, update or delete a subtask of one of the user's tasks."""
+    subtask = SubTask.objects.select_related('task').filter(pk=subtask_id).first()
+    if subtask is None or not can_view(request.user, subtask.task):
+        return error('Subtask not found', status=404)
+
+    if request.method == 'GET':
+        try:
+            fields = SUBTASKS.parse_fields(request.GET)
+        except ValueError as e:
+            return error(str(e))
+        return JsonResponse(SUBTASKS.get(SubTask.objects.filter(pk=subtask.pk), fields))
+
+    if request.method == 'DELETE':
+        subtask.delete()
+        return HttpResponse(status=204)
+
+    try:
+        changes = read_json(request)
+    except ValueError as e:
+        return error(str(e))
+    data = {**model_to_dict(subtask, fields=SubTaskForm.Meta.fields), **changes}
+    data['assigned_users'] = [getattr(user, 'pk', user) for user in data['assigned_users']]
+    form = SubTaskForm(data, instance=subtask, task=subtask.task)
+    if not form.is_valid():
+        return form_error(form)
+    form.save()
+    return object_response(SUBTASKS, SubTask.objects.filter(pk=subtask.pk))
+
+
+@api_login_required
+@require_http_methods(['GET', 'POST'])
+@condition(etag_func=category_etag)
+def category_list(request):
+    """List the categories or, for staff, add one."""
+    if request.method == 'GET':
+        return list_response(CATEGORIES, request.GET, [Category.objects.all()])
+
+    if not request.user.is_staff:
+        return error('Only staff can add categories', status=403)
+    try:
+        data = read_json(request)
+    except ValueError as e:
+        return error(str(e))
+    form = CategoryForm(data)
+    if not form.is_valid():
+        return form_error(form)
+    category = form.save()
+    return object_response(CATEGORIES, Category.objects.filter(pk=category.pk), status=201)
+
+
+@api_login_required
+@require_http_methods(['GET', 'POST'])
+@condition(etag_func=task_etag)
+def request_list(request):
+    """List the user's collaboration requests or send one.
+
+    GET lists the requests sent to and by the user, only one side of them with
+    ?direction=incoming or outgoing. POST takes {"task": id, "to_user": id}."""
+    if request.method == 'GET':
+        direction = request.GET.get('direction')
+        if direction == 'incoming':
+            mine = Q(to_user=request.user)
+        elif direction == 'outgoing':
+            mine = Q(from_user=request.user)
+        else:
+            mine = Q(to_user=request.user) | Q(from_user=request.user)
+        return list_response(REQUESTS, request.GET, [TaskCollabRequest.objects.filter(mine)])
+
+    try:
+        data = read_json(request)
+        task_id = int(data['task'])
+    except KeyError:
+        return error('Missing field: task')
+    except (TypeError, ValueError) as e:
+        return error(str(e))
+    task = get_visible_task(request, task_id)
+    if task is None:
+        return error('Task not found', status=404)
+    form = TaskCollabForm(data, user=request.user, task=task)
+    if not form.is_valid():
+        return form_error(form)
+    collab_request = form.save(commit=False)
+    collab_request.from_user = request.user
+    collab_request.task = task
+    collab_request.save()
+    return object_response(
+        REQUESTS, TaskCollabRequest.objects.filter(pk=collab_request.pk), status=201
+    )
+
+
+@api_login_required
+@require_http_methods(['DELETE'])
+def request_detail(request, request_id):
+    """Decline a request sent to the user or withdraw one they sent."""
+    collab_request = TaskCollabRequest.objects.filter(
+        Q(to_user=request.user) | Q(from_user=request.user), pk=request_id
+    ).first()
+    if collab_request is None:
+        return error('Request not found', status=404)
+    collab_request.delete()
+    return HttpResponse(status=204)
+
+
+@api_login_required
+@require_http_methods(['POST'])
+def accept_request(request, request_id):
+    """Accept a request sent to the user, adding them to the task."""
+    collab_request = TaskCollabRequest.objects.select_related('task').filter(
+        pk=request_id, to_user=request.user
+    ).first()
+    if collab_request is None:
+        return error('Request not found', status=404)
+    collab_request.task.assigned_users.add(request.user)
+    collab_request.delete()
+    return object_response(TASKS, Task.objects.filter(pk=collab_request.task_id))
+
+
+@api_login_required
+@require_GET
+@condition(etag_func=task_etag)
+def sync_changes(request):
+    """Return what changed in the user's tasks, subtasks and requests since ?since=.
+
+    Without a token everything is returned. The response holds the changed objects with
+    every field, the ids to drop under 'deleted' and the token of the next sync. A token
+    older than SYNC_TOMBSTONE_DAYS gets a 410 and the client has to sync from scratch."""
+    now = timezone.now()
+    token = request.GET.get('since')
+    try:
+        since = sync.decode_token(token) if token else None
+    except ValueError:
+        return error('Invalid sync token')
+    if since is not None and sync.token_expired(since, now):
+        return error('Sync token expired, sync from scratch', status=410)
+
+    tasks = sync.changed_tasks(request.user, since)
+    kinds = (
+        (SyncTombstone.TASK, 'tasks', TASKS, tasks),
+        (SyncTombstone.SUBTASK, 'subtasks', SUBTASKS,
+         [sync.changed_subtasks(request.user, since, tasks)]),
+        (SyncTombstone.REQUEST, 'requests', REQUESTS, [sync.changed_requests(request.user, since)]),
+    )
+    response = {}
+    current = {}
+    for kind, name, resource, querysets in kinds:
+        rows = [row for queryset in querysets for row in resource.values(queryset, resource.fields)]
+        response[name] = resource.serialize(rows, resource.fields)
+        current[kind] = {row['id'] for row in rows}
+    response['deleted'] = sync.deleted_ids(request.user, since, current)
+    response['token'] = sync.next_token(now)
+    return JsonResponse(response)
+
+
+async def stream_events(subscription):
+    """Yield the subscription's events as text/event-stream, with a comment line every
+    EVENT_HEARTBEAT seconds so proxies keep the idle connection open.
+
+    The ASGI server only asks for the next chunk once the client has taken the last,
+    so a slow client fills its bounded queue and gets a resync event instead of
+    holding the events of everyone else."""
+    try:
+        yield f'retry: {settings.EVENT_RETRY_MS}\n\n'
+        while True:
+            events = await subscription.await_events(settings.EVENT_HEARTBEAT)
+            if not events:
+                yield ': keep-alive\n\n'
+            for event in events:
+                yield format_sse(event)
+    finally:
+        subscription.close()
+
+
+def stream_events_once(subscription):
+    """Yield the events of one long-poll as text/event-stream and end the response.
+
+    Under WSGI an open stream would hold a worker thread for good, so the stream
+    closes after EVENT_LONG_POLL_TIMEOUT seconds or its first events and EventSource
+    reconnects with the Last-Event-ID it got."""
+    try:
+        yield f'retry: {settings.EVENT_RETRY_MS}\n\n'
+        for event in subscription.wait(settings.EVENT_LONG_POLL_TIMEOUT):
+            yield format_sse(event)
+    finally:
+        subscription.close()
+
+
+def release_db_connections():
+    """Close this thread's database connections that are not in a transaction."""
+    for connection in connections.all(initialized_only=True):
+        if not connection.in_atomic_block:
+            connection.close()
+
+
+@api_login_required
+@require_GET
+async def event_stream(request):
+    """Push the user's collaboration events as server-sent events.
+
+    Served as one open stream under ASGI and as a long-poll per response under WSGI.
+    A reconnecting EventSource sends Last-Event-ID and gets the events it missed."""
+    last_id = parse_event_id(
+        request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    )
+    subscription = get_broker().subscribe(request.user.pk, last_id)
+    if isinstance(request, ASGIRequest):
+        # Django keeps a thread for the sync code of each ASGI request until it ends,
+        # so an open stream must not keep that thread's database connection as well
+        await sync_to_async(release_db_connections)()
+        content = stream_events(subscription)
+    else:
+        content = stream_events_once(subscription)
+    response = StreamingHttpResponse(content, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@api_login_required
+@require_GET
+async def event_poll(request):
+    """Return the user's collaboration events after ?after=, waiting up to
+    EVENT_LONG_POLL_TIMEOUT seconds for one if there are none yet.
+
+    Returns {'events': [...], 'last_id': id to send as ?after= next time}. A resync
+    event means events were missed and the client should reload through the sync."""
+    last_id = parse_event_id(request.GET.get('after'))
+    subscription = get_broker().subscribe(request.user.pk, last_id)
+    try:
+        events = await subscription.await_events(settings.EVENT_LONG_POLL_TIMEOUT)
+    finally:
+        subscription.close()
+    return JsonResponse({'events': events, 'last_id': events[-1]['id'] if events else last_id})
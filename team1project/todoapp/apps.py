@@ -3,8 +3,19 @@ Configure todoapp
 '''
 
 from django.apps import AppConfig
+from django.conf import settings
 
 class TodoappConfig(AppConfig):
     ''' This is just the app config class '''
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'todoapp'
+
+    def ready(self):
+        ''' Connect signal receivers and warm the holiday cache when enabled '''
+        # pylint: disable=C0415,W0611
+        from . import checks, signals
+
+        if settings.HOLIDAY_CACHE_WARM:
+            from django.utils import timezone
+            from .utils import warm_holiday_cache
+            warm_holiday_cache(settings.HOLIDAY_COUNTRIES, timezone.localdate().year)
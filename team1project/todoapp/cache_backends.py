@@ -0,0 +1,138 @@
+"""Cache backends that count their hits and misses.
+
+Each process counts locally and every FLUSH_EVERY lookups adds its counts to counters
+kept in the cache itself. With a shared backend those counters add up the lookups of
+every worker, so the hit ratio reported by the cache_stats command covers the whole
+deployment and not only the process that runs it."""
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.core.cache.backends.db import DatabaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.memcached import PyMemcacheCache
+
+STATS_KEY = 'cache_stats:{alias}:{counter}'
+COUNTERS = ('hits', 'misses')
+# Lookups counted in memory before they are added to the shared counters
+FLUSH_EVERY = 100
+
+_pending = defaultdict(lambda: {'hits': 0, 'misses': 0})
+_pending_lock = threading.Lock()
+_local = threading.local()
+
+# Marks a missing key, so a stored None still counts as a hit
+_MISSING = object()
+
+
+@contextmanager
+def uncounted():
+    """Do not count the lookups made inside the block.
+
+    Used for the counters themselves and for lookups a backend makes on its own, like
+    DatabaseCache.get calling get_many."""
+    previous = getattr(_local, 'paused', False)
+    _local.paused = True
+    try:
+        yield
+    finally:
+        _local.paused = previous
+
+
+class CacheStatsMixin:
+    """Counts the hits and misses of get() and get_many().
+
+    The counters are named after the STATS_ALIAS entry of the cache settings."""
+
+    def __init__(self, location, params):
+        super().__init__(location, params)
+        self.stats_alias = params.get('STATS_ALIAS', 'default')
+
+    def get(self, key, default=None, version=None):
+        with uncounted():
+            value = super().get(key, _MISSING, version)
+        if value is _MISSING:
+            self.record(misses=1)
+            return default
+        self.record(hits=1)
+        return value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        with uncounted():
+            found = super().get_many(keys, version)
+        self.record(hits=len(found), misses=len(keys) - len(found))
+        return found
+
+    def incr(self, key, delta=1, version=None):
+        # some backends implement incr with a get, which is not a lookup of the app
+        with uncounted():
+            return super().incr(key, delta, version)
+
+    def record(self, hits=0, misses=0):
+        """Count lookups and flush them to the shared counters every FLUSH_EVERY."""
+        if getattr(_local, 'paused', False):
+            return
+        with _pending_lock:
+            pending = _pending[self.stats_alias]
+            pending['hits'] += hits
+            pending['misses'] += misses
+            if pending['hits'] + pending['misses'] < FLUSH_EVERY:
+                return
+            counts = dict(pending)
+            pending.update(hits=0, misses=0)
+        self.flush_stats(counts)
+
+    def flush_stats(self, counts=None):
+        """Add the counts (by default everything pending) to the shared counters."""
+        if counts is None:
+            with _pending_lock:
+                pending = _pending[self.stats_alias]
+                counts = dict(pending)
+                pending.update(hits=0, misses=0)
+
+        with uncounted():
+            for counter in COUNTERS:
+                if not counts[counter]:
+                    continue
+                key = STATS_KEY.format(alias=self.stats_alias, counter=counter)
+                self.add(key, 0, timeout=None)
+                try:
+                    self.incr(key, counts[counter])
+                except ValueError:
+                    # evicted between add and incr
+                    self.set(key, counts[counter], timeout=None)
+
+    def get_stats(self):
+        """Return {'hits': n, 'misses': n} for every process using this cache."""
+        self.flush_stats()
+        with uncounted():
+            return {
+                counter: self.get(STATS_KEY.format(alias=self.stats_alias, counter=counter), 0)
+                for counter in COUNTERS
+            }
+
+    def reset_stats(self):
+        """Set the counters back to zero."""
+        with _pending_lock:
+            _pending[self.stats_alias].update(hits=0, misses=0)
+        self.delete_many([
+            STATS_KEY.format(alias=self.stats_alias, counter=counter) for counter in COUNTERS
+        ])
+
+
+class CountingLocMemCache(CacheStatsMixin, LocMemCache):
+    """Per-process memory cache, used by tests and single process development."""
+
+
+class CountingFileBasedCache(CacheStatsMixin, FileBasedCache):
+    """Cache stored in a directory shared by the workers of one host."""
+
+
+class CountingDatabaseCache(CacheStatsMixin, DatabaseCache):
+    """Cache stored in a table of the default database (run createcachetable first)."""
+
+
+class CountingPyMemcacheCache(CacheStatsMixin, PyMemcacheCache):
+    """Cache on a memcached server shared by every host (needs pymemcache)."""
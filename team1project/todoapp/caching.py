@@ -0,0 +1,93 @@
+"""Cache helpers: per-user task version counters and the keys built on top of them.
+
+A user's task version changes whenever a task they can see changes, so any cached
+value whose key includes the version is invalidated without having to find it.
+Categories are shared by everyone and have one global version instead."""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.core.cache import cache
+
+TASK_VERSION_KEY = 'task_version:{user_id}'
+CATEGORY_VERSION_KEY = 'category_version'
+
+# Rendered month calendars are keyed on the task version, so they only need to expire
+# to free memory
+CALENDAR_CACHE_TIMEOUT = 60 * 60 * 24
+
+_bumps_suspended = ContextVar('task_version_bumps_suspended', default=False)
+
+
+def _new_version():
+    """Return a fresh version number that cannot collide with one handed out earlier,
+    even if the counter was evicted from the cache."""
+    return time.time_ns()
+
+
+def get_task_version(user_id):
+    """Return the current task version for a user, creating it on first use."""
+    key = TASK_VERSION_KEY.format(user_id=user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _new_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_task_version(*user_ids):
+    """Invalidate everything cached against the task version of the given users."""
+    for user_id in set(user_ids):
+        if user_id is None:
+            continue
+        key = TASK_VERSION_KEY.format(user_id=user_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _new_version(), timeout=None)
+
+
+@contextmanager
+def suspend_task_version_bumps():
+    """Make the Task signal receivers skip their per-task bumps inside the block.
+
+    Used by bulk changes, which look up the affected users once and bump them together."""
+    token = _bumps_suspended.set(True)
+    try:
+        yield
+    finally:
+        _bumps_suspended.reset(token)
+
+
+def task_version_bumps_suspended():
+    """Return True inside suspend_task_version_bumps()."""
+    return _bumps_suspended.get()
+
+
+def get_category_version():
+    """Return the current version of the category list."""
+    version = cache.get(CATEGORY_VERSION_KEY)
+    if version is None:
+        cache.add(CATEGORY_VERSION_KEY, _new_version(), timeout=None)
+        version = cache.get(CATEGORY_VERSION_KEY)
+    return version
+
+
+def bump_category_version():
+    """Invalidate everything cached against the category list."""
+    try:
+        cache.incr(CATEGORY_VERSION_KEY)
+    except ValueError:
+        cache.set(CATEGORY_VERSION_KEY, _new_version(), timeout=None)
+
+
+def calendar_cache_key(user_id, year, month, category_ids, country, today):
+    """Return the cache key of a user's rendered month calendar.
+
+    today is part of the key because the current day is highlighted in the HTML."""
+    categories = ','.join(str(pk) for pk in sorted(category_ids)) or 'all'
+    version = get_task_version(user_id)
+    return (
+        f'calendar:{user_id}:{version}:{year}-{month}:{categories}:{country}:'
+        f'{today.isoformat()}'
+    )
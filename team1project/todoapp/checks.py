@@ -0,0 +1,23 @@
+"""System checks of the deployment settings todoapp relies on."""
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Tags, Warning as CheckWarning, register
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """Warn when the default cache is local to each process outside of development.
+
+    The task versions behind the cached pages and the state of the suggestion jobs are
+    kept in it, and every worker has to see the same ones."""
+    if settings.DEBUG or getattr(settings, 'TESTING', False):
+        return []
+    if not isinstance(caches['default'], LocMemCache):
+        return []
+    return [CheckWarning(
+        'The default cache is local to each process.',
+        hint="Workers will not see each other's task versions and suggestion jobs. "
+             "Set CACHE_BACKEND to 'database', 'file' or 'memcached'.",
+        id='todoapp.W001',
+    )]
@@ -0,0 +1,210 @@
+"""Live collaboration events for the event stream and long-poll endpoints.
+
+Signal receivers publish an event to the users it concerns once the transaction
+commits. The broker fans it out to the open subscriptions of each user and keeps the
+last EVENT_HISTORY_SIZE events of every user, so a long-poll or a reconnecting
+EventSource picks up after the last event id it saw.
+
+Publishing never blocks. Every subscription has a queue bounded by EVENT_QUEUE_SIZE;
+a consumer that falls that far behind loses its queue and gets a resync event in its
+place, after which the client reloads its state through the delta sync.
+
+LocalBroker keeps all of this in the process, which serves a single worker and local
+development. EVENT_BROKER picks the broker from EVENT_BROKERS, so a broker shared by
+several workers can be plugged in with the same interface."""
+import asyncio
+import itertools
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+RESYNC = 'resync'
+
+
+class Subscription:
+    """The events of one user for one open connection.
+
+    Filled by the broker from any thread and drained by a single consumer, either a
+    thread calling wait() or a coroutine awaiting await_events()."""
+
+    def __init__(self, broker, user_id, maxsize):
+        self.broker = broker
+        self.user_id = user_id
+        self.maxsize = maxsize
+        self.events = deque()
+        self.resync_id = None
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._loop = None
+        self._async_ready = None
+
+    def put(self, event):
+        """Queue an event, replacing the queue with a resync marker when it is full."""
+        with self._lock:
+            if len(self.events) >= self.maxsize:
+                self.events.clear()
+                self.resync_id = event['id']
+            else:
+                self.events.append(event)
+        self._wake()
+
+    def mark_resync(self, event_id):
+        """Tell the consumer that events up to event_id were missed."""
+        with self._lock:
+            self.events.clear()
+            self.resync_id = event_id
+        self._wake()
+
+    def _wake(self):
+        self._ready.set()
+        if self._loop is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._async_ready.set)
+            except RuntimeError:
+                # the consumer's loop is gone, it no longer waits
+                pass
+
+    def drain(self):
+        """Return the queued events, led by a resync event if any were dropped."""
+        with self._lock:
+            events = list(self.events)
+            self.events.clear()
+            if self.resync_id is not None:
+                events.insert(0, {'id': self.resync_id, 'type': RESYNC, 'data': {}})
+                self.resync_id = None
+        return events
+
+    def wait(self, timeout):
+        """Block the thread until there are events or timeout seconds have passed, and
+        return the events."""
+        self._ready.clear()
+        events = self.drain()
+        if not events and self._ready.wait(timeout):
+            events = self.drain()
+        return events
+
+    async def await_events(self, timeout):
+        """Wait without blocking the event loop until there are events or timeout
+        seconds have passed, and return the events."""
+        if self._loop is None:
+            self._async_ready = asyncio.Event()
+            self._loop = asyncio.get_running_loop()
+        self._async_ready.clear()
+        events = self.drain()
+        if not events:
+            try:
+                await asyncio.wait_for(self._async_ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+            events = self.drain()
+        return events
+
+    def close(self):
+        """Stop receiving events."""
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker:
+    """In-process pub/sub of per-user events.
+
+    Event ids start from the clock, so ids handed out after a restart are larger than
+    any a client kept from before it, and a client that missed events is told so."""
+
+    def __init__(self, history_size, queue_size):
+        self.history_size = history_size
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._first_id = time.time_ns() // 1000
+        self._ids = itertools.count(self._first_id)
+        self._last_id = self._first_id - 1
+        self._subscriptions = defaultdict(set)
+        self._history = defaultdict(lambda: deque(maxlen=history_size))
+        # id of the newest event each user's history has already dropped
+        self._dropped = {}
+
+    def publish(self, user_ids, event_type, data):
+        """Send an event to the given users and return it."""
+        with self._lock:
+            event = {'id': next(self._ids), 'type': event_type, 'data': data}
+            self._last_id = event['id']
+            subscriptions = []
+            for user_id in set(user_ids):
+                history = self._history[user_id]
+                if len(history) == self.history_size:
+                    self._dropped[user_id] = history[0]['id']
+                history.append(event)
+                subscriptions.extend(self._subscriptions.get(user_id, ()))
+        for subscription in subscriptions:
+            subscription.put(event)
+        return event
+
+    def subscribe(self, user_id, last_id=None):
+        """Return a subscription to the user's events, already holding the events after
+        last_id, or a resync event if some of them are no longer kept."""
+        subscription = Subscription(self, user_id, self.queue_size)
+        with self._lock:
+            self._subscriptions[user_id].add(subscription)
+            if last_id is None:
+                return subscription
+            missed = last_id < self._first_id - 1 or last_id < self._dropped.get(user_id, 0)
+            if missed:
+                subscription.mark_resync(self._last_id)
+            else:
+                for event in self._history.get(user_id, ()):
+                    if event['id'] > last_id:
+                        subscription.put(event)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Remove a subscription, its connection has closed."""
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.user_id]
+
+    def connection_count(self):
+        """Return the number of open subscriptions."""
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+
+EVENT_BROKERS = {
+    'local': LocalBroker,
+}
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    """Return the broker of this process, configured by EVENT_BROKER."""
+    return EVENT_BROKERS[settings.EVENT_BROKER](
+        history_size=settings.EVENT_HISTORY_SIZE, queue_size=settings.EVENT_QUEUE_SIZE
+    )
+
+
+def publish(user_ids, event_type, data):
+    """Publish an event to the given users once the current transaction commits."""
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if user_ids:
+        transaction.on_commit(lambda: get_broker().publish(user_ids, event_type, data))
+
+
+def parse_event_id(value):
+    """Return the event id a client sent, or None if it is missing or malformed."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def format_sse(event):
+    """Return an event in the text/event-stream format."""
+    data = json.dumps(event['data'], cls=DjangoJSONEncoder)
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {data}\n\n"
@@ -2,14 +2,18 @@
 This module contains forms for user creation, task creation,
 requests, and filtering tasks
 '''
+import uuid
 
 from django import forms
+from django.core import signing
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib.auth import get_user_model
 
+from django_select2.cache import cache as select2_cache
 from django_select2.forms import ModelSelect2Widget
 
-from .models import Task, Category, TaskCollabRequest
+from .models import Task, Category, SubTask, TaskCollabRequest
+from .user_search import search_users
 
 User = get_user_model()
 
@@ -117,6 +121,111 @@ class TaskForm(forms.ModelForm):
                 self.fields[field_name].widget.attrs.update({'class': 'form-control'})
 
 
+class SubTaskForm(forms.ModelForm):
+    '''
+    Form for users to add or edit a subtask of a task
+
+    Attributes:
+        task: the task the subtask belongs to, whose creator and collaborators
+            are the only users the subtask can be assigned to
+    '''
+
+    def __init__(self, *args, **kwargs):
+        self.task = kwargs.pop('task')
+        super().__init__(*args, **kwargs)
+        self.fields['assigned_users'].required = False
+        self.fields['assigned_users'].queryset = User.objects.filter(
+            pk__in=Task.objects.filter(pk=self.task.pk).user_ids()
+        )
+
+    def save(self, commit=True):
+        self.instance.task = self.task
+        return super().save(commit)
+
+    class Meta:
+        '''
+        House metadata for subtask creation
+
+        Model: SubTask
+        fields:
+            name: Name of subtask
+            is_completed: Whether the subtask is done
+            assigned_users: Users of the task working on the subtask
+        '''
+
+        model = SubTask
+        fields = ['name', 'is_completed', 'assigned_users']
+
+
+class CategoryForm(forms.ModelForm):
+    '''
+    Form for adding a category that tasks can be grouped into
+    '''
+
+    class Meta:
+        '''
+        House metadata for category creation
+
+        Model: Category
+        fields:
+            name: Name of category
+        '''
+
+        model = Category
+        fields = ['name']
+
+
+class UserSearchWidget(ModelSelect2Widget):
+    '''
+    Select2 user picker that searches usernames by prefix through the search index
+
+    Attributes:
+        task_id: the task being shared, used to cache results per task
+        exclude_ids: users that cannot be picked, worked out once when the form is built
+    '''
+
+    def __init__(self, *args, **kwargs):
+        self.task_id = kwargs.pop('task_id', None)
+        self.exclude_ids = tuple(kwargs.pop('exclude_ids', ()))
+        kwargs.setdefault('data_view', 'user_search')
+        super().__init__(*args, **kwargs)
+
+    def __deepcopy__(self, memo):
+        # Each form gets its own cache entry, otherwise forms for different tasks
+        # would overwrite each other's excluded users
+        obj = super().__deepcopy__(memo)
+        obj.uuid = str(uuid.uuid4())
+        obj.field_id = signing.dumps(obj.uuid)
+        return obj
+
+    def set_to_cache(self):
+        '''
+        Store the widget for the search view, including the task and excluded users
+        '''
+        queryset = self.get_queryset()
+        select2_cache.set(
+            self._get_cache_key(),
+            {
+                "queryset": [queryset.none(), queryset.query],
+                "cls": self.__class__,
+                "search_fields": tuple(self.search_fields),
+                "max_results": int(self.max_results),
+                "url": str(self.get_url()),
+                "dependent_fields": dict(self.dependent_fields),
+                "task_id": self.task_id,
+                "exclude_ids": self.exclude_ids,
+            },
+        )
+
+    def filter_queryset(self, request, term, queryset=None, **dependent_fields):
+        '''
+        Return the users whose username starts with the term
+        '''
+        if queryset is None:
+            queryset = self.get_queryset()
+        return search_users(term, self.exclude_ids, queryset)
+
+
 class TaskCollabForm(forms.ModelForm):
     '''
     Form for users to search users to share a task with
@@ -134,23 +243,24 @@ class TaskCollabForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
 
         # Start by excluding the current user and the task creator
-        exclude_users = [self.user.id, self.task.creator.id]
+        exclude_users = {self.user.id, self.task.creator_id}
 
         # Prevent current user from sending requests to users shared with the task
-        assigned_users = list(self.task.assigned_users.values_list('id', flat=True))
-        exclude_users.extend(assigned_users)
-
-        # Exclude users who already have the task, shared, creator, or self
-        user_queryset = User.objects.exclude(id__in=exclude_users)
+        exclude_users.update(self.task.assigned_users.values_list('id', flat=True))
 
         # Prevent a request from being sent to people with existing request
-        if self.task:
-            existing_requests = TaskCollabRequest.objects.filter(
-                task=self.task,
-            ).values_list('to_user', flat=True)
-            user_queryset = user_queryset.exclude(id__in=existing_requests)
+        exclude_users.update(TaskCollabRequest.objects.filter(
+            task=self.task,
+        ).values_list('to_user', flat=True))
+
+        # Exclude users who already have the task, shared, creator, or self. The ids
+        # are worked out once here instead of as subqueries on every keystroke
+        exclude_users = tuple(sorted(exclude_users))
+        self.fields['to_user'].queryset = User.objects.exclude(id__in=exclude_users)
 
-        self.fields['to_user'].queryset = user_queryset
+        widget = self.fields['to_user'].widget
+        widget.task_id = self.task.id
+        widget.exclude_ids = exclude_users
 
     class Meta:
         '''
@@ -163,7 +273,9 @@ class TaskCollabForm(forms.ModelForm):
 
         model = TaskCollabRequest
         fields = ['to_user']
-        widgets = {'to_user': ModelSelect2Widget(model=User, search_fields=['username__icontains'])}
+        widgets = {
+            'to_user': UserSearchWidget(model=User, search_fields=['username__istartswith'])
+        }
 
 
 
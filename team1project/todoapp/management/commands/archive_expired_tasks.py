@@ -0,0 +1,44 @@
+"""Module with a command that archives the completed tasks whose due date has passed,
+which Task.save only does when a task happens to be saved again."""
+# disabling django specific errors such as class has no "object" member
+# pylint: disable=E1101, W0613
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from todoapp.models import Task
+
+
+def archive_expired_tasks(chunk_size=1000, now=None, report=None):
+    """Archive every expired task and return (archived, elapsed seconds).
+
+    report is called with the running total after each chunk."""
+    start = time.perf_counter()
+    archived = 0
+    for count in Task.objects.archive_expired(now or timezone.now(), chunk_size=chunk_size):
+        archived += count
+        if report:
+            report(archived)
+    return archived, time.perf_counter() - start
+
+
+class Command(BaseCommand):
+    """Archive all completed, past-due tasks not excluded from auto-archiving, in chunks
+    of one UPDATE each, so the unarchived task lists only hold live tasks."""
+    help = 'Archive completed tasks whose due date has passed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Tasks archived per UPDATE')
+
+    def handle(self, *args, **options):
+        def report(archived):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'  {archived} archived')
+
+        archived, elapsed = archive_expired_tasks(options['chunk_size'], report=report)
+        rate = archived / elapsed if elapsed else 0
+        self.stdout.write(
+            f'Archived {archived} expired tasks in {elapsed:.2f}s ({rate:.1f} rows/s).'
+        )
@@ -0,0 +1,166 @@
+"""Module with a command that loads the task and calendar pages with concurrent requests
+through Django's WSGI handler on a pool of worker threads and through its ASGI handler on
+one event loop, and reports the throughput of each."""
+# disabling django specific errors such as class has no "object" member
+# pylint: disable=E1101, W0613
+import asyncio
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from todoapp import quotes
+from todoapp.models import Task
+
+User = get_user_model()
+
+BENCH_USERNAME = 'bench_asgi_user'
+PAGES = ['task_view', 'home']
+
+
+class SlowQuoteProvider(quotes.FixtureQuoteProvider):
+    """Fixture quotes behind a simulated upstream latency."""
+    latency = 0.0
+
+    def fetch(self):
+        time.sleep(self.latency)
+        return super().fetch()
+
+    async def afetch(self):
+        await asyncio.sleep(self.latency)
+        return super().fetch()
+
+
+class Command(BaseCommand):
+    """Seed a user with tasks and time the same concurrent page loads over WSGI, served
+    by a fixed number of threads like a threaded WSGI worker, and over ASGI, one
+    coroutine per request.
+
+    The seeded rows are committed, so the WSGI threads can read them on their own
+    connections, and deleted at the end."""
+    help = 'Compare the throughput of the task and calendar pages under WSGI and ASGI'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Requests per page and server')
+        parser.add_argument('--concurrency', type=int, default=20,
+                            help='Requests the clients keep in flight at once')
+        parser.add_argument('--wsgi-threads', type=int, default=4,
+                            help='Threads serving the WSGI requests')
+        parser.add_argument('--tasks', type=int, default=50,
+                            help='Tasks to seed for the benchmark user')
+        parser.add_argument('--quote-latency', type=float, default=0.2,
+                            help='Seconds the simulated quote upstream takes to answer')
+        parser.add_argument('--cold-quote', action='store_true',
+                            help='Drop the cached quote before each request, so every '
+                                 'calendar load waits for the upstream')
+
+    def handle(self, *args, **options):
+        user = self.seed(options['tasks'])
+        SlowQuoteProvider.latency = options['quote_latency']
+        quotes.QUOTE_PROVIDERS['benchmark'] = SlowQuoteProvider
+
+        client = Client()
+        client.force_login(user)
+        self.cookies = client.cookies
+        self.cold_quote = options['cold_quote']
+        try:
+            # the test clients send requests to the 'testserver' host
+            with override_settings(QUOTE_PROVIDER='benchmark',
+                                   ALLOWED_HOSTS=['testserver', *settings.ALLOWED_HOSTS]):
+                for page in PAGES:
+                    url = reverse(page)
+                    self.stdout.write(self.style.MIGRATE_HEADING(f'== {url} =='))
+                    for label, run in (('wsgi', self.run_wsgi), ('asgi', self.run_asgi)):
+                        cache.clear()
+                        self.report(label, url, options, run)
+        finally:
+            del quotes.QUOTE_PROVIDERS['benchmark']
+            user.delete()
+
+    def seed(self, task_count):
+        """Create the benchmark user with task_count tasks due this month."""
+        User.objects.filter(username=BENCH_USERNAME).delete()
+        user = User.objects.create_user(username=BENCH_USERNAME, password='!')
+        now = timezone.now()
+        Task.objects.bulk_create(
+            Task(name=f'Task {i}', creator=user, due_date=now + timedelta(minutes=i))
+            for i in range(task_count)
+        )
+        return user
+
+    def report(self, label, url, options, run):
+        """Run the requests and print the throughput and latency percentiles."""
+        start = time.perf_counter()
+        latencies, statuses = run(url, options)
+        elapsed = time.perf_counter() - start
+
+        latencies.sort()
+        p95 = latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)]
+        errors = sum(status != 200 for status in statuses)
+        self.stdout.write(
+            f'{label}: {len(latencies) / elapsed:.1f} req/s, '
+            f'median {statistics.median(latencies) * 1000:.1f} ms, '
+            f'p95 {p95 * 1000:.1f} ms, {errors} non-200'
+        )
+
+    def drop_quote(self):
+        """Forget the cached quote when every request should fetch it."""
+        if self.cold_quote:
+            cache.delete_many([quotes.QUOTE_KEY, quotes.STALE_QUOTE_KEY])
+
+    def run_wsgi(self, url, options):
+        """Queue the requests on the WSGI threads, at most concurrency at a time.
+
+        Latencies are counted from when a request is sent, so they include the time it
+        waits for a free thread."""
+        local = threading.local()
+        in_flight = threading.BoundedSemaphore(options['concurrency'])
+
+        def send(sent):
+            try:
+                if not hasattr(local, 'client'):
+                    local.client = Client()
+                    local.client.cookies = self.cookies
+                self.drop_quote()
+                response = local.client.get(url)
+                return time.perf_counter() - sent, response.status_code
+            finally:
+                in_flight.release()
+
+        futures = []
+        with ThreadPoolExecutor(max_workers=options['wsgi_threads']) as pool:
+            for _ in range(options['requests']):
+                in_flight.acquire()
+                futures.append(pool.submit(send, time.perf_counter()))
+        results = [future.result() for future in futures]
+        return [latency for latency, _ in results], [status for _, status in results]
+
+    def run_asgi(self, url, options):
+        """Send the requests as coroutines on one event loop through the ASGI handler."""
+        async def send(client, in_flight):
+            async with in_flight:
+                self.drop_quote()
+                start = time.perf_counter()
+                response = await client.get(url)
+                return time.perf_counter() - start, response.status_code
+
+        async def main():
+            client = AsyncClient()
+            client.cookies = self.cookies
+            in_flight = asyncio.Semaphore(options['concurrency'])
+            return await asyncio.gather(
+                *(send(client, in_flight) for _ in range(options['requests']))
+            )
+
+        results = asyncio.run(main())
+        return [latency for latency, _ in results], [status for _, status in results]
@@ -0,0 +1,176 @@
+"""Module with a command that holds many event streams open on one ASGI worker and
+measures what each connection costs and how fast an event reaches all of them."""
+# disabling django specific errors such as class has no "object" member
+# pylint: disable=E1101, W0613
+import asyncio
+import statistics
+import threading
+import time
+import tracemalloc
+from http.cookies import SimpleCookie
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from todoapp.events import get_broker
+
+User = get_user_model()
+
+BENCH_USERNAME = 'bench_events_user_{}'
+
+
+class StreamConnection:
+    """One client of the ASGI application, reading a text/event-stream."""
+
+    def __init__(self, app, path, cookie):
+        self.app = app
+        self.scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode(),
+            'query_string': b'',
+            'headers': [(b'host', b'testserver'), (b'cookie', cookie.encode())],
+            'client': ('127.0.0.1', 0),
+            'server': ('testserver', 80),
+        }
+        self.incoming = asyncio.Queue()
+        self.incoming.put_nowait({'type': 'http.request', 'body': b'', 'more_body': False})
+        self.status = None
+        self.opened = asyncio.Event()
+        self.received = {}
+        self.task = None
+
+    async def receive(self):
+        return await self.incoming.get()
+
+    async def send(self, message):
+        if message['type'] == 'http.response.start':
+            self.status = message['status']
+        elif message.get('body'):
+            body = message['body'].decode()
+            if body.startswith('retry:'):
+                self.opened.set()
+            elif body.startswith('id:'):
+                event_id = int(body.split('\n', 1)[0][4:])
+                self.received[event_id] = time.perf_counter()
+
+    def open(self):
+        """Start the request, it runs until close()."""
+        self.task = asyncio.create_task(self.app(self.scope, self.receive, self.send))
+
+    async def close(self):
+        """Disconnect like a client closing the socket."""
+        self.incoming.put_nowait({'type': 'http.disconnect'})
+        await self.task
+
+
+class Command(BaseCommand):
+    """Open --connections event streams for --users users on one event loop, then
+    publish --events events and time their delivery to every stream of the user.
+
+    Under WSGI every open stream would keep a worker thread busy. Here the streams wait
+    on the event loop, although Django still parks an idle thread per open ASGI request
+    for its sync middleware, which the report counts. The seeded users are committed
+    and deleted at the end."""
+    help = 'Measure concurrent event stream connections per ASGI worker'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=1000,
+                            help='Event streams to hold open')
+        parser.add_argument('--users', type=int, default=100,
+                            help='Users the streams are spread over')
+        parser.add_argument('--events', type=int, default=50,
+                            help='Events to publish, each to one user')
+        parser.add_argument('--trace-memory', action='store_true',
+                            help='Measure the memory held per connection with tracemalloc, '
+                                 'which slows opening the streams down')
+
+    def handle(self, *args, **options):
+        users = self.seed(options['users'])
+        get_broker.cache_clear()
+        try:
+            # the streams are sent to the 'testserver' host
+            with override_settings(ALLOWED_HOSTS=['testserver', *settings.ALLOWED_HOSTS]):
+                asyncio.run(self.run(users, options))
+        finally:
+            User.objects.filter(pk__in=[user.pk for user, _ in users]).delete()
+            get_broker.cache_clear()
+
+    def seed(self, count):
+        """Create count users and return each with the session cookie of a login."""
+        User.objects.filter(username__startswith=BENCH_USERNAME.format('')).delete()
+        users = []
+        for i in range(count):
+            user = User.objects.create_user(username=BENCH_USERNAME.format(i), password='!')
+            client = Client()
+            client.force_login(user)
+            cookie = SimpleCookie(client.cookies).output(header='', sep=';').strip()
+            users.append((user, cookie))
+        return users
+
+    async def run(self, users, options):
+        """Open the streams, publish the events, report and disconnect."""
+        app = get_asgi_application()
+        path = reverse('api_event_stream')
+        broker = get_broker()
+        connections = [
+            (users[i % len(users)][0].pk, StreamConnection(app, path, users[i % len(users)][1]))
+            for i in range(options['connections'])
+        ]
+
+        if options['trace_memory']:
+            tracemalloc.start()
+        before, _ = tracemalloc.get_traced_memory()
+        start = time.perf_counter()
+        for _, connection in connections:
+            connection.open()
+        await asyncio.gather(*(connection.opened.wait() for _, connection in connections))
+        opened = time.perf_counter() - start
+        held, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        errors = sum(connection.status != 200 for _, connection in connections)
+        # Django parks one idle thread per open ASGI request for its sync code
+        self.stdout.write(
+            f'Opened {len(connections)} streams in {opened:.2f}s '
+            f'({len(connections) / opened:.0f}/s), {errors} non-200, '
+            f'{broker.connection_count()} subscriptions, {threading.active_count()} threads'
+        )
+        if options['trace_memory']:
+            self.stdout.write(
+                f'Memory held by open streams: {(held - before) / 1024 / 1024:.1f} MiB, '
+                f'{(held - before) / len(connections) / 1024:.1f} KiB per connection'
+            )
+
+        latencies = await self.publish(broker, users, connections, options['events'])
+        latencies.sort()
+        p99 = latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)]
+        self.stdout.write(
+            f'Delivered {options["events"]} events to {len(latencies)} streams: '
+            f'median {statistics.median(latencies) * 1000:.2f} ms, p99 {p99 * 1000:.2f} ms'
+        )
+
+        await asyncio.gather(*(connection.close() for _, connection in connections))
+        self.stdout.write(f'Closed all streams, {broker.connection_count()} subscriptions left')
+
+    async def publish(self, broker, users, connections, count):
+        """Publish count events from a thread, like a request thread committing a change,
+        and return the latency of every delivery."""
+        latencies = []
+        for n in range(count):
+            user_id = users[n % len(users)][0].pk
+            streams = [connection for pk, connection in connections if pk == user_id]
+            sent = time.perf_counter()
+            event = await asyncio.to_thread(broker.publish, [user_id], 'progress', {'n': n})
+            while not all(event['id'] in connection.received for connection in streams):
+                await asyncio.sleep(0)
+            latencies.extend(connection.received[event['id']] - sent for connection in streams)
+        return latencies
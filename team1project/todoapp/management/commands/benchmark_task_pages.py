@@ -0,0 +1,104 @@
+"""Module with a command that seeds a growing archive and compares the latency of the
+archive page loaded whole, paginated with OFFSET and paginated with a keyset cursor."""
+# disabling django specific errors such as class has no "object" member
+# pylint: disable=E1101, W0613
+import statistics
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from django.http import QueryDict
+from django.utils import timezone
+
+from todoapp.models import Task
+from todoapp.pagination import CURSOR_PARAM, encode_cursor, keyset_page
+
+User = get_user_model()
+
+
+def load_page(tasks):
+    """Prefetch what the archive template shows for the tasks, like the view does."""
+    tasks = list(tasks)
+    prefetch_related_objects(tasks, 'categories', 'assigned_users')
+    return tasks
+
+
+class Command(BaseCommand):
+    """Seed archived tasks for one user in steps and time a page of the archive at each
+    size: the whole list the page used to render, the last page by OFFSET and the first
+    and last pages by keyset cursor.
+
+    Everything runs inside a transaction that is rolled back."""
+    help = 'Benchmark the archive list pagination on a growing number of archived tasks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000],
+                            help='Archive sizes to time (default 10,000 and 100,000)')
+        parser.add_argument('--page-size', type=int, default=25,
+                            help='Tasks per page')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Times to load each page when timing it')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Rows per bulk insert while seeding')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user = User.objects.create_user(username='bench_archive_user', password='!')
+            seeded = 0
+            for size in sorted(options['sizes']):
+                self.seed(user, seeded, size, options['batch_size'])
+                seeded = size
+                self.report(user, size, options['page_size'], options['repeat'])
+            transaction.set_rollback(True)
+
+    def seed(self, user, start, stop, batch_size):
+        """Bulk insert archived tasks numbered start to stop, one hour apart."""
+        begin = time.perf_counter()
+        first_due = timezone.now() - timedelta(days=20_000)
+        for offset in range(start, stop, batch_size):
+            Task.objects.bulk_create(
+                Task(name=f'Archived {i}', creator=user, progress=100, is_completed=True,
+                     is_archived=True, due_date=first_due + timedelta(hours=i))
+                for i in range(offset, min(offset + batch_size, stop))
+            )
+        elapsed = time.perf_counter() - begin
+        self.stdout.write(f'Seeded {stop - start} archived tasks in {elapsed:.1f}s')
+
+    def report(self, user, size, page_size, repeat):
+        """Print the median timing of each way to load an archive page."""
+        # the single query the archive page used to load in full
+        archived = Task.objects.select_related('creator').visible_to(user).filter(
+            is_archived=True
+        )
+        ordered = archived.order_by('due_date', 'id')
+        parts = Task.objects.select_related('creator').list_parts(user, 'archived')
+        last_offset = max(size - page_size, 0)
+
+        params = QueryDict(mutable=True)
+        params['page_size'] = page_size
+        last_params = params.copy()
+        before_last = ordered[last_offset - 1] if last_offset else None
+        if before_last is not None:
+            last_params[CURSOR_PARAM.format(name='archived')] = encode_cursor(
+                before_last.due_date, before_last.pk
+            )
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f'== {size} archived tasks =='))
+        for label, run in (
+            ('whole list', lambda: load_page(archived.all())),
+            ('offset last page', lambda: load_page(ordered[last_offset:last_offset + page_size])),
+            ('keyset first page', lambda: load_page(keyset_page(parts, 'archived', params))),
+            ('keyset last page', lambda: load_page(keyset_page(parts, 'archived', last_params))),
+        ):
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                rows = len(list(run()))
+                timings.append((time.perf_counter() - start) * 1000)
+            self.stdout.write(
+                f'{label}: {rows} rows, median {statistics.median(timings):.3f} ms, '
+                f'min {min(timings):.3f} ms'
+            )
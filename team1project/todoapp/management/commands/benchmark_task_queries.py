@@ -0,0 +1,144 @@
+"""Module with a command that seeds a large Task table and reports EXPLAIN plans and
+timings for the hot task queries, first without and then with the Task indexes."""
+# disabling django specific errors such as class has no "object" member
+# pylint: disable=E1101, W0613
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from todoapp.models import Task
+from todoapp.utils import month_range
+
+User = get_user_model()
+
+BENCH_USER_PREFIX = 'bench_user_'
+
+
+def hot_queries(user, now):
+    """Return (label, queryset) pairs for the queries the views and commands run most."""
+    local_now = timezone.localtime(now)
+    month_start, month_end = month_range(local_now.year, local_now.month)
+    return [
+        ('owned tasks', Task.objects.filter(creator=user, is_archived=False)),
+        ('archived tasks', Task.objects.visible_to(user).filter(is_archived=True)),
+        ('calendar month', Task.objects.visible_to(user).filter(
+            due_date__gte=month_start,
+            due_date__lt=month_end,
+        )),
+        ('push reminders', Task.objects.in_notification_window(now)),
+        ('email reminders', Task.objects.filter(
+            notifications_enabled=True,
+            is_completed=False,
+            notification_type='email',
+            due_date__gte=now,
+            due_date__lte=now + timedelta(hours=24),
+        )),
+    ]
+
+
+class Command(BaseCommand):
+    """Seed tasks and benchmark the hot task queries before and after the Task indexes.
+
+    Everything runs inside a transaction that is rolled back, so the seeded rows and the
+    dropped indexes never reach the database."""
+    help = 'Seed tasks and report EXPLAIN plans and timings for the hot Task queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tasks', type=int, default=1_000_000,
+                            help='Number of tasks to seed (default 1,000,000)')
+        parser.add_argument('--users', type=int, default=1000,
+                            help='Number of users to spread the tasks over')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Times to run each query when timing it')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Rows per bulk insert while seeding')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            users = self.seed(options['tasks'], options['users'], options['batch_size'])
+            user = users[0]
+            now = timezone.now()
+
+            self.drop_indexes()
+            self.report('before', hot_queries(user, now), options['repeat'])
+            self.create_indexes()
+            self.report('after', hot_queries(user, now), options['repeat'])
+
+            transaction.set_rollback(True)
+
+    def seed(self, task_count, user_count, batch_size):
+        """Bulk insert benchmark users and tasks and return the users."""
+        start = time.perf_counter()
+        User.objects.bulk_create(
+            User(username=f'{BENCH_USER_PREFIX}{i}', password='!') for i in range(user_count)
+        )
+        users = list(User.objects.filter(username__startswith=BENCH_USER_PREFIX).order_by('id'))
+
+        now = timezone.now()
+        rng = random.Random(4300)
+        batch = []
+        for i in range(task_count):
+            progress = rng.choice((0, 25, 50, 75, 100))
+            due_date = now + timedelta(minutes=rng.randint(-525_600, 525_600))
+            batch.append(Task(
+                name=f'Task {i}',
+                description='benchmark',
+                creator=users[i % len(users)],
+                due_date=due_date,
+                progress=progress,
+                is_completed=progress == 100,
+                is_archived=progress == 100 and due_date < now,
+                notifications_enabled=rng.random() < 0.2,
+                notification_time=rng.choice((10, 60, 1440)),
+                notification_type=rng.choice(('push', 'email')),
+            ))
+            if len(batch) >= batch_size:
+                Task.objects.bulk_create(batch)
+                batch = []
+        Task.objects.bulk_create(batch)
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f'Seeded {task_count} tasks for {len(users)} users in {elapsed:.1f}s')
+        return users
+
+    def drop_indexes(self):
+        """Remove the Task Meta indexes so the 'before' run sees the unindexed table."""
+        # The SQL is run directly because the SQLite schema editor refuses to open
+        # inside the surrounding transaction
+        schema_editor = connection.schema_editor()
+        with connection.cursor() as cursor:
+            for index in Task._meta.indexes:
+                cursor.execute(str(index.remove_sql(Task, schema_editor)))
+
+    def create_indexes(self):
+        """Recreate the Task Meta indexes."""
+        start = time.perf_counter()
+        schema_editor = connection.schema_editor()
+        with connection.cursor() as cursor:
+            for index in Task._meta.indexes:
+                cursor.execute(str(index.create_sql(Task, schema_editor)))
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f'Built {len(Task._meta.indexes)} indexes in {elapsed:.1f}s')
+
+    def report(self, phase, queries, repeat):
+        """Print the plan and the median/min runtime of every query."""
+        self.stdout.write(self.style.MIGRATE_HEADING(f'== {phase} indexes =='))
+        for label, queryset in queries:
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                rows = len(list(queryset.all()))
+                timings.append((time.perf_counter() - start) * 1000)
+
+            self.stdout.write(
+                f'{label}: {rows} rows, median {statistics.median(timings):.2f} ms, '
+                f'min {min(timings):.2f} ms'
+            )
+            for line in queryset.explain().splitlines():
+                self.stdout.write(f'    {line}')
@@ -0,0 +1,92 @@
+"""Module with a command that times the task suggestion engines against the same
+seeded task history."""
+# disabling django specific errors such as class has no "object" member
+# pylint: disable=E1101, W0613, W0718
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from todoapp.models import Category, Task
+from todoapp.suggestions import SUGGESTION_ENGINES, recent_task_snapshots
+
+User = get_user_model()
+
+BENCH_USERNAME = 'bench_suggestions'
+
+# (name, category, days between occurrences) of the recurring tasks that are seeded
+RECURRING_TASKS = [
+    ('Gym session', 'Health', 2),
+    ('Weekly report', 'Work', 7),
+    ('Pay rent', 'Finance', 30),
+]
+
+
+class Command(BaseCommand):
+    """Seed one user's task history and report how long each engine takes to suggest.
+
+    The seeded rows are rolled back at the end. The remote engine uses the configured
+    client, set TASK_SUGGESTION_CLIENT=local to run it without an API key."""
+    help = 'Benchmark the task suggestion engines on a seeded task history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tasks', type=int, default=100,
+                            help='Number of tasks to seed for the benchmark user')
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='Times to ask each engine for a suggestion')
+        parser.add_argument('--engine', action='append', choices=sorted(SUGGESTION_ENGINES),
+                            help='Engine to time, may be repeated (default: all)')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user = self.seed(options['tasks'])
+            engines = options['engine'] or sorted(SUGGESTION_ENGINES)
+            for name in engines:
+                self.report(SUGGESTION_ENGINES[name](), user, options['repeat'])
+            transaction.set_rollback(True)
+
+    def seed(self, task_count):
+        """Create the benchmark user with recurring and one-off tasks and return it."""
+        user = User.objects.create(username=BENCH_USERNAME, password='!')
+        categories = {
+            name: Category.objects.get_or_create(name=name)[0]
+            for name in {category for _, category, _ in RECURRING_TASKS} | {'Personal'}
+        }
+
+        now = timezone.now()
+        rng = random.Random(4300)
+        for i in range(task_count):
+            if i % 2 == 0:
+                name, category, days = RECURRING_TASKS[i // 2 % len(RECURRING_TASKS)]
+                due_date = now - timedelta(days=days * (task_count - i) // 2)
+            else:
+                name, category = f'Errand {i}', 'Personal'
+                due_date = now + timedelta(hours=rng.randint(-2000, 2000))
+            task = Task.objects.create(
+                name=name, description='benchmark', creator=user, due_date=due_date
+            )
+            task.categories.add(categories[category])
+        return user
+
+    def report(self, engine, user, repeat):
+        """Print the median and minimum time of the engine's suggestions."""
+        tasks = recent_task_snapshots(user, engine.history)
+        timings = []
+        try:
+            for _ in range(repeat):
+                start = time.perf_counter()
+                suggestion = engine.suggest(tasks)
+                timings.append((time.perf_counter() - start) * 1_000_000)
+        except Exception as e:
+            self.stderr.write(f'{engine.name}: unavailable ({e})')
+            return
+
+        self.stdout.write(
+            f'{engine.name}: {len(tasks)} tasks, median {statistics.median(timings):.0f} us, '
+            f'min {min(timings):.0f} us -> {suggestion["name"]}'
+        )
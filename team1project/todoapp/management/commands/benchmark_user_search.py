@@ -0,0 +1,109 @@
+"""Module with a command that seeds a large user table and compares the latency of the
+share task autocomplete before and after the username search index."""
+# disabling django specific errors such as class has no "object" member
+# pylint: disable=E1101, W0613
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+from django.db import transaction
+from django.utils import timezone
+
+from todoapp.models import Task, TaskCollabRequest
+from todoapp.user_search import USER_SEARCH_TIMEOUT, index_users, search_users, \
+    user_search_cache_key
+
+User = get_user_model()
+
+BENCH_USER_PREFIXES = ['alex', 'sam', 'jordan', 'taylor', 'morgan', 'casey', 'riley', 'jamie']
+TERMS = ['a', 'jo', 'morgan12', 'zz']
+PAGE_SIZE = 25
+
+
+def autocomplete_page(queryset):
+    """Evaluate the first page the autocomplete returns, with its count like select2."""
+    page = Paginator(queryset, PAGE_SIZE).page(1)
+    return [(user.pk, str(user)) for user in page.object_list], page.has_next()
+
+
+class Command(BaseCommand):
+    """Seed users and time one autocomplete page for a few search terms with the old
+    LIKE '%term%' query, the prefix search on the index and a cached page.
+
+    Everything runs inside a transaction that is rolled back."""
+    help = 'Benchmark the share task user autocomplete on a seeded user table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100_000,
+                            help='Number of users to seed (default 100,000)')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Times to run each search when timing it')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Rows per bulk insert while seeding')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            owner, task, exclude_ids = self.seed(options['users'], options['batch_size'])
+            for term in TERMS:
+                self.report(term, owner, task, exclude_ids, options['repeat'])
+            transaction.set_rollback(True)
+
+    def seed(self, user_count, batch_size):
+        """Bulk insert users with their index rows and a task shared with a few of them."""
+        start = time.perf_counter()
+        rng = random.Random(4300)
+        for offset in range(0, user_count, batch_size):
+            users = User.objects.bulk_create(
+                User(username=f'{rng.choice(BENCH_USER_PREFIXES)}{i}', password='!')
+                for i in range(offset, min(offset + batch_size, user_count))
+            )
+            index_users(users)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f'Seeded {user_count} users in {elapsed:.1f}s')
+
+        owner = User.objects.order_by('pk').first()
+        task = Task.objects.create(name='Benchmark', creator=owner,
+                                   due_date=timezone.now() + timedelta(days=1))
+        members = list(User.objects.order_by('pk')[1:11])
+        task.assigned_users.add(*members[:5])
+        for member in members[5:]:
+            TaskCollabRequest.objects.create(task=task, from_user=owner, to_user=member)
+        return owner, task, {owner.pk, *(member.pk for member in members)}
+
+    def report(self, term, owner, task, exclude_ids, repeat):
+        """Print the median timing and plan of each way to answer the term."""
+        # the query TaskCollabForm used to build, re-run on every keystroke
+        requested = TaskCollabRequest.objects.filter(task=task).values_list('to_user', flat=True)
+        like = User.objects.exclude(
+            id__in=[owner.pk, task.creator_id, *task.assigned_users.values_list('id', flat=True)]
+        ).exclude(id__in=requested).filter(username__icontains=term).order_by('username')
+        prefix = search_users(term, exclude_ids)
+
+        key = user_search_cache_key(task.pk, exclude_ids, term, 1)
+        cache.set(key, autocomplete_page(prefix), timeout=USER_SEARCH_TIMEOUT)
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f'== term {term!r} =='))
+        for label, run in (
+            ('like scan', lambda: autocomplete_page(like)),
+            ('prefix index', lambda: autocomplete_page(prefix)),
+            ('cached page', lambda: cache.get(key)),
+        ):
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                results, _ = run()
+                timings.append((time.perf_counter() - start) * 1000)
+            self.stdout.write(
+                f'{label}: {len(results)} results, median {statistics.median(timings):.3f} ms, '
+                f'min {min(timings):.3f} ms'
+            )
+
+        for label, queryset in (('like scan', like), ('prefix index', prefix)):
+            self.stdout.write(f'  {label} plan:')
+            for line in queryset[:PAGE_SIZE].explain().splitlines():
+                self.stdout.write(f'    {line}')
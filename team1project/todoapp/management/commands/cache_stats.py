@@ -0,0 +1,32 @@
+"""Module with a command that reports the hit ratio of the configured caches."""
+# pylint: disable=W0613
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    """Print the hits, misses and hit ratio of every cache, added up over all workers
+    when a shared cache backend is configured."""
+    help = 'Report cache hits and misses counted by the todoapp cache backends'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true',
+                            help='Set the counters back to zero after reporting them')
+
+    def handle(self, *args, **options):
+        for alias in settings.CACHES:
+            cache = caches[alias]
+            if not hasattr(cache, 'get_stats'):
+                self.stdout.write(f'{alias}: hits and misses are not counted by this backend')
+                continue
+
+            stats = cache.get_stats()
+            lookups = stats['hits'] + stats['misses']
+            ratio = stats['hits'] / lookups * 100 if lookups else 0
+            self.stdout.write(
+                f"{alias}: {stats['hits']} hits, {stats['misses']} misses "
+                f"({ratio:.1f}% hit ratio)"
+            )
+            if options['reset']:
+                cache.reset_stats()
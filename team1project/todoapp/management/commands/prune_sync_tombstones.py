@@ -0,0 +1,21 @@
+"""Module with a command that deletes the delta sync tombstones older than
+SYNC_TOMBSTONE_DAYS, which no sync token still accepted can ask for."""
+# disabling django specific errors such as class has no "object" member
+# pylint: disable=E1101, W0613
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from todoapp.models import SyncTombstone
+
+
+class Command(BaseCommand):
+    """Delete expired sync tombstones, meant to run daily from cron."""
+    help = 'Delete delta sync tombstones older than SYNC_TOMBSTONE_DAYS'
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(days=settings.SYNC_TOMBSTONE_DAYS)
+        pruned = SyncTombstone.objects.prune(before)
+        self.stdout.write(f'Pruned {pruned} sync tombstones.')
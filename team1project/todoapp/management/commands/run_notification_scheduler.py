@@ -0,0 +1,89 @@
+"""Module with a long-running command that sends task reminders at their exact fire time,
+replacing cron runs of send_due_task_notifications and send_task_reminders. It can also
+archive expired tasks periodically in place of a cron run of archive_expired_tasks."""
+# pylint: disable=W0613, W0718
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from todoapp.management.commands.archive_expired_tasks import archive_expired_tasks
+from todoapp.notifications import NotificationScheduler
+
+
+class Command(BaseCommand):
+    """Keep upcoming reminders in a min-heap, sleep until the next one is due and send it
+    by push or email according to the task's notification type."""
+    help = 'Run the notification scheduler daemon'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll-interval', type=float, default=30,
+                            help='Seconds between checks for tasks changed by other processes')
+        parser.add_argument('--once', action='store_true',
+                            help='Send the reminders that are due now and exit')
+        parser.add_argument('--archive-interval', type=float, default=0,
+                            help='Seconds between runs of archive_expired_tasks (0 disables)')
+
+    def handle(self, *args, **options):
+        scheduler = NotificationScheduler()
+        scheduler.seed(timezone.now())
+        self.stdout.write(f'Scheduler started with {len(scheduler)} upcoming reminders.')
+        archive_interval = options['archive_interval']
+        next_archive = time.monotonic()
+
+        while True:
+            now = timezone.now()
+            self.run_poll(scheduler, now)
+            self.run_due(scheduler, now, options['poll_interval'])
+
+            if archive_interval and time.monotonic() >= next_archive:
+                self.run_archive(now)
+                next_archive = time.monotonic() + archive_interval
+
+            if options['once']:
+                return
+
+            next_fire = scheduler.next_fire_time()
+            sleep_for = options['poll_interval']
+            if next_fire is not None:
+                sleep_for = min(sleep_for, (next_fire - timezone.now()).total_seconds())
+            if archive_interval:
+                sleep_for = min(sleep_for, next_archive - time.monotonic())
+            time.sleep(max(sleep_for, 0))
+
+    def run_poll(self, scheduler, now):
+        """Pick up the tasks changed by other processes."""
+        try:
+            scheduler.poll(now)
+        except Exception as e:
+            # keep the daemon alive, the next poll covers the same changes
+            self.stderr.write(f'Error polling for changed tasks: {e}')
+            close_old_connections()
+
+    def run_archive(self, now):
+        """Archive the tasks that expired since the last run."""
+        try:
+            archived, elapsed = archive_expired_tasks(now=now)
+        except Exception as e:
+            self.stderr.write(f'Error archiving expired tasks: {e}')
+            return
+        if archived:
+            self.stdout.write(f'Archived {archived} expired task(s) in {elapsed:.2f}s.')
+
+    def run_due(self, scheduler, now, retry_after):
+        """Dispatch the reminders whose fire time has passed."""
+        task_ids = scheduler.pop_due(now)
+        if not task_ids:
+            return
+
+        try:
+            sent, failed = scheduler.dispatch(task_ids, now)
+            self.stdout.write(f'Sent {sent} reminder(s) for {len(task_ids)} task(s).')
+        except Exception as e:
+            # keep the daemon alive and try again later, the ledger stops duplicates
+            self.stderr.write(f'Error sending reminders: {e}')
+            failed = task_ids
+        for task_id in failed:
+            scheduler.schedule(task_id, now + timedelta(seconds=retry_after))
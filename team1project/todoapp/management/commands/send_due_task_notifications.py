@@ -2,56 +2,88 @@
 that have tasks due."""
 # disabling django specific errors such as class has no "object" member
 # pylint: disable=E1101, E5142, W0613, W0611, W0718, R0801
-import json
-from datetime import timedelta
-
-from webpush import send_user_notification
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 from django.core.management.base import BaseCommand
 from django.utils import timezone
-from django.contrib.auth.models import User
 
 from todoapp.models import Task
+from todoapp.notifications import (
+    build_push_payload, close_worker_connections, pending_recipients, push_to_user,
+    record_deliveries, task_recipients,
+)
 
 class Command(BaseCommand):
     """"Send push notifications to all users that have tasks due withing the chosen time."""
     help = 'Send push notifications for upcoming due tasks'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8,
+                            help='Number of threads sending notifications')
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Tasks fetched from the database per round trip')
+
     def handle(self, *args, **kwargs):
         """Send push notifications to all users that have tasks due withing the chosen time."""
+        start = time.perf_counter()
         now = timezone.now()
-        tasks = Task.objects.filter(
-            due_date__gte=now,
-            is_completed=False,
-            notifications_enabled=True
+
+        # The notification window is computed in SQL, and the rows are streamed in
+        # chunks with their recipients and past deliveries prefetched per chunk
+        tasks = Task.objects.in_notification_window(now).select_related(
+            'creator'
+        ).prefetch_related('assigned_users').with_deliveries('push')
+
+        self.scanned = 0
+        self.sent = 0
+        self.failed = 0
+        self.skipped = 0
+        self.delivered = []
+        max_pending = kwargs['workers'] * 4
+
+        with ThreadPoolExecutor(max_workers=kwargs['workers']) as pool:
+            try:
+                pending = set()
+                for task in tasks.iterator(chunk_size=kwargs['chunk_size']):
+                    self.scanned += 1
+                    payload = build_push_payload(task)
+
+                    recipients = pending_recipients(task)
+                    self.skipped += len(task_recipients(task)) - len(recipients)
+                    for user in recipients:
+                        future = pool.submit(push_to_user, user, payload)
+                        future.context = (user, task)
+                        pending.add(future)
+
+                    # Keep the queue bounded so huge runs do not hold every send in memory
+                    if len(pending) >= max_pending:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        self.collect(done)
+
+                self.collect(wait(pending).done)
+            finally:
+                # the workers reuse their DB connections across sends, close them once
+                close_worker_connections(pool, kwargs['workers'])
+
+        record_deliveries(self.delivered, 'push')
+
+        elapsed = time.perf_counter() - start
+        rate = self.sent / elapsed if elapsed else 0
+        self.stdout.write(
+            f"Checked {self.scanned} tasks: {self.sent} sent, {self.failed} failed, "
+            f"{self.skipped} already sent in {elapsed:.2f}s ({rate:.1f} notifications/s)."
         )
 
-        self.stdout.write(f"Checking {tasks.count()} tasks.")
-
-        for task in tasks:
-            # Figure out when to notify based on the task's chosen notification_time
-            notification_offset = timedelta(minutes=task.notification_time)
-            notification_time = task.due_date - notification_offset
-
-            # If we're in the window to send the notification
-            if notification_time <= now <= task.due_date:
-                users = list(task.assigned_users.all()) + [task.creator]
-                notified = set()
-
-                for user in users:
-                    if user.id in notified:
-                        continue
-
-                    payload = {
-                        "head": "Task Reminder!",
-                        "body": f"'{task.name}' is coming up at\
-                             {task.due_date.strftime('%I:%M %p')}",
-                        "url": "/task_view/"
-                    }
-
-                    try:
-                        send_user_notification(user=user, payload=json.dumps(payload), ttl=1000)
-                        notified.add(user.id)
-                        self.stdout.write(f"Notified {user.username} about task '{task.name}'")
-                    except Exception as e:
-                        self.stderr.write(f"Error notifying {user.username}: {e}")
+    def collect(self, futures):
+        """Record the outcome of finished sends."""
+        for future in futures:
+            user, task = future.context
+            try:
+                future.result()
+                self.sent += 1
+                self.delivered.append((task, user))
+                self.stdout.write(f"Notified {user.username} about task '{task.name}'")
+            except Exception as e:
+                self.failed += 1
+                self.stderr.write(f"Error notifying {user.username}: {e}")
@@ -2,18 +2,31 @@
 # pylint: disable=E1101, W0613
 from datetime import timedelta
 import smtplib
+import time
 from socket import error as SocketError
 
-from django.core.mail import send_mail, BadHeaderError
+from django.core.mail import BadHeaderError, get_connection
 from django.utils import timezone
 from django.core.management.base import BaseCommand
 from todoapp.models import Task
+from todoapp.notifications import build_email_reminder, pending_recipients, record_deliveries
+
+LOCMEM_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+
 
 class Command(BaseCommand):
     """Class that handles sending email notifications that are due
     within 24 hours"""
     help = 'Send email reminders for tasks due in a given timeframe'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50,
+                            help='Messages sent over one SMTP connection before it is reopened')
+        parser.add_argument('--retries', type=int, default=2,
+                            help='Times a failed message is retried on a fresh connection')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Deliver to the in-memory backend and record nothing')
+
     def handle(self, *args, **kwargs):
         now = timezone.now()
         time_window = timedelta(hours=24)
@@ -25,30 +38,55 @@ class Command(BaseCommand):
             notification_type='email',
             due_date__gte=now,
             due_date__lte=end_time
-        )
+        ).select_related('creator').prefetch_related('assigned_users').with_deliveries('email')
+
+        # Build every message first so they can share one connection
+        outgoing = []
+        for task in tasks:
+            # users that already got this reminder are skipped using the prefetched ledger
+            for user in pending_recipients(task):
+                if user.email:
+                    outgoing.append((task, user, build_email_reminder(task, user)))
+
+        dry_run = kwargs['dry_run']
+        connection = get_connection(LOCMEM_BACKEND if dry_run else None)
+        batch_size = max(kwargs['batch_size'], 1)
 
+        start = time.perf_counter()
         sent_count = 0
+        for offset in range(0, len(outgoing), batch_size):
+            batch = outgoing[offset:offset + batch_size]
+            delivered = self.send_batch(connection, batch, kwargs['retries'])
+            sent_count += len(delivered)
+            # record each batch right away so a later failure can't cause a resend
+            if not dry_run:
+                record_deliveries(delivered, 'email')
+        elapsed = time.perf_counter() - start
 
-        for task in tasks:
-            users = set(task.assigned_users.all()) | {task.creator}
+        rate = sent_count / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'{sent_count} task reminder(s) sent in {elapsed:.2f}s '
+            f'({rate:.1f} messages/s).'
+        ))
 
-            for user in users:
-                if user.email:
-                    try:
-                        due_str = timezone.localtime(task.due_date).strftime('%Y-%m-%d %H:%M')
-                        send_mail(
-                            subject=f"Reminder: Task '{task.name}' is due soon!",
-                            message = (
-                                f"Hi {user.username},\n\n"
-                                f"Your task \"{task.name}\" is due on {due_str}.\n\n"
-                                "Don't forget to complete it."
-                            ),
-                            from_email='team1todo@gmail.com',
-                            recipient_list=[user.email],
-                            fail_silently=False
-                        )
-                        sent_count += 1
-                    except (BadHeaderError, smtplib.SMTPException, SocketError) as e:
-                        self.stderr.write(f"Failed to send email to {user.email}: {e}")
-
-        self.stdout.write(self.style.SUCCESS(f'{sent_count} task reminder(s) sent.'))
+    def send_batch(self, connection, batch, retries):
+        """Send a batch one message at a time over the shared connection.
+
+        A failed message is retried on a reopened connection without resending the
+        rest of the batch. Returns the (task, user) pairs the server accepted."""
+        delivered = []
+        for task, user, message in batch:
+            for attempt in range(retries + 1):
+                try:
+                    connection.open()
+                    connection.send_messages([message])
+                except (BadHeaderError, smtplib.SMTPException, SocketError) as e:
+                    self.stderr.write(
+                        f"Failed to send email to {message.to[0]} (attempt {attempt + 1}): {e}"
+                    )
+                    connection.close()
+                else:
+                    delivered.append((task, user))
+                    break
+        connection.close()
+        return delivered
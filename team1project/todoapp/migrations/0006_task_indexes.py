@@ -0,0 +1,27 @@
+# Generated by Django 5.0.14 on 2026-10-17 20:23
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todoapp', '0005_rename_manually_archived_task_ignore_archive'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['creator', 'is_archived'], name='task_creator_archived_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['due_date'], name='task_due_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('is_completed', False), ('notifications_enabled', True)), fields=['due_date', 'notification_type'], name='task_notify_due_idx'),
+        ),
+    ]
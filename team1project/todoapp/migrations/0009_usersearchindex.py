@@ -0,0 +1,37 @@
+# Generated by Django 5.0.14 on 2026-10-17 20:57
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def index_existing_users(apps, schema_editor):
+    """Add the users that signed up before the index existed."""
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    UserSearchIndex = apps.get_model('todoapp', 'UserSearchIndex')
+    UserSearchIndex.objects.bulk_create(
+        (
+            UserSearchIndex(user_id=pk, username_key=username.casefold())
+            for pk, username in User.objects.values_list('pk', 'username').iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('todoapp', '0008_task_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSearchIndex',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_index', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('username_key', models.CharField(db_index=True, max_length=150)),
+            ],
+        ),
+        migrations.RunPython(index_existing_users, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.14 on 2026-10-17 21:15
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todoapp', '0009_usersearchindex'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('ignore_archive', False), ('is_archived', False), ('is_completed', True)), fields=['due_date', 'id'], name='task_expired_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.0.14 on 2026-10-17 21:22
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todoapp', '0010_task_expired_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='task',
+            name='task_creator_archived_idx',
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('is_archived', False)), fields=['creator', 'due_date', 'id'], name='task_owned_list_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('is_archived', True)), fields=['creator', 'due_date', 'id'], name='task_archived_list_idx'),
+        ),
+    ]
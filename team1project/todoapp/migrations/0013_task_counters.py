@@ -0,0 +1,50 @@
+# Generated by Django 5.0.14 on 2026-10-17 22:08
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_existing(apps, schema_editor):
+    """Count the subtasks and collaborators of the tasks made before the counters."""
+    Task = apps.get_model('todoapp', 'Task')
+    SubTask = apps.get_model('todoapp', 'SubTask')
+    subtasks = SubTask.objects.filter(task=OuterRef('pk')).order_by().values('task')
+    assigned = Task.assigned_users.through.objects.filter(
+        task=OuterRef('pk')
+    ).order_by().values('task')
+
+    def count(rows):
+        return Coalesce(Subquery(rows.annotate(count=Count('pk')).values('count')), 0)
+
+    Task.objects.update(
+        subtask_count=count(subtasks),
+        subtask_done_count=count(subtasks.filter(is_completed=True)),
+        collaborator_count=count(assigned),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todoapp', '0012_delta_sync'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='collaborator_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='subtask_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='subtask_done_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_existing, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,16 @@
 """Module that contains task objects models stored in the DB for the taskapp."""
-from django.db import models
+from datetime import timedelta
+
+from django.db import DatabaseError, models, router, transaction
+from django.db.models import (
+    Case, Count, Exists, F, OuterRef, Prefetch, Q, Subquery, Value, When,
+)
+from django.db.models.functions import Coalesce
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 
+from .caching import bump_task_version, suspend_task_version_bumps
+
 User = get_user_model()
 
 class Category(models.Model):
@@ -18,6 +26,216 @@ class Category(models.Model):
         return str(self.name or "")
 
 
+class TaskQuerySet(models.QuerySet):
+    """Queryset for Task that knows how to load the rows shown in task lists."""
+
+    def for_listing(self):
+        """Return tasks with the creator joined and categories/assigned users prefetched,
+        so rendering a list costs a fixed number of queries regardless of its length."""
+        return self.select_related('creator').prefetch_related('categories', 'assigned_users')
+
+    def visible_to(self, user):
+        """Return every task the user created or collaborates on."""
+        assigned = self.model.assigned_users.through.objects.filter(
+            task=OuterRef('pk'), user=user
+        )
+        return self.filter(Q(creator=user) | Exists(assigned))
+
+    def list_parts(self, user, name):
+        """Return the disjoint querysets making up one of the user's task lists:
+        'owned' holds the unarchived tasks the user created, 'shared' the unarchived
+        tasks shared with them and 'archived' every archived task they can see.
+
+        Each part is paged on its own from an index, which costs a query per part
+        instead of one query over visible_to, but never reads more than a page of rows.
+        The archive is returned as the tasks the user created and the tasks shared with
+        them, so each part is read in (due_date, id) order straight from an index
+        instead of sorting every task matching an OR."""
+        archived = name == 'archived'
+        owned = self.filter(creator=user, is_archived=archived)
+        shared = self.filter(assigned_users=user, is_archived=archived).exclude(creator=user)
+        if archived:
+            return (owned, shared)
+        return (owned,) if name == 'owned' else (shared,)
+
+    def with_access(self, user):
+        """Annotate the access flags of user read by todoapp.access, so loading a task
+        and checking what the user may do with it is a single query."""
+        if not user.is_authenticated:
+            return self.annotate(
+                access_user_id=Value(None, output_field=models.IntegerField()),
+                user_is_member=Value(False),
+                user_has_request=Value(False),
+            )
+        assigned = self.model.assigned_users.through.objects.filter(
+            task=OuterRef('pk'), user=user
+        )
+        requested = TaskCollabRequest.objects.filter(task=OuterRef('pk'), to_user=user)
+        return self.annotate(
+            access_user_id=Value(user.pk),
+            user_is_member=Exists(assigned),
+            user_has_request=Exists(requested),
+        )
+
+    def user_ids(self):
+        """Return the ids of every creator and assigned user of these tasks."""
+        creators = self.values_list('creator_id', flat=True)
+        members = self.model.assigned_users.through.objects.filter(
+            task__in=self.values('pk')
+        ).values_list('user_id', flat=True)
+        return set(creators) | set(members)
+
+    def update_tasks(self, **changes):
+        """QuerySet.update() that also does what the Task save signals would: stamp
+        updated_at and bump the task version of everyone who can see the tasks."""
+        user_ids = self.user_ids()
+        updated = self.update(updated_at=timezone.now(), **changes)
+        bump_task_version(*user_ids)
+        return updated
+
+    def archive(self):
+        """Archive the tasks in one UPDATE, like archive_task does one by one."""
+        return self.update_tasks(
+            ignore_archive=False,
+            is_archived=True,
+            is_completed=Q(progress=100),
+        )
+
+    def restore(self):
+        """Restore archived tasks in one UPDATE and keep them out of auto-archiving."""
+        return self.update_tasks(
+            ignore_archive=True,
+            is_archived=False,
+            is_completed=Q(progress=100),
+        )
+
+    def delete_tasks(self):
+        """Delete the tasks and return how many were deleted.
+
+        The affected users are looked up, and their sync tombstones recorded, once
+        instead of by the delete signals of every task."""
+        user_ids = self.user_ids()
+        with transaction.atomic(), suspend_task_version_bumps():
+            SyncTombstone.objects.record_tasks(self)
+            _, deleted = self.delete()
+        bump_task_version(*user_ids)
+        return deleted.get(self.model._meta.label, 0)
+
+    def set_progress(self, progress):
+        """Set the progress of the tasks in one UPDATE, applying the Task.save rules:
+        100% completes a task and archives it if it is overdue, unless it is already
+        archived or excluded from auto-archiving."""
+        completed = progress == 100
+        changes = {'progress': progress, 'is_completed': completed}
+        if completed:
+            changes['is_archived'] = Case(
+                When(Q(ignore_archive=True) | Q(is_archived=True), then=F('is_archived')),
+                When(due_date__lt=timezone.now(), then=Value(True)),
+                default=Value(False),
+            )
+        return self.update_tasks(**changes)
+
+    def expired(self, now):
+        """Return completed, unarchived tasks that were due before now and have not
+        been excluded from auto-archiving, the tasks Task.save would archive."""
+        return self.filter(
+            is_completed=True,
+            is_archived=False,
+            ignore_archive=False,
+            due_date__lt=now,
+        )
+
+    def archive_expired(self, now, chunk_size=1000):
+        """Archive every expired task, one UPDATE per chunk of chunk_size ids.
+
+        Archived tasks leave the partial task_expired_idx, so each chunk is read from
+        an index holding only the tasks still to archive, and every UPDATE holds its
+        locks for one chunk only. Yields the number of tasks archived by each chunk."""
+        last_pk = 0
+        while True:
+            chunk = list(self.expired(now).filter(pk__gt=last_pk).order_by('pk').values_list(
+                'pk', flat=True
+            )[:chunk_size])
+            if not chunk:
+                return
+            # the conditions are checked again by the UPDATE, a task changed since the
+            # SELECT is no longer archived
+            yield self.expired(now).filter(pk__in=chunk).update_tasks(is_archived=True)
+            if len(chunk) < chunk_size:
+                return
+            last_pk = chunk[-1]
+
+    def with_counted(self):
+        """Annotate the counters of Task.COUNTER_FIELDS counted from the subtask and
+        assignment tables, as counted_<field>."""
+        subtasks = SubTask.objects.filter(task=OuterRef('pk')).order_by().values('task')
+        assigned = self.model.assigned_users.through.objects.filter(
+            task=OuterRef('pk')
+        ).order_by().values('task')
+        counts = {
+            'subtask_count': subtasks,
+            'subtask_done_count': subtasks.filter(is_completed=True),
+            'collaborator_count': assigned,
+        }
+        return self.annotate(**{
+            f'counted_{field}': Coalesce(
+                Subquery(rows.annotate(count=Count('pk')).values('count')), 0
+            )
+            for field, rows in counts.items()
+        })
+
+    def recount_counters(self, chunk_size=1000):
+        """Recount the counters of the tasks that drifted from their subtasks and
+        assignments, e.g. after QuerySet.update() or bulk_create() bypassed the signals
+        that maintain them.
+
+        Each chunk of chunk_size tasks is checked by one aggregate query, and only the
+        stale tasks are written, by one UPDATE. Yields (checked, fixed) per chunk."""
+        fields = self.model.COUNTER_FIELDS
+        counted = [f'counted_{field}' for field in fields]
+        last_pk = 0
+        while True:
+            rows = list(self.filter(pk__gt=last_pk).with_counted().order_by('pk').values_list(
+                'pk', *fields, *counted
+            )[:chunk_size])
+            if not rows:
+                return
+            stale = [row[0] for row in rows if row[1:len(fields) + 1] != row[len(fields) + 1:]]
+            if stale:
+                self.model.objects.filter(pk__in=stale).with_counted().update_tasks(**{
+                    field: F(name) for field, name in zip(fields, counted)
+                })
+            yield len(rows), len(stale)
+            if len(rows) < chunk_size:
+                return
+            last_pk = rows[-1][0]
+
+    def in_notification_window(self, now):
+        """Return notify-enabled, incomplete tasks whose reminder is due at now, i.e.
+        due_date - notification_time <= now <= due_date.
+
+        The window is expanded per notification_time choice so it stays a plain
+        due_date range the database can answer from an index."""
+        window = Q()
+        for minutes, _ in self.model.NOTIFICATION_TIMES:
+            window |= Q(notification_time=minutes, due_date__lte=now + timedelta(minutes=minutes))
+        return self.filter(
+            window,
+            due_date__gte=now,
+            is_completed=False,
+            notifications_enabled=True,
+        )
+
+    def with_deliveries(self, channel):
+        """Prefetch the reminders already delivered on a channel into task.sent_deliveries,
+        letting the notification commands skip them without a query per user."""
+        return self.prefetch_related(Prefetch(
+            'deliveries',
+            queryset=NotificationDelivery.objects.filter(channel=channel),
+            to_attr='sent_deliveries',
+        ))
+
+
 class Task(models.Model):
     """
     Represents a task with details, collaborators, progress tracking, and notification settings.
@@ -34,9 +252,15 @@ class Task(models.Model):
         assigned_users (ManyToManyField): Users assigned to this task.
         notifications_enabled (BooleanField): Whether notifications are enabled for the task.
         notification_time (IntegerField):When to send the notification(in minutes before due date).
-        notification_type (CharField): Type of notification to send (push or email)."""
+        notification_type (CharField): Type of notification to send (push or email).
+        updated_at (DateTimeField): Timestamp of the last save, polled by the notification
+        scheduler and the delta sync (QuerySet.update() callers must set it themselves).
+        subtask_count, subtask_done_count, collaborator_count (PositiveIntegerField):
+        Denormalized counts of the subtasks, completed subtasks and assigned users, kept
+        by the signals in todoapp.signals. save() leaves them out of updates and inserts
+        them as 0."""
     name = models.CharField(max_length=255)
-    objects = models.Manager()
+    objects = TaskQuerySet.as_manager()
     creator = models.ForeignKey(User, on_delete=models.CASCADE)
     description = models.TextField()
     due_date = models.DateTimeField()
@@ -64,6 +288,49 @@ class Task(models.Model):
         choices=NOTIFICATION_TYPES,
         default='push'
     )
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    subtask_count = models.PositiveIntegerField(default=0, editable=False)
+    subtask_done_count = models.PositiveIntegerField(default=0, editable=False)
+    collaborator_count = models.PositiveIntegerField(default=0, editable=False)
+
+    COUNTER_FIELDS = ('subtask_count', 'subtask_done_count', 'collaborator_count')
+
+    class Meta:
+        '''
+        Indexes matched to the hot task queries
+
+        indexes:
+            creator + due_date + id of unarchived / archived tasks: the owned task and
+                archive lists, paginated on due_date, id
+            creator + updated_at: the owned tasks changed since a delta sync token
+            due_date: calendar month ranges and the reminder commands
+            due_date where notifications are enabled on incomplete tasks: reminder scans
+            due_date, id of completed tasks waiting to be archived: archive_expired_tasks
+        '''
+        indexes = [
+            models.Index(
+                fields=['creator', 'due_date', 'id'],
+                condition=Q(is_archived=False),
+                name='task_owned_list_idx',
+            ),
+            models.Index(
+                fields=['creator', 'due_date', 'id'],
+                condition=Q(is_archived=True),
+                name='task_archived_list_idx',
+            ),
+            models.Index(fields=['creator', 'updated_at'], name='task_sync_idx'),
+            models.Index(fields=['due_date'], name='task_due_date_idx'),
+            models.Index(
+                fields=['due_date', 'notification_type'],
+                condition=Q(notifications_enabled=True, is_completed=False),
+                name='task_notify_due_idx',
+            ),
+            models.Index(
+                fields=['due_date', 'id'],
+                condition=Q(is_completed=True, is_archived=False, ignore_archive=False),
+                name='task_expired_idx',
+            ),
+        ]
 
     def save(self, *args, **kwargs):
         self.is_completed = self.progress == 100
@@ -76,8 +343,40 @@ class Task(models.Model):
             self.is_archived = True
         else:
             self.is_archived = False
+
+        if self.pk is None or self._state.adding:
+            self.reset_counters()
+        elif not args and not kwargs.keys() & {'force_insert', 'update_fields'}:
+            # the counters are updated in place with F() by the signals, writing back the
+            # values loaded with the task would undo changes made since. Saves naming
+            # them in update_fields still write them.
+            fields = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
+            using = kwargs.get('using') or router.db_for_write(Task, instance=self)
+            in_atomic_block = transaction.get_connection(using).in_atomic_block
+            rollback = in_atomic_block and transaction.get_rollback(using)
+            try:
+                super().save(update_fields=fields, **kwargs)
+                return
+            except DatabaseError as e:
+                # a plain DatabaseError is Django reporting that the update matched no
+                # row, the task was deleted meanwhile. Insert it again like a save
+                # without update_fields would; the transaction itself is still usable.
+                if type(e) is not DatabaseError or kwargs.get('force_update'):
+                    raise
+                if in_atomic_block:
+                    transaction.set_rollback(rollback, using)
+            self.reset_counters()
         super().save(*args, **kwargs)
 
+    def reset_counters(self):
+        """Zero the counters of a row being inserted, a new task or a copy, which has no
+        subtasks or assignments yet."""
+        for field in self.COUNTER_FIELDS:
+            setattr(self, field, 0)
+
     def __str__(self):
         return str(self.name or "")
 
@@ -89,12 +388,19 @@ class SubTask(models.Model):
         name (CharField): Name/title of the subtask.
         task (ForeignKey): The parent task this subtask belongs to.
         is_completed (BooleanField): Whether the subtask is marked as complete.
-        assigned_users (ManyToManyField): Users assigned to this subtask."""
+        assigned_users (ManyToManyField): Users assigned to this subtask.
+        updated_at (DateTimeField): Timestamp of the last change, read by the delta sync."""
     name = models.CharField(max_length=255)
     objects = models.Manager()
     task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name="subtasks")
     is_completed = models.BooleanField(default=False)
     assigned_users = models.ManyToManyField(User, related_name="assigned_subtasks")
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    def save(self, *args, **kwargs):
+        # the counters of the task are updated by the save signals, in one transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
 
 class TaskProgress(models.Model):
@@ -118,11 +424,46 @@ class TaskCollabRequest(models.Model):
     Fields:
         task (ForeignKey): The task for which collaboration is requested.
         from_user (ForeignKey): The user sending the collaboration request.
-        to_user (ForeignKey): The user receiving the collaboration request."""
+        to_user (ForeignKey): The user receiving the collaboration request.
+        updated_at (DateTimeField): Timestamp of the last change, read by the delta sync."""
     task = models.ForeignKey(Task, on_delete=models.CASCADE)
     objects = models.Manager()
     from_user = models.ForeignKey(User, related_name="from_user", on_delete=models.CASCADE)
     to_user = models.ForeignKey(User, related_name="to_user", on_delete=models.CASCADE)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+
+class NotificationDelivery(models.Model):
+    """Records a reminder that was delivered so each one is only sent once.
+
+    Fields:
+        task (ForeignKey): The task the reminder was about.
+        user (ForeignKey): The user who received the reminder.
+        channel (CharField): How the reminder was delivered (push or email).
+        due_date (DateTimeField): The task's due date when the reminder was sent, so moving
+        the due date allows a new reminder.
+        sent_at (DateTimeField): Timestamp when the reminder was sent."""
+    task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name="deliveries")
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                             related_name="notification_deliveries")
+    objects = models.Manager()
+    channel = models.CharField(max_length=10, choices=Task.NOTIFICATION_TYPES)
+    due_date = models.DateTimeField()
+    sent_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        '''
+        One reminder per task, user, channel and due date
+
+        constraints:
+            unique_notification_delivery: makes repeated inserts of a delivery no-ops
+        '''
+        constraints = [
+            models.UniqueConstraint(
+                fields=['task', 'user', 'channel', 'due_date'],
+                name='unique_notification_delivery',
+            ),
+        ]
 
 
 class WebPushSubscription(models.Model):
@@ -137,3 +478,85 @@ class WebPushSubscription(models.Model):
     objects = models.Manager()
     subscription_info = models.JSONField()  # If you're using Django 3.1+
     created_at = models.DateTimeField(auto_now_add=True)
+
+
+class SyncTombstoneQuerySet(models.QuerySet):
+    """Queryset for SyncTombstone that records deletions in bulk."""
+
+    def record(self, kind, pairs):
+        """Record that the objects of kind left the lists of users, given as
+        (object id, user id) pairs, with one INSERT."""
+        return self.bulk_create(
+            self.model(kind=kind, object_id=object_id, user_id=user_id)
+            for object_id, user_id in set(pairs)
+        )
+
+    def record_tasks(self, tasks):
+        """Record the deletion of tasks for their creators and collaborators."""
+        creators = tasks.values_list('pk', 'creator_id')
+        members = Task.assigned_users.through.objects.filter(
+            task__in=tasks.values('pk')
+        ).values_list('task_id', 'user_id')
+        return self.record(SyncTombstone.TASK, [*creators, *members])
+
+    def prune(self, before):
+        """Delete the tombstones recorded before the given time."""
+        return self.filter(deleted_at__lt=before).delete()[0]
+
+
+class SyncTombstone(models.Model):
+    """Records that a task, subtask or collaboration request was deleted, or that a
+    task was taken off a user's lists, so the delta sync can tell clients to drop it.
+
+    Rows are per user, since a user removed from a task has to drop it while
+    everyone else keeps it. They are kept for SYNC_TOMBSTONE_DAYS days, which is
+    also how old a sync token may be.
+
+    Fields:
+        user (ForeignKey): The user whose lists the object left.
+        kind (CharField): What was deleted: task, subtask or request.
+        object_id (BigIntegerField): The id the object had.
+        deleted_at (DateTimeField): When it was deleted."""
+    TASK = 'task'
+    SUBTASK = 'subtask'
+    REQUEST = 'request'
+    KINDS = [
+        (TASK, 'Task'),
+        (SUBTASK, 'Subtask'),
+        (REQUEST, 'Collaboration request'),
+    ]
+
+    # no database constraint: deleting a user deletes their tasks, whose signals record
+    # tombstones for that same user after the cascade has been collected
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False,
+                             related_name='sync_tombstones')
+    objects = SyncTombstoneQuerySet.as_manager()
+    kind = models.CharField(max_length=10, choices=KINDS)
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        '''
+        Indexes matched to the delta sync
+
+        indexes:
+            user + deleted_at: the deletions of a user since a sync token
+        '''
+        indexes = [
+            models.Index(fields=['user', 'deleted_at'], name='tombstone_user_deleted_idx'),
+        ]
+
+
+class UserSearchIndex(models.Model):
+    """Normalized usernames searched by the share task autocomplete.
+
+    Rows are kept in sync with the user table by signals. Searching a prefix is a range
+    scan on the username_key index instead of a LIKE '%term%' over every user.
+
+    Fields:
+        user (OneToOneField): The indexed user.
+        username_key (CharField): The casefolded username."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True,
+                                related_name='search_index')
+    username_key = models.CharField(max_length=150, db_index=True)
+    objects = models.Manager()
@@ -0,0 +1,230 @@
+"""Helpers shared by the reminder commands: recipients of a task, the push and email
+messages, the delivery ledger that makes sure each reminder is only sent once, and the
+scheduler used by the long-running notification daemon."""
+# pylint: disable=E1101, W0718
+import heapq
+import json
+import logging
+import threading
+from concurrent.futures import wait
+from datetime import timedelta
+
+import webpush
+from django.core.mail import EmailMessage, get_connection
+from django.db import connections
+from django.utils import timezone
+
+from .models import NotificationDelivery, Task
+
+logger = logging.getLogger(__name__)
+
+
+def task_recipients(task):
+    """Return the creator and assigned users of a task without duplicates.
+
+    Relies on assigned_users being prefetched so no query is issued per task."""
+    recipients = {task.creator.id: task.creator}
+    for user in task.assigned_users.all():
+        recipients.setdefault(user.id, user)
+    return list(recipients.values())
+
+
+def pending_recipients(task):
+    """Return the recipients of a task that have not been sent its current reminder.
+
+    Relies on the queryset using Task.objects.with_deliveries(channel)."""
+    delivered = {
+        delivery.user_id
+        for delivery in task.sent_deliveries
+        if delivery.due_date == task.due_date
+    }
+    return [user for user in task_recipients(task) if user.id not in delivered]
+
+
+def record_deliveries(deliveries, channel):
+    """Add (task, user) pairs to the delivery ledger in one insert.
+
+    Conflicting rows are ignored, so recording the same reminder twice is harmless."""
+    NotificationDelivery.objects.bulk_create(
+        [
+            NotificationDelivery(task=task, user=user, channel=channel, due_date=task.due_date)
+            for task, user in deliveries
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def build_push_payload(task):
+    """Return the JSON push payload for a task reminder."""
+    return json.dumps({
+        "head": "Task Reminder!",
+        "body": f"'{task.name}' is coming up at\
+                             {task.due_date.strftime('%I:%M %p')}",
+        "url": "/task_view/"
+    })
+
+
+def push_to_user(user, payload):
+    """Send one push notification, safe to call from a worker thread."""
+    webpush.send_user_notification(user=user, payload=payload, ttl=1000)
+
+
+def close_worker_connections(pool, workers):
+    """Close the DB connections the worker threads of pool opened, once they are done.
+
+    Only the thread that opened a connection may close it, so one job is queued per
+    worker and the jobs wait for each other to make sure each runs on its own thread."""
+    barrier = threading.Barrier(workers)
+
+    def close():
+        barrier.wait()
+        connections.close_all()
+
+    wait([pool.submit(close) for _ in range(workers)])
+
+
+def build_email_reminder(task, user):
+    """Return the reminder email for one task and recipient."""
+    due_str = timezone.localtime(task.due_date).strftime('%Y-%m-%d %H:%M')
+    return EmailMessage(
+        subject=f"Reminder: Task '{task.name}' is due soon!",
+        body=(
+            f"Hi {user.username},\n\n"
+            f"Your task \"{task.name}\" is due on {due_str}.\n\n"
+            "Don't forget to complete it."
+        ),
+        from_email='team1todo@gmail.com',
+        to=[user.email],
+    )
+
+
+def fire_time(due_date, notification_time):
+    """Return when the reminder of a task should go out."""
+    return due_date - timedelta(minutes=notification_time)
+
+
+class NotificationScheduler:
+    """Keeps upcoming reminder fire times in a min-heap so the daemon can sleep until the
+    next one instead of rescanning the task table.
+
+    Changes made by other processes are picked up by polling Task.updated_at. Outdated
+    heap entries are skipped when they reach the top rather than removed in place."""
+
+    # Overlap between polls so rows committed while a poll was running are not missed
+    POLL_OVERLAP = timedelta(seconds=5)
+
+    def __init__(self):
+        self.heap = []
+        self.scheduled = {}  # task id -> fire time of its live heap entry
+        self.last_poll = None
+
+    def __len__(self):
+        return len(self.scheduled)
+
+    def schedule(self, task_id, fire_at):
+        """Add or move a task's reminder, O(log n)."""
+        if self.scheduled.get(task_id) == fire_at:
+            return
+        self.scheduled[task_id] = fire_at
+        heapq.heappush(self.heap, (fire_at, task_id))
+
+    def unschedule(self, task_id):
+        """Forget a task's reminder, its heap entry is dropped lazily."""
+        self.scheduled.pop(task_id, None)
+
+    def load(self, tasks, now):
+        """(Re)schedule or unschedule the given task rows."""
+        rows = tasks.values_list(
+            'pk', 'due_date', 'notification_time', 'notifications_enabled', 'is_completed'
+        )
+        for task_id, due_date, minutes, enabled, completed in rows:
+            if enabled and not completed and due_date >= now:
+                self.schedule(task_id, fire_time(due_date, minutes))
+            else:
+                self.unschedule(task_id)
+
+    def seed(self, now):
+        """Load every upcoming reminder, done once when the daemon starts."""
+        self.last_poll = now
+        self.load(Task.objects.filter(
+            notifications_enabled=True,
+            is_completed=False,
+            due_date__gte=now,
+        ), now)
+
+    def poll(self, now):
+        """Pick up tasks saved since the previous poll."""
+        since = self.last_poll - self.POLL_OVERLAP
+        self.load(Task.objects.filter(updated_at__gte=since), now)
+        # advance only once loaded, so the next poll covers the changes of a failed one
+        self.last_poll = now
+
+    def next_fire_time(self):
+        """Return the earliest scheduled fire time, or None when nothing is scheduled."""
+        while self.heap:
+            fire_at, task_id = self.heap[0]
+            if self.scheduled.get(task_id) == fire_at:
+                return fire_at
+            heapq.heappop(self.heap)
+        return None
+
+    def pop_due(self, now):
+        """Remove and return the ids of every task whose reminder is due at now."""
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            fire_at, task_id = heapq.heappop(self.heap)
+            if self.scheduled.get(task_id) == fire_at:
+                del self.scheduled[task_id]
+                due.append(task_id)
+        return due
+
+    def dispatch(self, task_ids, now):
+        """Send the reminders of the given tasks on their chosen channel.
+
+        Tasks are re-checked against the database so deleted or changed ones are
+        skipped. Returns the number of reminders sent and the ids of the tasks whose
+        emails could not all be sent, to be tried again later."""
+        window = Task.objects.in_notification_window(now).filter(
+            pk__in=task_ids
+        ).select_related('creator').prefetch_related('assigned_users')
+        sent = 0
+
+        delivered = []
+        for task in window.filter(notification_type='push').with_deliveries('push'):
+            payload = build_push_payload(task)
+            for user in pending_recipients(task):
+                try:
+                    webpush.send_user_notification(user=user, payload=payload, ttl=1000)
+                    delivered.append((task, user))
+                except Exception as e:
+                    logger.error("Error notifying %s: %s", user.username, e)
+        record_deliveries(delivered, 'push')
+        sent += len(delivered)
+
+        outgoing = [
+            (task, user, build_email_reminder(task, user))
+            for task in window.filter(notification_type='email').with_deliveries('email')
+            for user in pending_recipients(task)
+            if user.email
+        ]
+        failed = set()
+        if outgoing:
+            # one message at a time so a refused address doesn't resend the others
+            delivered = []
+            mail_connection = get_connection()
+            try:
+                for task, user, message in outgoing:
+                    try:
+                        mail_connection.open()
+                        mail_connection.send_messages([message])
+                        delivered.append((task, user))
+                    except Exception as e:
+                        logger.error("Error emailing %s: %s", user.username, e)
+                        failed.add(task.pk)
+                        mail_connection.close()
+            finally:
+                mail_connection.close()
+            record_deliveries(delivered, 'email')
+            sent += len(delivered)
+
+        return sent, failed
@@ -0,0 +1,106 @@
+"""Keyset (cursor) pagination of the task lists.
+
+A page is the page_size rows that follow a cursor in (due_date, id) order, read with
+WHERE due_date >= d AND (due_date > d OR id > i) ... LIMIT page_size + 1. Unlike an
+OFFSET, the database seeks straight to the cursor in a (creator, due_date, id) index,
+so the last page of a long archive costs the same as the first. A list made of several
+querysets is paged by reading a page of each and merging them."""
+import base64
+import heapq
+from datetime import datetime
+from operator import attrgetter
+
+from django.conf import settings
+from django.db.models import Q
+
+# Name of the GET parameter holding the cursor of each task list
+CURSOR_PARAM = '{name}_after'
+PAGE_SIZE_PARAM = 'page_size'
+
+
+def encode_cursor(due_date, pk):
+    """Return the opaque cursor pointing just after the task with due_date and pk."""
+    raw = f'{due_date.isoformat()}|{pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return the (due_date, id) of a cursor, or None if it is missing or malformed."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        due_date, pk = raw.split('|')
+        return datetime.fromisoformat(due_date), int(pk)
+    except ValueError:
+        return None
+
+
+def get_page_size(params):
+    """Return the page size asked for in params, bounded by TASK_PAGE_SIZE_MAX, or the
+    TASK_PAGE_SIZE default."""
+    try:
+        page_size = int(params.get(PAGE_SIZE_PARAM, settings.TASK_PAGE_SIZE))
+    except ValueError:
+        page_size = settings.TASK_PAGE_SIZE
+    return min(max(page_size, 1), settings.TASK_PAGE_SIZE_MAX)
+
+
+class TaskPage:
+    """One page of a task list, iterable like the list it replaces in the templates.
+
+    Attributes:
+        tasks: the tasks of the page, in (due_date, id) order
+        next_query: query string of the next page, or None on the last page
+        first_query: query string of the first page, or None on the first page"""
+
+    def __init__(self, tasks, has_next, name, params, is_first):
+        self.tasks = tasks
+        self.has_next = has_next
+        self.next_query = None
+        self.first_query = None
+
+        cursor_param = CURSOR_PARAM.format(name=name)
+        if has_next:
+            query = params.copy()
+            query[cursor_param] = encode_cursor(tasks[-1].due_date, tasks[-1].pk)
+            self.next_query = query.urlencode()
+        if not is_first:
+            query = params.copy()
+            query.pop(cursor_param, None)
+            self.first_query = query.urlencode()
+
+    def __iter__(self):
+        return iter(self.tasks)
+
+    def __len__(self):
+        return len(self.tasks)
+
+
+def after_cursor(queryset, cursor):
+    """Return the rows of queryset that follow cursor, in (due_date, id) order.
+
+    The due_date >= bound is redundant but lets the database range scan the index."""
+    queryset = queryset.order_by('due_date', 'id')
+    if cursor is None:
+        return queryset
+    due_date, pk = cursor
+    return queryset.filter(
+        Q(due_date__gte=due_date) & (Q(due_date__gt=due_date) | Q(id__gt=pk))
+    )
+
+
+def keyset_page(querysets, name, params):
+    """Return the TaskPage of a list selected by the cursor of list name in params.
+
+    Parameters:
+    querysets: the disjoint querysets making up the list, without ordering or slicing
+    name: the list name the cursor parameter is named after
+    params: the request GET parameters"""
+    page_size = get_page_size(params)
+    cursor = decode_cursor(params.get(CURSOR_PARAM.format(name=name)))
+
+    # one extra row tells whether there is a next page without a COUNT
+    parts = [list(after_cursor(queryset, cursor)[:page_size + 1]) for queryset in querysets]
+    tasks = list(heapq.merge(*parts, key=attrgetter('due_date', 'pk')))[:page_size + 1]
+    return TaskPage(tasks[:page_size], len(tasks) > page_size, name, params, cursor is None)
@@ -0,0 +1,184 @@
+"""Quote of the day shown on the calendar page.
+
+The quote is cached until local midnight. After that the last good quote keeps being
+served while a background thread fetches the new one, so a slow upstream never blocks
+the page. Failed fetches are remembered for a few minutes so an outage does not make
+every request wait for the timeout again. Only the very first request of a process,
+with nothing cached, fetches inline.
+
+aget_today_quote is the same for async views: its inline fetch awaits aiohttp instead
+of blocking a thread on requests."""
+import asyncio
+import logging
+import threading
+from datetime import timedelta
+
+import aiohttp
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+QUOTE_KEY = 'zenquote_today'
+# Last good quote, kept without expiry so there is always something to serve
+STALE_QUOTE_KEY = 'zenquote_last'
+QUOTE_FAILED_KEY = 'zenquote_failed'
+QUOTE_REFRESH_LOCK_KEY = 'zenquote_refreshing'
+
+QUOTE_FAILURE_TIMEOUT = 60 * 5
+QUOTE_UNAVAILABLE = "Could not fetch today's quote."
+
+
+class ZenQuotesProvider:
+    """Fetches today's quote from the ZenQuotes API."""
+    url = 'https://zenquotes.io/api/today/'
+    timeout = 5
+
+    def fetch(self):
+        """Return today's quote as pre-formatted html."""
+        response = requests.get(self.url, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()[0]["h"]
+
+    async def afetch(self):
+        """Return today's quote as pre-formatted html without blocking the event loop."""
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            async with session.get(self.url, raise_for_status=True) as response:
+                data = await response.json(content_type=None)
+        return data[0]["h"]
+
+
+class FixtureQuoteProvider:
+    """Offline provider for tests and local development, one fixed quote per day."""
+    quotes = [
+        ("The secret of getting ahead is getting started.", "Mark Twain"),
+        ("Well begun is half done.", "Aristotle"),
+        ("It always seems impossible until it's done.", "Nelson Mandela"),
+    ]
+
+    def fetch(self):
+        """Return the quote of the local day in the ZenQuotes html format."""
+        text, author = self.quotes[timezone.localdate().toordinal() % len(self.quotes)]
+        return (
+            f'<blockquote>&ldquo;{text}&rdquo; &mdash; <footer>{author}</footer>'
+            '</blockquote>'
+        )
+
+    async def afetch(self):
+        """Return the quote of the local day, see fetch."""
+        return self.fetch()
+
+
+QUOTE_PROVIDERS = {
+    'zenquotes': ZenQuotesProvider,
+    'fixture': FixtureQuoteProvider,
+}
+
+
+def get_quote_provider():
+    """Return the provider configured by QUOTE_PROVIDER ('zenquotes' or 'fixture')."""
+    return QUOTE_PROVIDERS[settings.QUOTE_PROVIDER]()
+
+
+def seconds_until_midnight(now=None):
+    """Return the seconds left until the next local midnight, when the quote changes."""
+    local_now = timezone.localtime(now)
+    midnight = (local_now + timedelta(days=1)).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+    return max(int((midnight - local_now).total_seconds()), 1)
+
+
+# What a failed fetch can raise, from either HTTP client or a malformed response
+FETCH_ERRORS = (
+    requests.exceptions.RequestException, aiohttp.ClientError, asyncio.TimeoutError,
+    ValueError, KeyError, IndexError,
+)
+
+
+def refresh_quote():
+    """Fetch today's quote and cache it, returning None if the fetch failed."""
+    try:
+        quote = get_quote_provider().fetch()
+    except FETCH_ERRORS as e:
+        logger.warning("Could not fetch today's quote: %s", e)
+        cache.set(QUOTE_FAILED_KEY, True, timeout=QUOTE_FAILURE_TIMEOUT)
+        return None
+
+    cache.set(QUOTE_KEY, quote, timeout=seconds_until_midnight())
+    cache.set(STALE_QUOTE_KEY, quote, timeout=None)
+    return quote
+
+
+async def arefresh_quote():
+    """Async version of refresh_quote."""
+    try:
+        quote = await get_quote_provider().afetch()
+    except FETCH_ERRORS as e:
+        logger.warning("Could not fetch today's quote: %s", e)
+        await cache.aset(QUOTE_FAILED_KEY, True, timeout=QUOTE_FAILURE_TIMEOUT)
+        return None
+
+    await cache.aset(QUOTE_KEY, quote, timeout=seconds_until_midnight())
+    await cache.aset(STALE_QUOTE_KEY, quote, timeout=None)
+    return quote
+
+
+def _refresh_and_unlock():
+    """Refresh the quote on a background thread, then release the lock and close the
+    database connections a database cache opened on the thread."""
+    try:
+        refresh_quote()
+    finally:
+        try:
+            cache.delete(QUOTE_REFRESH_LOCK_KEY)
+        finally:
+            connections.close_all()
+
+
+def refresh_in_background():
+    """Start a thread refreshing the quote unless one is running or upstream is down."""
+    if cache.get(QUOTE_FAILED_KEY):
+        return None
+    if not cache.add(QUOTE_REFRESH_LOCK_KEY, True, timeout=ZenQuotesProvider.timeout * 2):
+        return None
+    thread = threading.Thread(target=_refresh_and_unlock, daemon=True)
+    thread.start()
+    return thread
+
+
+def get_today_quote():
+    """Return today's quote, the last good one while it is refreshed, or a fallback."""
+    quote = cache.get(QUOTE_KEY)
+    if quote:
+        return quote
+
+    stale = cache.get(STALE_QUOTE_KEY)
+    if stale:
+        refresh_in_background()
+        return stale
+
+    if cache.get(QUOTE_FAILED_KEY):
+        return QUOTE_UNAVAILABLE
+    return refresh_quote() or QUOTE_UNAVAILABLE
+
+
+async def aget_today_quote():
+    """Async version of get_today_quote."""
+    quote = await cache.aget(QUOTE_KEY)
+    if quote:
+        return quote
+
+    stale = await cache.aget(STALE_QUOTE_KEY)
+    if stale:
+        await sync_to_async(refresh_in_background)()
+        return stale
+
+    if await cache.aget(QUOTE_FAILED_KEY):
+        return QUOTE_UNAVAILABLE
+    return await arefresh_quote() or QUOTE_UNAVAILABLE
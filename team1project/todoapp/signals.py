@@ -0,0 +1,322 @@
+"""Signal receivers that keep the per-user task versions and the category version in
+todoapp.caching current, the updated_at stamps and tombstones read by the delta sync
+in todoapp.sync, the subtask and collaborator counters of Task, and the username
+search index in step with the user table. They also publish the live collaboration
+events of todoapp.events.
+
+The counters are changed in place with F() in the transaction of the change they
+count. Bulk paths without signals, QuerySet.update() and bulk_create(), leave them to
+the recount_task_counters command."""
+# pylint: disable=W0613
+from collections import Counter, defaultdict
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db.models import F
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_migrate, post_save, pre_delete, pre_save,
+)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .caching import bump_category_version, bump_task_version, task_version_bumps_suspended
+from .events import publish
+from .models import (
+    Category, SubTask, SyncTombstone, Task, TaskCollabRequest, TaskProgress, UserSearchIndex,
+)
+from .user_search import bump_user_search_version, normalize_username
+
+User = get_user_model()
+
+
+def task_user_ids(task_ids):
+    """Return the ids of every creator and assigned user of the given tasks."""
+    return Task.objects.filter(pk__in=task_ids).user_ids()
+
+
+def touch_tasks(task_ids):
+    """Stamp updated_at of tasks whose many-to-many fields changed, which save() does
+    not see, so the delta sync sends them again."""
+    Task.objects.filter(pk__in=task_ids).update(updated_at=timezone.now())
+
+
+def count_subtasks(task_id, subtasks, done):
+    """Add to the subtask counters of a task and stamp it for the delta sync."""
+    changes = {}
+    if subtasks:
+        changes['subtask_count'] = F('subtask_count') + subtasks
+    if done:
+        changes['subtask_done_count'] = F('subtask_done_count') + done
+    if changes:
+        Task.objects.filter(pk=task_id).update(updated_at=timezone.now(), **changes)
+
+
+def count_collaborators(task_ids, sign):
+    """Add sign to collaborator_count of a task for each time it is in task_ids, with
+    one UPDATE per distinct amount."""
+    by_amount = defaultdict(list)
+    for task_id, times in Counter(task_ids).items():
+        by_amount[times].append(task_id)
+    for times, ids in by_amount.items():
+        Task.objects.filter(pk__in=ids).update(
+            collaborator_count=F('collaborator_count') + sign * times
+        )
+
+
+def stored_subtask(instance):
+    """Lock the stored row of a subtask and return its (task_id, is_completed), what
+    the counters hold it as, or None if it is not stored yet."""
+    if instance.pk is None:
+        return None
+    return SubTask.objects.select_for_update().filter(pk=instance.pk).values_list(
+        'task_id', 'is_completed'
+    ).first()
+
+
+@receiver(post_save, sender=Task)
+def task_saved(sender, instance, **kwargs):
+    """A saved task changes what its creator and collaborators see."""
+    bump_task_version(*task_user_ids([instance.pk]))
+
+
+@receiver(pre_delete, sender=Task)
+def task_deleting(sender, instance, **kwargs):
+    """Remember who could see the task, its assignments are gone by post_delete, and
+    leave them a tombstone of it. Bulk deletes record their tombstones themselves."""
+    if task_version_bumps_suspended():
+        return
+    instance.affected_user_ids = task_user_ids([instance.pk])
+    SyncTombstone.objects.record(
+        SyncTombstone.TASK, [(instance.pk, user_id) for user_id in instance.affected_user_ids]
+    )
+
+
+@receiver(post_delete, sender=Task)
+def task_deleted(sender, instance, **kwargs):
+    """A deleted task changes what its creator and collaborators see."""
+    if task_version_bumps_suspended():
+        return
+    bump_task_version(instance.creator_id, *getattr(instance, 'affected_user_ids', ()))
+
+
+@receiver(m2m_changed, sender=Task.assigned_users.through)
+def task_assignments_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Adding or removing collaborators changes the task lists of everyone involved.
+    Removed collaborators get a tombstone of the task, which left their lists."""
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+
+    if reverse:
+        # instance is a user and pk_set holds task ids
+        task_ids = pk_set or set(instance.assigned_tasks.values_list('pk', flat=True))
+        user_ids = {instance.pk}
+    else:
+        task_ids = {instance.pk}
+        user_ids = pk_set or set(instance.assigned_users.values_list('pk', flat=True))
+    affected = task_user_ids(task_ids) | user_ids
+    bump_task_version(*affected)
+
+    touch_tasks(task_ids)
+    if action != 'post_add':
+        SyncTombstone.objects.record(
+            SyncTombstone.TASK, [(task_id, user_id) for task_id in task_ids for user_id in user_ids]
+        )
+    publish(affected, 'collaborators_changed', {
+        'tasks': sorted(task_ids),
+        'added' if action == 'post_add' else 'removed': sorted(user_ids),
+    })
+
+
+@receiver(m2m_changed, sender=Task.assigned_users.through)
+def task_collaborators_counted(sender, instance, action, reverse, pk_set, **kwargs):
+    """Keep collaborator_count in step with the assignments. pk_set of a removal may
+    name objects that were not assigned, so the rows removed are looked up before."""
+    if action == 'post_add':
+        count_collaborators(pk_set if reverse else [instance.pk] * len(pk_set), 1)
+    elif action in ('pre_remove', 'pre_clear'):
+        assignments = sender.objects.filter(**{'user' if reverse else 'task': instance})
+        if action == 'pre_remove':
+            assignments = assignments.filter(
+                **{'task_id__in' if reverse else 'user_id__in': pk_set}
+            )
+        instance.removed_assignments = list(assignments.values_list('task_id', flat=True))
+    elif action in ('post_remove', 'post_clear'):
+        count_collaborators(instance.removed_assignments, -1)
+        del instance.removed_assignments
+
+
+@receiver(m2m_changed, sender=Task.categories.through)
+def task_categories_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Category changes affect filtered views of everyone who can see the task."""
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+
+    if reverse:
+        # instance is a category and pk_set holds task ids
+        task_ids = pk_set or set(instance.tasks.values_list('pk', flat=True))
+    else:
+        task_ids = [instance.pk]
+    bump_task_version(*task_user_ids(task_ids))
+    touch_tasks(task_ids)
+
+
+@receiver(pre_save, sender=SubTask)
+def subtask_saving(sender, instance, raw, **kwargs):
+    """Remember what the counters hold the subtask as, SubTask.save runs in a
+    transaction that keeps the row locked until subtask_counted."""
+    if not raw:
+        instance.counted_as = stored_subtask(instance)
+
+
+@receiver(post_save, sender=SubTask)
+def subtask_counted(sender, instance, raw, **kwargs):
+    """Count a new subtask in its task, or move a saved one to its new task or
+    completion state."""
+    if raw:
+        return
+    done = int(instance.is_completed)
+    counted_as = instance.counted_as
+    if counted_as is None:
+        count_subtasks(instance.task_id, 1, done)
+    elif counted_as[0] == instance.task_id:
+        count_subtasks(instance.task_id, 0, done - counted_as[1])
+    else:
+        count_subtasks(counted_as[0], -1, -counted_as[1])
+        count_subtasks(instance.task_id, 1, done)
+
+
+@receiver(post_save, sender=SubTask)
+def subtask_saved(sender, instance, **kwargs):
+    """Subtasks are part of what the creator and collaborators of their task see."""
+    if task_version_bumps_suspended():
+        return
+    bump_task_version(*task_user_ids([instance.task_id]))
+
+
+@receiver(pre_delete, sender=SubTask)
+def subtask_deleting(sender, instance, origin=None, **kwargs):
+    """A subtask deleted on its own, not with its task, leaves the task counters.
+
+    The stored row is read, the instance may hold an older completion state."""
+    if isinstance(origin, SubTask) or getattr(origin, 'model', None) is SubTask:
+        counted_as = stored_subtask(instance)
+        if counted_as is not None:
+            count_subtasks(counted_as[0], -1, -counted_as[1])
+
+
+@receiver(post_delete, sender=SubTask)
+def subtask_deleted(sender, instance, **kwargs):
+    """A deleted subtask leaves a tombstone for everyone who could see its task.
+
+    Subtasks deleted with their task by a bulk delete are skipped, clients drop them
+    with the task."""
+    if task_version_bumps_suspended():
+        return
+    user_ids = task_user_ids([instance.task_id])
+    bump_task_version(*user_ids)
+    SyncTombstone.objects.record(
+        SyncTombstone.SUBTASK, [(instance.pk, user_id) for user_id in user_ids]
+    )
+
+
+@receiver(m2m_changed, sender=SubTask.assigned_users.through)
+def subtask_assignments_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Subtask assignments are shown to everyone who can see the task."""
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+
+    if reverse:
+        # instance is a user and pk_set holds subtask ids
+        subtasks = SubTask.objects.filter(pk__in=pk_set) if pk_set else instance.assigned_subtasks
+        subtask_ids = subtasks.values('pk')
+        task_ids = subtasks.values('task_id')
+    else:
+        subtask_ids = [instance.pk]
+        task_ids = [instance.task_id]
+    bump_task_version(*task_user_ids(task_ids))
+    SubTask.objects.filter(pk__in=subtask_ids).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=TaskCollabRequest)
+def collab_request_saved(sender, instance, created, **kwargs):
+    """Requests show up for the user who sent them and the user they were sent to."""
+    bump_task_version(instance.from_user_id, instance.to_user_id)
+    if created:
+        publish([instance.from_user_id, instance.to_user_id], 'request_created', {
+            'id': instance.pk,
+            'task': instance.task_id,
+            'from_user': instance.from_user_id,
+            'to_user': instance.to_user_id,
+        })
+
+
+@receiver(post_delete, sender=TaskCollabRequest)
+def collab_request_deleted(sender, instance, **kwargs):
+    """Accepted, declined and withdrawn requests leave a tombstone for both users."""
+    bump_task_version(instance.from_user_id, instance.to_user_id)
+    SyncTombstone.objects.record(
+        SyncTombstone.REQUEST,
+        [(instance.pk, instance.from_user_id), (instance.pk, instance.to_user_id)],
+    )
+    publish([instance.from_user_id, instance.to_user_id], 'request_closed',
+            {'id': instance.pk, 'task': instance.task_id})
+
+
+@receiver(post_save, sender=TaskProgress)
+def task_progress_saved(sender, instance, **kwargs):
+    """Progress reported on a task is pushed to everyone working on it."""
+    publish(task_user_ids([instance.task_id]), 'progress', {
+        'task': instance.task_id,
+        'user': instance.user_id,
+        'progress': instance.progress,
+    })
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, **kwargs):
+    """Categories are shared by every user, so they have a version of their own."""
+    bump_category_version()
+
+
+@receiver(pre_delete, sender=Category)
+def category_deleting(sender, instance, **kwargs):
+    """Deleting a category also takes it off its tasks, without an m2m_changed signal."""
+    bump_category_version()
+    task_ids = set(instance.tasks.values_list('pk', flat=True))
+    bump_task_version(*task_user_ids(task_ids))
+    touch_tasks(task_ids)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    """Index new users and renames, skipping saves like login that keep the username."""
+    if not created and update_fields is not None and 'username' not in update_fields:
+        return
+    UserSearchIndex.objects.update_or_create(
+        user=instance, defaults={'username_key': normalize_username(instance.username)}
+    )
+    bump_user_search_version()
+
+
+@receiver(pre_delete, sender=User)
+def user_deleting(sender, instance, **kwargs):
+    """The assignments of a deleted user go without an m2m_changed signal, the other
+    members of their tasks see the collaborator leave."""
+    tasks = Task.objects.filter(assigned_users=instance)
+    user_ids = tasks.user_ids() - {instance.pk}
+    tasks.update(collaborator_count=F('collaborator_count') - 1, updated_at=timezone.now())
+    bump_task_version(*user_ids)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    """The index row goes with the user, drop the cached results that listed them."""
+    bump_user_search_version()
+
+
+@receiver(post_migrate)
+def create_cache_table(sender, using, verbosity=1, **kwargs):
+    """Create the table of a database cache backend along with the app's tables, so
+    migrate is all a deployment on the shared 'database' cache needs."""
+    if sender.name == 'todoapp':
+        call_command('createcachetable', database=using, verbosity=verbosity)
@@ -0,0 +1,392 @@
+"""Builds the context sent to the task suggestion model and runs suggestion jobs.
+
+The context only covers the user's most recent tasks and is capped to a token budget, so
+its size and cost stay flat however many tasks the user has. The tasks are loaded into
+lightweight snapshots cached against the user's task version and reloaded only after
+their tasks change.
+
+Suggestions come from the engine selected by TASK_SUGGESTION_ENGINE. The remote engine
+asks the model and takes seconds, so it runs on a background thread pool instead of
+inside the request. The pattern engine works offline from the user's due dates and
+categories and runs inline. Job state is kept in the cache where the polling endpoint
+reads it, and finished suggestions are cached per user and task set. A poll may reach
+another worker than the one running the job, so the cache has to be shared by the
+workers, which the todoapp.W001 check warns about."""
+# pylint: disable=W0603, W0718
+import functools
+import hashlib
+import json
+import logging
+import re
+import statistics
+import threading
+import uuid
+from collections import Counter, defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.utils import timezone
+from openai import OpenAI
+
+from .caching import get_task_version
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+# Most recent tasks considered for a suggestion
+PROMPT_CONTEXT_TASKS = 25
+# Rough upper bound on the tokens spent on the user's tasks
+PROMPT_TOKEN_BUDGET = 1500
+# Characters of each description kept in the prompt
+DESCRIPTION_LIMIT = 200
+PROMPT_CONTEXT_TIMEOUT = 60 * 60
+
+SUGGESTION_JOB_KEY = 'suggestion_job:{job_id}'
+# Latest job of a user, so reloading the page does not start another model call
+USER_SUGGESTION_JOB_KEY = 'suggestion_job_user:{user_id}'
+SUGGESTION_JOB_TIMEOUT = 60 * 10
+
+# Finished suggestions, keyed by the hash of the tasks they were generated from
+SUGGESTION_CACHE_KEY = 'suggestion:{engine}:{user_id}:{task_hash}'
+SUGGESTION_CACHE_TIMEOUT = 60 * 60 * 6
+
+# What the engines need to know about a task, categories is a sorted tuple of names
+TaskSnapshot = namedtuple('TaskSnapshot', 'name description due_date categories')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def estimate_tokens(text):
+    """Estimate the token count of text (about four characters per token for English)."""
+    return len(text) // 4 + 1
+
+
+def recent_task_snapshots(user, limit=PROMPT_CONTEXT_TASKS):
+    """Return snapshots of the user's most recent tasks, newest first.
+
+    Costs two queries on a cache miss (tasks and their categories) and none on a hit."""
+    key = f'task_snapshots:{user.id}:{get_task_version(user.id)}:{limit}'
+    snapshots = cache.get(key)
+    if snapshots is not None:
+        return snapshots
+
+    tasks = Task.objects.filter(creator=user).order_by('-id').prefetch_related(
+        'categories'
+    )[:limit]
+    snapshots = [
+        TaskSnapshot(
+            name=task.name,
+            description=task.description[:DESCRIPTION_LIMIT],
+            due_date=task.due_date,
+            categories=tuple(sorted(c.name for c in task.categories.all())),
+        )
+        for task in tasks
+    ]
+    cache.set(key, snapshots, timeout=PROMPT_CONTEXT_TIMEOUT)
+    return snapshots
+
+
+def task_set_hash(tasks):
+    """Return a digest identifying a list of task snapshots."""
+    return hashlib.blake2b(repr(tuple(tasks)).encode(), digest_size=16).hexdigest()
+
+
+def format_task(task):
+    """Return the prompt lines describing one task snapshot."""
+    return (
+        f"Task: {task.name}\n"
+        f"Description: {task.description}\n"
+        f"Due Date: {task.due_date.isoformat() if task.due_date else None}\n"
+        f"Categories: {', '.join(task.categories)}"
+    )
+
+
+def format_context(tasks, token_budget=PROMPT_TOKEN_BUDGET):
+    """Return the snapshots formatted for the prompt, cut to the token budget."""
+    entries = []
+    used = 0
+    for task in tasks:
+        entry = format_task(task)
+        cost = estimate_tokens(entry)
+        if used + cost > token_budget:
+            break
+        entries.append(entry)
+        used += cost
+    return "\n".join(entries)
+
+
+def build_prompt_context(user, limit=PROMPT_CONTEXT_TASKS, token_budget=PROMPT_TOKEN_BUDGET):
+    """Return the user's recent tasks formatted for the prompt, or '' if they have none."""
+    return format_context(recent_task_snapshots(user, limit), token_budget)
+
+
+def build_prompt(context):
+    """Return the user prompt asking the model for a task based on the context."""
+    return f"""
+    Based on the user's previous tasks and patterns, suggest a new task.
+    Return **only** a JSON object with keys: name, description, due_date, categories.
+
+    User's Tasks:
+    {context}
+    """
+
+
+def request_suggestion(client, context):
+    """Ask the model for a suggestion and return it as a dict.
+
+    Raises json.JSONDecodeError if the model does not answer with JSON."""
+    resp = client.chat.completions.create(
+        model="gpt-4",
+        messages=[
+            {"role":"system","content":"You are an intelligent task suggestion assistant."},
+            {"role":"user","content":build_prompt(context)}
+        ],
+        max_tokens=300,
+        temperature=0.7,
+    )
+    content = resp.choices[0].message.content.strip()
+    return json.loads(content)
+
+
+class LocalSuggestionClient:
+    """Offline stand-in for the OpenAI client used in tests and local development.
+
+    It exposes the same chat.completions.create call and suggests a follow-up of the
+    user's most recent task in their most used category."""
+
+    def __init__(self):
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, messages, **kwargs):
+        """Return an OpenAI shaped response built from the tasks in the prompt."""
+        prompt = messages[-1]['content']
+        names = re.findall(r'^\s*Task: (.*)$', prompt, re.MULTILINE)
+        categories = Counter(
+            name.strip()
+            for line in re.findall(r'^\s*Categories: (.*)$', prompt, re.MULTILINE)
+            for name in line.split(',')
+            if name.strip()
+        )
+
+        latest = names[0] if names else 'your tasks'
+        suggestion = {
+            'name': f'Follow up on {latest}',
+            'description': f'Review how "{latest}" went and plan the next step.',
+            'due_date': (timezone.now() + timedelta(days=7)).isoformat(),
+            'categories': [name for name, _ in categories.most_common(1)],
+        }
+        message = SimpleNamespace(content=json.dumps(suggestion))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+@functools.lru_cache(maxsize=None)
+def _build_client(kind, api_key):
+    """Create a suggestion client, memoized so its HTTP connection pool is reused."""
+    if kind == 'local':
+        return LocalSuggestionClient()
+    return OpenAI(api_key=api_key)
+
+
+def get_suggestion_client():
+    """Return the shared client configured by TASK_SUGGESTION_CLIENT ('openai' or 'local')."""
+    return _build_client(settings.TASK_SUGGESTION_CLIENT, settings.OPENAI_TASK_SUGGESTION)
+
+
+class SuggestionEngine:
+    """Base class of the suggestion backends selectable with TASK_SUGGESTION_ENGINE."""
+    name = None
+    # Recent tasks the engine looks at
+    history = PROMPT_CONTEXT_TASKS
+    # Remote engines run on the thread pool, local ones inside the request
+    remote = False
+
+    def suggest(self, tasks):
+        """Return a suggestion dict with name, description, due_date and categories
+        for the task snapshots, which are ordered newest first."""
+        raise NotImplementedError
+
+
+class RemoteSuggestionEngine(SuggestionEngine):
+    """Asks the configured model client for a suggestion."""
+    name = 'remote'
+    remote = True
+
+    def suggest(self, tasks):
+        return request_suggestion(get_suggestion_client(), format_context(tasks))
+
+
+class PatternSuggestionEngine(SuggestionEngine):
+    """Offline engine that finds the task the user repeats most regularly.
+
+    Tasks are grouped by their set of categories and the gaps between their due dates
+    are compared to the median gap. The group with the most regular gaps wins and its
+    next occurrence is suggested. Without any recurrence it falls back to following up
+    the latest task."""
+    name = 'pattern'
+    history = 100
+    # A gap may differ from the median gap by this fraction and still count as regular
+    TOLERANCE = 0.25
+
+    def suggest(self, tasks):
+        now = timezone.now()
+        best = None
+        for categories, group in self.group_by_categories(tasks).items():
+            dates = sorted(task.due_date for task in group)
+            gaps = [later - earlier for earlier, later in zip(dates, dates[1:])]
+            if not gaps:
+                continue
+            step = statistics.median(gaps)
+            if step <= timedelta(0):
+                continue
+
+            regular = sum(abs(gap - step) <= step * self.TOLERANCE for gap in gaps)
+            if regular and (best is None or (regular, len(group)) > best[0]):
+                best = ((regular, len(group)), categories, group, dates[-1], step)
+
+        if best is None:
+            return self.follow_up(tasks, now)
+
+        _, categories, group, last_due, step = best
+        next_due = last_due + step
+        if next_due < now:
+            next_due += step * ((now - next_due) // step + 1)
+
+        # most repeated name, ties go to the newest task
+        name = Counter(task.name for task in group).most_common(1)[0][0]
+        return {
+            'name': name,
+            'description': f'You usually do this every {self.describe(step)}.',
+            'due_date': next_due.isoformat(),
+            'categories': list(categories),
+        }
+
+    @staticmethod
+    def group_by_categories(tasks):
+        """Return the tasks with a due date grouped by their categories."""
+        groups = defaultdict(list)
+        for task in tasks:
+            if task.due_date:
+                groups[task.categories].append(task)
+        return groups
+
+    @staticmethod
+    def follow_up(tasks, now):
+        """Suggest following up the latest task in the most used category."""
+        latest = tasks[0].name if tasks else 'your tasks'
+        categories = Counter(name for task in tasks for name in task.categories)
+        return {
+            'name': f'Follow up on {latest}',
+            'description': f'Review how "{latest}" went and plan the next step.',
+            'due_date': (now + timedelta(days=7)).isoformat(),
+            'categories': [name for name, _ in categories.most_common(1)],
+        }
+
+    @staticmethod
+    def describe(step):
+        """Return a gap as a short human readable duration."""
+        if step >= timedelta(days=1):
+            days = round(step / timedelta(days=1))
+            return f'{days} day{"s" if days != 1 else ""}'
+        hours = max(round(step / timedelta(hours=1)), 1)
+        return f'{hours} hour{"s" if hours != 1 else ""}'
+
+
+SUGGESTION_ENGINES = {
+    engine.name: engine for engine in (RemoteSuggestionEngine, PatternSuggestionEngine)
+}
+
+
+def get_suggestion_engine():
+    """Return the engine configured by TASK_SUGGESTION_ENGINE ('remote' or 'pattern')."""
+    return SUGGESTION_ENGINES[settings.TASK_SUGGESTION_ENGINE]()
+
+
+def get_executor():
+    """Return the thread pool running suggestion jobs, created on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.TASK_SUGGESTION_WORKERS,
+                thread_name_prefix='task-suggestion',
+            )
+    return _executor
+
+
+def set_job_state(job_id, user_id, state):
+    """Store the state of a job for the polling endpoint."""
+    state['user_id'] = user_id
+    cache.set(SUGGESTION_JOB_KEY.format(job_id=job_id), state, timeout=SUGGESTION_JOB_TIMEOUT)
+
+
+def run_suggestion_job(job_id, user_id, engine, tasks, suggestion_key):
+    """Run the engine for one job, store the outcome and cache a successful suggestion.
+
+    May run on a worker thread, so it does not touch the database."""
+    try:
+        suggestion = engine.suggest(tasks)
+        cache.set(suggestion_key, suggestion, timeout=SUGGESTION_CACHE_TIMEOUT)
+        state = {'status': 'done', 'suggestion': suggestion}
+    except Exception:
+        logger.exception("Task suggestion job %s failed", job_id)
+        state = {'status': 'failed'}
+    set_job_state(job_id, user_id, state)
+
+
+def run_background_job(*args):
+    """Run a suggestion job on the thread pool, then close the database connections a
+    database cache opened on the pool thread."""
+    try:
+        run_suggestion_job(*args)
+    finally:
+        connections.close_all()
+
+
+def get_suggestion_job(job_id, user=None):
+    """Return the state of a job, or None if it expired or belongs to another user."""
+    state = cache.get(SUGGESTION_JOB_KEY.format(job_id=job_id))
+    if state is None or (user is not None and state['user_id'] != user.id):
+        return None
+    return state
+
+
+def start_suggestion_job(user):
+    """Start a suggestion for the user and return the job id without waiting for the model.
+
+    A job that is still running for the user is reused, and a suggestion cached for the
+    same set of tasks finishes the job at once. Returns None when the user has no tasks
+    to base a suggestion on."""
+    running = cache.get(USER_SUGGESTION_JOB_KEY.format(user_id=user.id))
+    if running is not None:
+        state = get_suggestion_job(running, user)
+        if state is not None and state['status'] == 'pending':
+            return running
+
+    engine = get_suggestion_engine()
+    tasks = recent_task_snapshots(user, engine.history)
+    if not tasks:
+        return None
+
+    job_id = uuid.uuid4().hex
+    suggestion_key = SUGGESTION_CACHE_KEY.format(
+        engine=engine.name, user_id=user.id, task_hash=task_set_hash(tasks)
+    )
+    suggestion = cache.get(suggestion_key)
+    if suggestion is not None:
+        set_job_state(job_id, user.id, {'status': 'done', 'suggestion': suggestion})
+        return job_id
+
+    if not engine.remote:
+        run_suggestion_job(job_id, user.id, engine, tasks, suggestion_key)
+        return job_id
+
+    set_job_state(job_id, user.id, {'status': 'pending'})
+    cache.set(USER_SUGGESTION_JOB_KEY.format(user_id=user.id), job_id,
+              timeout=SUGGESTION_JOB_TIMEOUT)
+    get_executor().submit(run_background_job, job_id, user.id, engine, tasks, suggestion_key)
+    return job_id
@@ -0,0 +1,100 @@
+"""Delta sync: what changed in a user's tasks, subtasks and collaboration requests since
+a sync token.
+
+A token is the time the previous sync was read, minus SYNC_TOKEN_OVERLAP seconds.
+Changed rows are found on their updated_at columns and deletions in SyncTombstone,
+each through an index that starts with the user or the timestamp, so a poll reads
+the rows that changed rather than every task the user has.
+
+Assignments travel with their task or subtask: changing them stamps its updated_at,
+and a user taken off a task gets a tombstone for it. Adding, completing or deleting a
+subtask stamps its task as well, whose counters changed. The subtasks of every changed
+task are sent in full, which covers a user who just joined a task with old subtasks,
+and clients drop the subtasks of a deleted task with it."""
+# disabling django specific errors such as class has no "object" member
+# pylint: disable=E1101
+import base64
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from .models import SubTask, SyncTombstone, Task, TaskCollabRequest
+
+
+def encode_token(moment):
+    """Return the opaque sync token of a point in time."""
+    return base64.urlsafe_b64encode(moment.isoformat().encode()).decode().rstrip('=')
+
+
+def decode_token(token):
+    """Return the point in time of a sync token.
+
+    Raises ValueError if the token is malformed."""
+    raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+    moment = datetime.fromisoformat(raw)
+    if timezone.is_naive(moment):
+        raise ValueError('Sync token without a timezone')
+    return moment
+
+
+def token_expired(since, now):
+    """Return True if deletions made after since may already have been pruned."""
+    return since < now - timedelta(days=settings.SYNC_TOMBSTONE_DAYS)
+
+
+def changed_tasks(user, since):
+    """Return the querysets of the tasks the user created and the tasks shared with
+    them, changed after since (all of them if since is None)."""
+    owned = Task.objects.filter(creator=user)
+    shared = Task.objects.filter(assigned_users=user).exclude(creator=user)
+    if since is None:
+        return owned, shared
+    return owned.filter(updated_at__gt=since), shared.filter(updated_at__gt=since)
+
+
+def changed_subtasks(user, since, tasks):
+    """Return the subtasks of tasks the user can see changed after since, and every
+    subtask of the changed tasks, given as the querysets returned by changed_tasks."""
+    # checked per subtask, so changed subtasks are found on their updated_at index
+    # instead of going through every task the user can see
+    assigned = Task.assigned_users.through.objects.filter(task=OuterRef('task_id'), user=user)
+    visible = Q(task__creator=user) | Exists(assigned)
+    if since is None:
+        return SubTask.objects.filter(visible)
+    of_changed_tasks = Q()
+    for queryset in tasks:
+        of_changed_tasks |= Q(task__in=queryset.values('pk'))
+    return SubTask.objects.filter(of_changed_tasks | (visible & Q(updated_at__gt=since)))
+
+
+def changed_requests(user, since):
+    """Return the collaboration requests sent to or by the user changed after since."""
+    requests = TaskCollabRequest.objects.filter(Q(to_user=user) | Q(from_user=user))
+    if since is None:
+        return requests
+    return requests.filter(updated_at__gt=since)
+
+
+def deleted_ids(user, since, current):
+    """Return {kind: [ids]} of what the user has to drop: the objects deleted or taken
+    off their lists after since.
+
+    current maps each kind to the ids being sent as changed, which are visible again
+    and win over an older tombstone, e.g. for a user removed from a task and added back."""
+    deleted = {kind: [] for kind, _ in SyncTombstone.KINDS}
+    if since is None:
+        return deleted
+    tombstones = SyncTombstone.objects.filter(user=user, deleted_at__gt=since)
+    for kind, object_id in tombstones.values_list('kind', 'object_id').distinct():
+        if object_id not in current[kind]:
+            deleted[kind].append(object_id)
+    for ids in deleted.values():
+        ids.sort()
+    return deleted
+
+
+def next_token(now):
+    """Return the token the client sends with its next sync."""
+    return encode_token(now - timedelta(seconds=settings.SYNC_TOKEN_OVERLAP))
@@ -0,0 +1,490 @@
+"""Tests for the JSON API: sparse fields, cursor pagination, ETags, writes, delta sync
+and live events"""
+
+import json
+from datetime import timedelta
+from django.core.cache import cache
+from django.db import connection
+from asgiref.sync import async_to_sync
+from django.test import AsyncClient, TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from todoapp import sync
+from todoapp.caching import get_category_version, get_task_version
+from todoapp.events import get_broker
+from todoapp.models import (
+    Category, SubTask, SyncTombstone, Task, TaskCollabRequest, TaskProgress, User,
+)
+
+
+class ApiTestCase(TestCase):
+    """Log in a user with a few tasks, one of them shared with another user"""
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username='apiuser', password='password123')
+        self.other = User.objects.create_user(username='apiother', password='password123')
+        self.client.login(username='apiuser', password='password123')
+
+        self.category = Category.objects.create(name='Work')
+        now = timezone.now()
+        self.tasks = [
+            Task.objects.create(name=f"Task {i}", description="Details", creator=self.user,
+                                due_date=now + timedelta(days=i + 1))
+            for i in range(3)
+        ]
+        self.tasks[0].categories.add(self.category)
+        self.shared = Task.objects.create(name="Shared", description="Details",
+                                          creator=self.other, due_date=now + timedelta(hours=36))
+        self.shared.assigned_users.add(self.user)
+        self.foreign = Task.objects.create(name="Foreign", description="Details",
+                                           creator=self.other, due_date=now + timedelta(days=1))
+
+    def send(self, method, url, data):
+        """Send a JSON body with method to url"""
+        return getattr(self.client, method)(url, data=json.dumps(data),
+                                            content_type='application/json')
+
+
+class TaskApiTests(ApiTestCase):
+    """Tests for reading and writing tasks through the API"""
+
+    def test_requires_login(self):
+        """Anonymous requests get a 401 instead of a login redirect"""
+        self.client.logout()
+        response = self.client.get(reverse('api_task_list'))
+        self.assertEqual(response.status_code, 401)
+
+    def test_list_owned_and_shared_in_due_date_order(self):
+        """The list holds the tasks the user created and collaborates on"""
+        response = self.client.get(reverse('api_task_list'))
+
+        names = [task['name'] for task in response.json()['results']]
+        self.assertEqual(names, ['Task 0', 'Shared', 'Task 1', 'Task 2'])
+        first = response.json()['results'][0]
+        self.assertEqual(first['categories'], [self.category.id])
+        self.assertEqual(first['creator'], self.user.id)
+
+    def test_sparse_fields(self):
+        """Only the fields asked for are read and returned"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('api_task_list'), {'fields': 'name,progress'})
+
+        self.assertEqual(response.json()['results'][0], {'name': 'Task 0', 'progress': 0})
+        task_queries = [q['sql'] for q in queries if 'FROM "todoapp_task"' in q['sql']]
+        self.assertTrue(task_queries)
+        self.assertTrue(all('"description"' not in sql for sql in task_queries))
+        self.assertFalse(any('todoapp_task_categories' in q['sql'] for q in queries))
+
+    def test_unknown_field(self):
+        """Asking for a field the API does not have is a client error"""
+        response = self.client.get(reverse('api_task_list'), {'fields': 'name,password'})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('password', response.json()['error'])
+
+    def test_cursor_pagination(self):
+        """Following the next cursor walks the list without repeating a task"""
+        seen = []
+        params = {'page_size': 3, 'fields': 'id'}
+        while True:
+            page = self.client.get(reverse('api_task_list'), params).json()
+            seen.extend(task['id'] for task in page['results'])
+            if page['next'] is None:
+                break
+            params['after'] = page['next']
+
+        self.assertEqual(seen, [self.tasks[0].id, self.shared.id,
+                                self.tasks[1].id, self.tasks[2].id])
+
+    def test_archived_list(self):
+        """?archived=true lists the archive instead"""
+        Task.objects.filter(pk=self.tasks[2].pk).archive()
+
+        response = self.client.get(reverse('api_task_list'), {'archived': 'true'})
+
+        self.assertEqual([task['id'] for task in response.json()['results']],
+                         [self.tasks[2].id])
+
+    def test_unchanged_poll_returns_304_without_reading_tasks(self):
+        """A poll with the current ETag is answered before any task is loaded"""
+        url = reverse('api_task_list')
+        etag = self.client.get(url)['ETag']
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(any('todoapp_task' in q['sql'] for q in queries))
+
+    def test_etag_changes_when_a_visible_task_changes(self):
+        """Editing a task, even one shared with the user, gives a new ETag"""
+        url = reverse('api_task_list')
+        etag = self.client.get(url)['ETag']
+
+        self.shared.name = 'Renamed'
+        self.shared.save()
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_etag_depends_on_the_query(self):
+        """Different field selections of the same list have different ETags"""
+        url = reverse('api_task_list')
+        self.assertNotEqual(self.client.get(url, {'fields': 'id'})['ETag'],
+                            self.client.get(url, {'fields': 'name'})['ETag'])
+
+    def test_create(self):
+        """Posting the task form fields as JSON creates a task of the user"""
+        response = self.send('post', reverse('api_task_list'), {
+            'name': 'From API', 'description': 'json', 'due_date': '2030-01-01T10:00:00',
+            'progress': 20, 'categories': [self.category.id], 'notification_type': 'email',
+            'notification_time': 60,
+        })
+
+        self.assertEqual(response.status_code, 201)
+        task = Task.objects.get(name='From API')
+        self.assertEqual(task.creator, self.user)
+        self.assertEqual(response.json()['categories'], [self.category.id])
+
+    def test_create_invalid(self):
+        """Invalid fields are reported per field"""
+        response = self.send('post', reverse('api_task_list'), {'name': 'No date'})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('due_date', response.json()['fields'])
+
+    def test_patch_keeps_other_fields(self):
+        """A PATCH only changes the fields it sends"""
+        task = self.tasks[0]
+        response = self.send('patch', reverse('api_task_detail', args=[task.id]),
+                             {'progress': 40})
+
+        self.assertEqual(response.status_code, 200)
+        task.refresh_from_db()
+        self.assertEqual(task.progress, 40)
+        self.assertEqual(task.name, 'Task 0')
+        self.assertEqual(list(task.categories.all()), [self.category])
+
+    def test_detail_of_foreign_task(self):
+        """Tasks the user cannot view are not found"""
+        url = reverse('api_task_detail', args=[self.foreign.id])
+
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.delete(url).status_code, 404)
+        self.assertTrue(Task.objects.filter(pk=self.foreign.pk).exists())
+
+    def test_delete(self):
+        """Deleting a task through the API removes it"""
+        response = self.client.delete(reverse('api_task_detail', args=[self.tasks[1].id]))
+
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Task.objects.filter(pk=self.tasks[1].pk).exists())
+
+    def test_collaborators_cannot_delete(self):
+        """A collaborator can edit a shared task but only its creator can delete it"""
+        url = reverse('api_task_detail', args=[self.shared.id])
+
+        response = self.client.delete(url)
+        self.assertEqual(response.status_code, 403)
+        self.assertTrue(Task.objects.filter(pk=self.shared.pk).exists())
+
+        self.assertEqual(self.send('patch', url, {'progress': 40}).status_code, 200)
+
+
+class RelatedApiTests(ApiTestCase):
+    """Tests for subtasks, categories and collaboration requests through the API"""
+
+    def test_subtasks(self):
+        """Subtasks are added, listed and assigned to users of the task only"""
+        url = reverse('api_subtask_list', args=[self.shared.id])
+        response = self.send('post', url, {'name': 'Step', 'assigned_users': [self.other.id]})
+        self.assertEqual(response.status_code, 201)
+
+        response = self.send('post', url, {'name': 'Bad', 'assigned_users': [999]})
+        self.assertEqual(response.status_code, 400)
+
+        results = self.client.get(url).json()['results']
+        self.assertEqual([(s['name'], s['assigned_users']) for s in results],
+                         [('Step', [self.other.id])])
+
+        subtask = SubTask.objects.get(name='Step')
+        response = self.send('patch', reverse('api_subtask_detail', args=[subtask.id]),
+                             {'is_completed': True})
+        self.assertEqual(response.json()['assigned_users'], [self.other.id])
+        self.assertTrue(response.json()['is_completed'])
+
+    def test_subtask_change_bumps_task_version(self):
+        """Subtask changes invalidate the ETags of everyone who can see the task"""
+        before = get_task_version(self.other.id)
+        SubTask.objects.create(name='Step', task=self.shared)
+        self.assertNotEqual(get_task_version(self.other.id), before)
+
+    def test_categories(self):
+        """Everyone can list categories, only staff can add them"""
+        url = reverse('api_category_list')
+        self.assertEqual(self.client.get(url).json()['results'],
+                         [{'id': self.category.id, 'name': 'Work'}])
+        self.assertEqual(self.send('post', url, {'name': 'Home'}).status_code, 403)
+
+        version = get_category_version()
+        self.user.is_staff = True
+        self.user.save()
+        self.assertEqual(self.send('post', url, {'name': 'Home'}).status_code, 201)
+        self.assertNotEqual(get_category_version(), version)
+
+    def test_send_and_accept_request(self):
+        """A request sent through the API can be accepted by its recipient"""
+        third = User.objects.create_user(username='apithird', password='password123')
+        response = self.send('post', reverse('api_request_list'),
+                             {'task': self.tasks[0].id, 'to_user': third.id})
+        self.assertEqual(response.status_code, 201)
+        request_id = response.json()['id']
+
+        outgoing = self.client.get(reverse('api_request_list'), {'direction': 'outgoing'})
+        self.assertEqual([r['id'] for r in outgoing.json()['results']], [request_id])
+
+        self.client.login(username='apithird', password='password123')
+        response = self.client.post(reverse('api_accept_request', args=[request_id]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(third.id, response.json()['assigned_users'])
+        self.assertFalse(TaskCollabRequest.objects.exists())
+
+    def test_decline_request(self):
+        """The recipient of a request can decline it, others cannot see it"""
+        collab_request = TaskCollabRequest.objects.create(
+            task=self.foreign, from_user=self.other, to_user=self.user
+        )
+        url = reverse('api_request_detail', args=[collab_request.id])
+        third = User.objects.create_user(username='apithird', password='password123')
+        self.client.force_login(third)
+        self.assertEqual(self.client.delete(url).status_code, 404)
+
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertFalse(TaskCollabRequest.objects.exists())
+
+
+@override_settings(SYNC_TOKEN_OVERLAP=0)
+class SyncApiTests(ApiTestCase):
+    """Tests for the delta sync endpoint and the tombstones behind it"""
+
+    def sync(self, token=None, user=None):
+        """Return the sync response of the logged in user for token"""
+        if user is not None:
+            self.client.force_login(user)
+        params = {'since': token} if token else {}
+        return self.client.get(reverse('api_sync'), params).json()
+
+    def test_first_sync_returns_everything(self):
+        """Without a token every visible task, subtask and request is returned"""
+        SubTask.objects.create(name='Step', task=self.shared)
+        TaskCollabRequest.objects.create(task=self.foreign, from_user=self.other,
+                                         to_user=self.user)
+
+        data = self.sync()
+
+        self.assertEqual({task['id'] for task in data['tasks']},
+                         {task.id for task in self.tasks} | {self.shared.id})
+        self.assertEqual([subtask['name'] for subtask in data['subtasks']], ['Step'])
+        self.assertEqual(len(data['requests']), 1)
+        self.assertTrue(data['token'])
+
+    def test_poll_returns_only_changes(self):
+        """A poll with the previous token only returns what changed since"""
+        token = self.sync()['token']
+        self.assertEqual(self.sync(token)['tasks'], [])
+
+        self.tasks[1].progress = 30
+        self.tasks[1].save()
+        subtask = SubTask.objects.create(name='Step', task=self.shared)
+
+        data = self.sync(token)
+        # the new subtask changed the subtask_count of its task
+        self.assertEqual({task['id'] for task in data['tasks']},
+                         {self.tasks[1].id, self.shared.id})
+        self.assertEqual([s['id'] for s in data['subtasks']], [subtask.id])
+        self.assertEqual([task['subtask_count'] for task in data['tasks']
+                          if task['id'] == self.shared.id], [1])
+
+    def test_deletes_are_reported(self):
+        """Deleted tasks, subtasks and requests come back as tombstones"""
+        subtask = SubTask.objects.create(name='Step', task=self.tasks[0])
+        collab_request = TaskCollabRequest.objects.create(task=self.foreign,
+                                                          from_user=self.other,
+                                                          to_user=self.user)
+        deleted = {'task': [self.tasks[2].id], 'subtask': [subtask.id],
+                   'request': [collab_request.id]}
+        token = self.sync()['token']
+
+        subtask.delete()
+        collab_request.delete()
+        Task.objects.filter(pk=self.tasks[2].pk).delete_tasks()
+
+        self.assertEqual(self.sync(token)['deleted'], deleted)
+
+    def test_assignment_changes(self):
+        """A user added to a task receives it with its subtasks, a removed user
+        is told to drop it and a user added back receives it again"""
+        subtask = SubTask.objects.create(name='Old step', task=self.foreign)
+        token = self.sync()['token']
+
+        self.foreign.assigned_users.add(self.user)
+        data = self.sync(token)
+        self.assertEqual([task['id'] for task in data['tasks']], [self.foreign.id])
+        self.assertEqual([s['id'] for s in data['subtasks']], [subtask.id])
+        token = data['token']
+
+        self.user.assigned_tasks.remove(self.foreign)
+        data = self.sync(token)
+        self.assertEqual(data['tasks'], [])
+        self.assertEqual(data['deleted']['task'], [self.foreign.id])
+
+        self.foreign.assigned_users.add(self.user)
+        data = self.sync(token)
+        self.assertEqual([task['id'] for task in data['tasks']], [self.foreign.id])
+        self.assertEqual(data['deleted']['task'], [])
+
+    def test_unchanged_poll_is_304(self):
+        """A poll with the same token and ETag is answered before reading any change"""
+        token = self.sync()['token']
+        url = reverse('api_sync')
+        etag = self.client.get(url, {'since': token})['ETag']
+
+        response = self.client.get(url, {'since': token}, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_bad_tokens(self):
+        """Malformed tokens are rejected and tokens older than the tombstones expire"""
+        url = reverse('api_sync')
+        self.assertEqual(self.client.get(url, {'since': 'nonsense'}).status_code, 400)
+
+        old = sync.encode_token(timezone.now() - timedelta(days=31))
+        self.assertEqual(self.client.get(url, {'since': old}).status_code, 410)
+
+    def test_deleting_a_user_with_tasks(self):
+        """Tombstones of a deleted user do not block the delete"""
+        self.user.delete()
+
+        self.assertFalse(Task.objects.filter(pk=self.tasks[0].pk).exists())
+        self.assertTrue(SyncTombstone.objects.filter(object_id=self.tasks[0].pk).exists())
+
+
+@override_settings(EVENT_QUEUE_SIZE=3, EVENT_HISTORY_SIZE=3, EVENT_LONG_POLL_TIMEOUT=0.1,
+                   EVENT_HEARTBEAT=0.1)
+class EventTests(ApiTestCase):
+    """Tests for the event broker and the stream and long-poll endpoints"""
+
+    def setUp(self):
+        super().setUp()
+        get_broker.cache_clear()
+        self.broker = get_broker()
+        self.addCleanup(get_broker.cache_clear)
+
+    def test_fan_out_to_each_subscription(self):
+        """Every open subscription of a user gets the events sent to that user"""
+        first = self.broker.subscribe(self.user.pk)
+        second = self.broker.subscribe(self.user.pk)
+        other = self.broker.subscribe(self.other.pk)
+
+        event = self.broker.publish([self.user.pk], 'progress', {'task': 1})
+
+        self.assertEqual(first.drain(), [event])
+        self.assertEqual(second.drain(), [event])
+        self.assertEqual(other.drain(), [])
+        first.close()
+        self.assertEqual(self.broker.connection_count(), 2)
+
+    def test_full_queue_is_replaced_by_resync(self):
+        """A consumer that falls behind gets a resync event instead of a growing queue"""
+        subscription = self.broker.subscribe(self.user.pk)
+        events = [self.broker.publish([self.user.pk], 'progress', {'n': n}) for n in range(5)]
+
+        drained = subscription.drain()
+
+        self.assertEqual([event['type'] for event in drained], ['resync', 'progress'])
+        self.assertEqual(drained[0]['id'], events[3]['id'])
+        self.assertEqual(drained[1], events[4])
+
+    def test_replay_after_last_event_id(self):
+        """Reconnecting after an event id replays the events still kept after it"""
+        events = [self.broker.publish([self.user.pk], 'progress', {'n': n}) for n in range(3)]
+
+        self.assertEqual(self.broker.subscribe(self.user.pk, events[0]['id']).drain(),
+                         events[1:])
+
+        # the first event is no longer kept, a client that missed it has to resync
+        self.broker.publish([self.user.pk], 'progress', {'n': 3})
+        replay = self.broker.subscribe(self.user.pk, events[0]['id'] - 1).drain()
+        self.assertEqual([event['type'] for event in replay], ['resync'])
+
+    def test_collaboration_signals_publish_after_commit(self):
+        """Sending and accepting a request publishes events to both users on commit"""
+        subscription = self.broker.subscribe(self.other.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            collab_request = TaskCollabRequest.objects.create(
+                task=self.tasks[0], from_user=self.user, to_user=self.other
+            )
+            self.assertEqual(subscription.drain(), [])
+        self.assertEqual([event['type'] for event in subscription.drain()], ['request_created'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tasks[0].assigned_users.add(self.other)
+            collab_request.delete()
+        events = subscription.drain()
+        self.assertEqual([event['type'] for event in events],
+                         ['collaborators_changed', 'request_closed'])
+        self.assertEqual(events[0]['data'], {'tasks': [self.tasks[0].id],
+                                             'added': [self.other.id]})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            TaskProgress.objects.create(task=self.tasks[0], user=self.other, progress=40)
+        self.assertEqual(subscription.drain()[0]['data'],
+                         {'task': self.tasks[0].id, 'user': self.other.id, 'progress': 40})
+
+    def test_long_poll(self):
+        """A poll returns the events after ?after= or nothing once it times out"""
+        event = self.broker.publish([self.user.pk], 'progress', {'task': 1})
+
+        data = self.client.get(reverse('api_event_poll'), {'after': event['id'] - 1}).json()
+        self.assertEqual(data, {'events': [event], 'last_id': event['id']})
+
+        data = self.client.get(reverse('api_event_poll'), {'after': event['id']}).json()
+        self.assertEqual(data, {'events': [], 'last_id': event['id']})
+        self.assertEqual(self.broker.connection_count(), 0)
+
+    def test_stream_under_wsgi_ends_after_one_poll(self):
+        """Under WSGI the stream returns the waiting events and closes"""
+        event = self.broker.publish([self.user.pk], 'progress', {'task': 1})
+
+        response = self.client.get(reverse('api_event_stream'),
+                                   HTTP_LAST_EVENT_ID=str(event['id'] - 1))
+
+        body = b''.join(response.streaming_content).decode()
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertIn(f"id: {event['id']}\nevent: progress\ndata: {{\"task\": 1}}\n\n", body)
+        self.assertEqual(self.broker.connection_count(), 0)
+
+    def test_stream_under_asgi_stays_open(self):
+        """Under ASGI the stream sends keep-alives and events as they are published"""
+        async def read_stream():
+            client = AsyncClient()
+            await client.aforce_login(self.user)
+            response = await client.get(reverse('api_event_stream'))
+            content = aiter(response.streaming_content)
+            chunks = [await anext(content), await anext(content)]
+            self.broker.publish([self.user.pk], 'progress', {'task': 2})
+            chunks.append(await anext(content))
+            await content.aclose()
+            return [chunk.decode() for chunk in chunks]
+
+        chunks = async_to_sync(read_stream)()
+
+        self.assertTrue(chunks[0].startswith('retry:'))
+        self.assertEqual(chunks[1], ': keep-alive\n\n')
+        self.assertIn('event: progress', chunks[2])
+        self.assertEqual(self.broker.connection_count(), 0)
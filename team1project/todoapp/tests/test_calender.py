@@ -3,12 +3,18 @@
 Tests for the calendar view in todoapp.
 """
 from datetime import datetime
+from unittest.mock import patch
 
-from django.test import TestCase
+import holidays
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.test import AsyncClient, TestCase
 from django.urls import reverse
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 
 from todoapp.models import Task
+from todoapp.utils import _year_holidays, get_month_holidays, warm_holiday_cache
 
 User = get_user_model()
 
@@ -76,3 +82,181 @@ class CalendarViewTests(TestCase):
             '<div class="task">Another</div>',
             content,
         )
+
+
+class CalendarMonthBoundaryTests(TestCase):
+    """Month and day ranges are computed in the project time zone (MST)."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='bob', password='secret')
+        self.client.force_login(self.user)
+
+        def local(*args):
+            return timezone.make_aware(datetime(*args))
+
+        Task.objects.create(creator=self.user, name='FebLast', description='x',
+                            due_date=local(2025, 2, 28, 23, 59))
+        Task.objects.create(creator=self.user, name='MarFirst', description='x',
+                            due_date=local(2025, 3, 1, 0, 0))
+        # 23:30 MST on the 31st is already April 1st in UTC
+        Task.objects.create(creator=self.user, name='MarLast', description='x',
+                            due_date=local(2025, 3, 31, 23, 30))
+        Task.objects.create(creator=self.user, name='AprFirst', description='x',
+                            due_date=local(2025, 4, 1, 0, 0))
+
+    def test_month_includes_only_local_month(self):
+        """Tasks on either side of the March boundaries stay out of March."""
+        response = self.client.get(reverse('home') + '?year=2025&month=3')
+        content = response.context['calendar']
+
+        self.assertIn('MarFirs', content)
+        self.assertIn('MarLast', content)
+        self.assertNotIn('FebLast', content)
+        self.assertNotIn('AprFirs', content)
+
+    def test_task_rendered_on_local_day(self):
+        """A late-evening task is drawn on its local day, not its UTC day."""
+        response = self.client.get(reverse('home') + '?year=2025&month=3')
+        self.assertInHTML(
+            '<td class="mon"><span class="date">31</span><br>'
+            '<div class="task">MarLast</div></td>',
+            response.content.decode(),
+        )
+
+    def test_day_filter_uses_local_day(self):
+        """?day= limits the sidebar to that local day of the shown month."""
+        response = self.client.get(reverse('home') + '?year=2025&month=3&day=31')
+        self.assertEqual(
+            [task.name for task in response.context['all_tasks']], ['MarLast']
+        )
+
+    def test_day_filter_ignores_invalid_day(self):
+        """A day that does not exist in the month leaves the sidebar unfiltered."""
+        response = self.client.get(reverse('home') + '?year=2025&month=2&day=30')
+        self.assertEqual(len(response.context['all_tasks']), 4)
+
+
+class HolidayServiceTests(TestCase):
+    """Tests for the cached holiday lookups used by the calendar."""
+
+    def setUp(self):
+        _year_holidays.cache_clear()
+        get_month_holidays.cache_clear()
+        cache.clear()
+        self.user = User.objects.create_user(username='carol', password='secret')
+        self.client.force_login(self.user)
+
+    def test_month_holidays(self):
+        """Only holidays of the requested month are returned, keyed by day."""
+        july = get_month_holidays('US', 2025, 7)
+        self.assertEqual(dict(july), {4: 'Independence Day'})
+
+    def test_holidays_computed_once_per_country_year(self):
+        """Repeated months of the same year reuse one holidays computation."""
+        with patch('todoapp.utils.holidays.country_holidays',
+                   wraps=holidays.country_holidays) as mock_holidays:
+            get_month_holidays('US', 2025, 1)
+            get_month_holidays('US', 2025, 1)
+            get_month_holidays('US', 2025, 7)
+
+        self.assertEqual(mock_holidays.call_count, 1)
+
+    def test_warm_holiday_cache(self):
+        """Warming fills every month of the surrounding years."""
+        warm_holiday_cache(['US'], 2025)
+        self.assertEqual(get_month_holidays.cache_info().currsize, 36)
+
+    def test_calendar_uses_chosen_country(self):
+        """The calendar shows holidays of the country saved in the user's session."""
+        session = self.client.session
+        session['holiday_country'] = 'CA'
+        session.save()
+
+        response = self.client.get(reverse('home') + '?year=2025&month=7')
+        self.assertEqual(dict(response.context['holiday_dict']), {1: 'Canada Day'})
+
+
+class CalendarFragmentCacheTests(TestCase):
+    """Rendered months are reused until one of the user's tasks changes."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='dave', password='secret')
+        self.other_user = User.objects.create_user(username='erin', password='secret')
+        self.client.force_login(self.user)
+        self.url = reverse('home') + '?year=2025&month=3'
+        self.task = Task.objects.create(
+            creator=self.user, name='Cached', description='x',
+            due_date=timezone.make_aware(datetime(2025, 3, 10, 12, 0)),
+        )
+
+    def test_repeat_visit_skips_renderer(self):
+        """The second visit to a month is served from the cache."""
+        self.client.get(self.url)
+        with patch('todoapp.views.TaskCalendar') as mock_calendar:
+            response = self.client.get(self.url)
+
+        mock_calendar.assert_not_called()
+        self.assertIn('Cached', response.context['calendar'])
+
+    def test_task_change_invalidates(self):
+        """Editing a task re-renders the month."""
+        self.client.get(self.url)
+        self.task.name = 'Renamed'
+        self.task.save()
+
+        response = self.client.get(self.url)
+        self.assertIn('Renamed', response.context['calendar'])
+
+    def test_new_assignment_invalidates_collaborator(self):
+        """Being added to a task re-renders the collaborator's month."""
+        self.client.force_login(self.other_user)
+        response = self.client.get(self.url)
+        self.assertNotIn('Cached', response.context['calendar'])
+
+        self.task.assigned_users.add(self.other_user)
+        response = self.client.get(self.url)
+        self.assertIn('Cached', response.context['calendar'])
+
+    def test_task_delete_invalidates_collaborator(self):
+        """Deleting a task re-renders its collaborators' months."""
+        self.task.assigned_users.add(self.other_user)
+        self.client.force_login(self.other_user)
+        self.client.get(self.url)
+
+        self.task.delete()
+        response = self.client.get(self.url)
+        self.assertNotIn('Cached', response.context['calendar'])
+
+
+class AsyncCalendarViewTests(TestCase):
+    """The calendar page served through the ASGI handler."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='frank', password='secret')
+        self.client = AsyncClient()
+        self.task = Task.objects.create(
+            creator=self.user, name='AsyncTask', description='x',
+            due_date=timezone.make_aware(datetime(2025, 7, 10, 12, 0)),
+        )
+
+    def test_renders_tasks_holidays_and_quote(self):
+        """Tasks, holidays and the quote all reach the page."""
+        self.client.force_login(self.user)
+
+        response = async_to_sync(self.client.get)(reverse('home') + '?year=2025&month=7&day=10')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('AsyncTa', response.context['calendar'])
+        self.assertEqual(list(response.context['all_tasks']), [self.task])
+        self.assertEqual(dict(response.context['holiday_dict']), {4: 'Independence Day'})
+        self.assertIn('<blockquote>', response.context['today_quote'])
+
+    def test_redirects_anonymous_users(self):
+        """Anonymous users are sent to the login page like with login_required."""
+        response = async_to_sync(self.client.get)(reverse('home'))
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.url, reverse('index') + '?next=' + reverse('home'))
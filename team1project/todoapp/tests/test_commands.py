@@ -1,18 +1,38 @@
 """This module contains tests for commands"""
 import json
+import smtplib
+import tempfile
 from datetime import timedelta
+from io import StringIO
 from unittest.mock import patch
 
-from django.test import TestCase
+from django.core import mail
+from django.core.mail.backends import locmem
+from django.core.cache import caches
+from django.db import DatabaseError
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.core.management import call_command
 from django.utils import timezone
 from django.contrib.auth import get_user_model
 from django.utils.timezone import localtime
 
-from todoapp.models import Task
+from todoapp.cache_backends import CountingFileBasedCache
+from todoapp.management.commands.run_notification_scheduler import Command as SchedulerCommand
+from todoapp.models import NotificationDelivery, SubTask, SyncTombstone, Task, TaskQuerySet
+from todoapp.notifications import NotificationScheduler
 
 User = get_user_model()
 
+
+class RefusingEmailBackend(locmem.EmailBackend):
+    """In-memory backend whose server refuses user2's address"""
+    def send_messages(self, messages):
+        for message in messages:
+            if 'user2@example.com' in message.to:
+                raise smtplib.SMTPRecipientsRefused({'user2@example.com': (550, b'No such user')})
+        return super().send_messages(messages)
+
+
 # pylint: disable = W0612,E1101
 class SendTaskRemindersCommandTest(TestCase):
     """This is a class to set up and run tests for commands"""
@@ -65,6 +85,80 @@ def test_send_task_reminders(self, mock_send_mail):
         self.assertIn(expected_message, kwargs['message'])
 
 
+class SendEmailTaskRemindersLedgerTest(TestCase):
+    """Tests that email reminders go through the delivery ledger"""
+    def setUp(self):
+        """Setting up objects for tests"""
+        self.user1 = User.objects.create_user(username='user1',\
+             email='user1@example.com', password='password123')
+        self.user2 = User.objects.create_user(username='user2',\
+             email='user2@example.com', password='password123')
+
+        self.task = Task.objects.create(
+            name='Email Task',
+            due_date=timezone.now() + timedelta(hours=1),
+            creator=self.user1,
+            notifications_enabled=True,
+            notification_type='email',
+        )
+        self.task.assigned_users.add(self.user2)
+
+    def test_email_reminders_sent_once(self):
+        """A second run does not email the same users again"""
+        call_command('send_task_reminders', stdout=StringIO())
+        call_command('send_task_reminders', stdout=StringIO())
+
+        self.assertEqual(
+            sorted(message.to[0] for message in mail.outbox),
+            ['user1@example.com', 'user2@example.com'],
+        )
+        self.assertEqual(NotificationDelivery.objects.filter(channel='email').count(), 2)
+
+    def test_email_reminders_share_one_connection(self):
+        """Reminders are sent in batches, each over one opened connection"""
+        with patch('django.core.mail.backends.locmem.EmailBackend.open') as mock_open:
+            out = StringIO()
+            call_command('send_task_reminders', batch_size=1, stdout=out)
+
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(mock_open.call_count, 2)  # once per batch, reusing the connection
+        self.assertIn('2 task reminder(s) sent', out.getvalue())
+        self.assertIn('messages/s', out.getvalue())
+
+    def test_email_failed_message_is_retried(self):
+        """A message that fails is retried alone and recorded once it goes through"""
+        with patch('django.core.mail.backends.locmem.EmailBackend.send_messages',
+                   side_effect=[smtplib.SMTPException('busy'), 1, 1]) as mock_send:
+            err = StringIO()
+            call_command('send_task_reminders', retries=1, stdout=StringIO(), stderr=err)
+
+        self.assertEqual(mock_send.call_count, 3)
+        self.assertIn('attempt 1', err.getvalue())
+        self.assertEqual(NotificationDelivery.objects.filter(channel='email').count(), 2)
+
+    @override_settings(EMAIL_BACKEND='todoapp.tests.test_commands.RefusingEmailBackend')
+    def test_email_refused_address_does_not_resend_others(self):
+        """A refused recipient leaves the rest of the batch sent once and recorded"""
+        out = StringIO()
+        call_command('send_task_reminders', stdout=out, stderr=StringIO())
+        call_command('send_task_reminders', stdout=StringIO(), stderr=StringIO())
+
+        self.assertEqual([message.to for message in mail.outbox], [['user1@example.com']])
+        self.assertIn('1 task reminder(s) sent', out.getvalue())
+        self.assertEqual(
+            list(NotificationDelivery.objects.values_list('user__username', flat=True)),
+            ['user1'],
+        )
+
+    def test_email_dry_run_records_nothing(self):
+        """Dry runs use the in-memory backend and leave the ledger alone"""
+        with self.settings(EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend'):
+            call_command('send_task_reminders', dry_run=True, stdout=StringIO())
+
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertFalse(NotificationDelivery.objects.exists())
+
+
 class SendPushTaskRemindersCommandTest(TestCase):
     """This is a class to set up and run tests for commands"""
     def setUp(self):
@@ -103,3 +197,474 @@ class SendPushTaskRemindersCommandTest(TestCase):
             self.assertIn("Task Reminder!", payload["head"])
             self.assertIn("Push Test Task", payload["body"])
             self.assertIn("/task_view/", payload["url"])
+
+    @patch('webpush.send_user_notification')
+    def test_push_skips_tasks_outside_window(self, mock_send_user_notification):
+        """Tasks whose reminder time has not come yet are not notified"""
+        Task.objects.create(
+            name='Later Task',
+            due_date=timezone.now() + timedelta(hours=2),
+            creator=self.user1,
+            notifications_enabled=True,
+            notification_type='push',
+            notification_time=60,
+        )
+        out = StringIO()
+        call_command('send_due_task_notifications', stdout=out)
+
+        notified = {call.kwargs['user'] for call in mock_send_user_notification.call_args_list}
+        self.assertEqual(notified, {self.user1, self.user2})
+        self.assertIn("Checked 1 tasks: 2 sent, 0 failed", out.getvalue())
+
+    @patch('webpush.send_user_notification')
+    def test_push_reports_failures(self, mock_send_user_notification):
+        """A failing send is counted and does not stop the others"""
+        mock_send_user_notification.side_effect = [Exception("gone"), None]
+        out = StringIO()
+        err = StringIO()
+        call_command('send_due_task_notifications', workers=1, stdout=out, stderr=err)
+
+        self.assertIn("1 sent, 1 failed", out.getvalue())
+        self.assertIn("Error notifying", err.getvalue())
+
+    @patch('webpush.send_user_notification')
+    def test_push_workers_close_connections_once(self, mock_send_user_notification):
+        """Each worker closes its DB connections when the run ends, not after every send"""
+        with patch('todoapp.notifications.connections') as mock_connections:
+            call_command('send_due_task_notifications', workers=3, stdout=StringIO())
+
+        self.assertEqual(mock_send_user_notification.call_count, 2)
+        self.assertEqual(mock_connections.close_all.call_count, 3)
+
+    @patch('webpush.send_user_notification')
+    def test_push_sent_once_per_due_date(self, mock_send_user_notification):
+        """Running the command again does not resend, moving the due date does"""
+        call_command('send_due_task_notifications', stdout=StringIO())
+        out = StringIO()
+        call_command('send_due_task_notifications', stdout=out)
+
+        self.assertEqual(mock_send_user_notification.call_count, 2)
+        self.assertIn("0 sent, 0 failed, 2 already sent", out.getvalue())
+        self.assertEqual(NotificationDelivery.objects.filter(channel='push').count(), 2)
+
+        self.task_due_soon.due_date -= timedelta(minutes=1)
+        self.task_due_soon.save()
+        call_command('send_due_task_notifications', stdout=StringIO())
+        self.assertEqual(mock_send_user_notification.call_count, 4)
+
+    @patch('webpush.send_user_notification')
+    def test_push_failures_not_recorded(self, mock_send_user_notification):
+        """A failed send is retried on the next run"""
+        mock_send_user_notification.side_effect = [Exception("gone"), None]
+        call_command('send_due_task_notifications', workers=1,
+                     stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(NotificationDelivery.objects.count(), 1)
+
+        mock_send_user_notification.side_effect = None
+        call_command('send_due_task_notifications', stdout=StringIO())
+        self.assertEqual(mock_send_user_notification.call_count, 3)
+        self.assertEqual(NotificationDelivery.objects.count(), 2)
+
+    def test_notification_window_queryset(self):
+        """The SQL window matches each task's own notification_time"""
+        now = timezone.now()
+        Task.objects.create(
+            name='Day Task',
+            due_date=now + timedelta(hours=20),
+            creator=self.user1,
+            notifications_enabled=True,
+            notification_time=1440,
+        )
+        Task.objects.create(
+            name='Disabled Task',
+            due_date=now + timedelta(minutes=5),
+            creator=self.user1,
+            notifications_enabled=False,
+            notification_time=10,
+        )
+        Task.objects.create(
+            name='Past Task',
+            due_date=now - timedelta(minutes=5),
+            creator=self.user1,
+            notifications_enabled=True,
+            notification_time=10,
+        )
+
+        names = set(Task.objects.in_notification_window(now).values_list('name', flat=True))
+        self.assertEqual(names, {'Push Test Task', 'Day Task'})
+
+
+class BenchmarkTaskQueriesCommandTest(TestCase):
+    """Tests for the benchmark_task_queries command"""
+    def test_benchmark_reports_and_rolls_back(self):
+        """The benchmark prints both phases and leaves no seeded rows or missing indexes"""
+        out = StringIO()
+        call_command('benchmark_task_queries', tasks=50, users=5, repeat=1, stdout=out)
+
+        output = out.getvalue()
+        self.assertIn('== before indexes ==', output)
+        self.assertIn('== after indexes ==', output)
+        self.assertIn('email reminders', output)
+        self.assertEqual(Task.objects.count(), 0)
+        self.assertFalse(User.objects.filter(username__startswith='bench_user_').exists())
+
+
+class BenchmarkTaskSuggestionsCommandTest(TestCase):
+    """Tests for the benchmark_task_suggestions command"""
+    @override_settings(TASK_SUGGESTION_CLIENT='local')
+    def test_benchmark_reports_every_engine_and_rolls_back(self):
+        """Both engines are timed and the seeded user is removed afterwards"""
+        out = StringIO()
+        call_command('benchmark_task_suggestions', tasks=30, repeat=2, stdout=out)
+
+        output = out.getvalue()
+        self.assertIn('pattern: 30 tasks', output)
+        self.assertIn('remote: 25 tasks', output)
+        self.assertEqual(Task.objects.count(), 0)
+        self.assertFalse(User.objects.filter(username='bench_suggestions').exists())
+
+
+class BenchmarkUserSearchCommandTest(TestCase):
+    """Tests for the benchmark_user_search command"""
+    def test_benchmark_reports_and_rolls_back(self):
+        """Every search strategy is timed and the seeded users are removed"""
+        out = StringIO()
+        call_command('benchmark_user_search', users=200, repeat=1, batch_size=50, stdout=out)
+
+        output = out.getvalue()
+        self.assertIn("== term 'jo' ==", output)
+        self.assertIn('prefix index: ', output)
+        self.assertIn('cached page: ', output)
+        self.assertEqual(User.objects.count(), 0)
+
+
+class NotificationSchedulerTest(TestCase):
+    """Tests for the heap based notification scheduler and its daemon command"""
+    def setUp(self):
+        """Setting up objects for tests"""
+        self.user = User.objects.create_user(username='user1',\
+             email='user1@example.com', password='password123')
+        self.now = timezone.now()
+        self.push_task = Task.objects.create(
+            name='Push Task',
+            due_date=self.now + timedelta(minutes=70),
+            creator=self.user,
+            notifications_enabled=True,
+            notification_type='push',
+            notification_time=60,
+        )
+        self.email_task = Task.objects.create(
+            name='Email Task',
+            due_date=self.now + timedelta(minutes=5),
+            creator=self.user,
+            notifications_enabled=True,
+            notification_type='email',
+            notification_time=10,
+        )
+
+    def test_seed_orders_by_fire_time(self):
+        """The earliest reminder is at the top of the heap"""
+        scheduler = NotificationScheduler()
+        scheduler.seed(self.now)
+
+        self.assertEqual(len(scheduler), 2)
+        self.assertEqual(scheduler.next_fire_time(), self.email_task.due_date - timedelta(minutes=10))
+        self.assertEqual(scheduler.pop_due(self.now), [self.email_task.id])
+        self.assertEqual(scheduler.pop_due(self.now + timedelta(minutes=10)), [self.push_task.id])
+
+    def test_poll_picks_up_changes(self):
+        """Changed, disabled and new tasks are rescheduled by polling"""
+        scheduler = NotificationScheduler()
+        scheduler.seed(self.now)
+
+        self.push_task.notification_time = 10
+        self.push_task.save()
+        self.email_task.notifications_enabled = False
+        self.email_task.save()
+
+        scheduler.poll(timezone.now())
+
+        self.assertEqual(len(scheduler), 1)
+        self.assertEqual(scheduler.pop_due(self.now + timedelta(minutes=30)), [])
+        self.assertEqual(scheduler.pop_due(self.now + timedelta(minutes=60)), [self.push_task.id])
+
+    @patch('webpush.send_user_notification')
+    def test_dispatch_uses_task_channel(self, mock_send_user_notification):
+        """Due reminders go out once on the channel the task asked for"""
+        scheduler = NotificationScheduler()
+        task_ids = [self.push_task.id, self.email_task.id]
+        later = self.now + timedelta(minutes=11)
+
+        sent = [scheduler.dispatch(task_ids, self.now), scheduler.dispatch(task_ids, later)]
+        sent_again = [scheduler.dispatch(task_ids, self.now), scheduler.dispatch(task_ids, later)]
+
+        self.assertEqual(sent, [(1, set()), (1, set())])
+        self.assertEqual(sent_again, [(0, set()), (0, set())])
+        self.assertEqual(mock_send_user_notification.call_count, 1)
+        self.assertEqual([message.to for message in mail.outbox], [['user1@example.com']])
+
+    @override_settings(EMAIL_BACKEND='todoapp.tests.test_commands.RefusingEmailBackend')
+    def test_refused_email_only_retries_its_task(self):
+        """Emails sent before a refusal are recorded and only the failed task is retried"""
+        user2 = User.objects.create_user(username='user2',\
+             email='user2@example.com', password='password123')
+        self.email_task.assigned_users.add(user2)
+        other_task = Task.objects.create(
+            name='Other Email Task',
+            due_date=self.now + timedelta(minutes=5),
+            creator=self.user,
+            notifications_enabled=True,
+            notification_type='email',
+            notification_time=10,
+        )
+        scheduler = NotificationScheduler()
+        scheduler.schedule(self.email_task.id, self.now)
+        scheduler.schedule(other_task.id, self.now)
+
+        out = StringIO()
+        with self.assertLogs('todoapp.notifications', 'ERROR'):
+            SchedulerCommand(stdout=out).run_due(scheduler, self.now, 60)
+
+        self.assertIn('Sent 2 reminder(s) for 2 task(s).', out.getvalue())
+        self.assertEqual([message.to for message in mail.outbox],
+                         [['user1@example.com'], ['user1@example.com']])
+        self.assertEqual(NotificationDelivery.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(len(scheduler), 1)
+        self.assertEqual(scheduler.next_fire_time(), self.now + timedelta(seconds=60))
+
+        with self.assertLogs('todoapp.notifications', 'ERROR'):
+            self.assertEqual(scheduler.dispatch([self.email_task.id], self.now),
+                             (0, {self.email_task.id}))
+        self.assertEqual(len(mail.outbox), 2)
+
+    @patch('todoapp.notifications.NotificationScheduler.poll',
+           side_effect=DatabaseError('database is locked'))
+    def test_command_survives_failed_poll(self, mock_poll):
+        """A poll that fails is reported and the due reminders still go out"""
+        out, err = StringIO(), StringIO()
+        # closing the connection would end the test's transaction
+        with patch('todoapp.management.commands.run_notification_scheduler'
+                   '.close_old_connections') as mock_close:
+            call_command('run_notification_scheduler', once=True, stdout=out, stderr=err)
+
+        mock_close.assert_called_once_with()
+        self.assertIn('Error polling for changed tasks: database is locked', err.getvalue())
+        self.assertIn('Sent 1 reminder(s) for 1 task(s).', out.getvalue())
+
+    def test_command_once_sends_due_email(self):
+        """Running the daemon once sends what is due and exits"""
+        out = StringIO()
+        call_command('run_notification_scheduler', once=True, stdout=out)
+
+        self.assertIn('Scheduler started with 2 upcoming reminders.', out.getvalue())
+        self.assertIn('Sent 1 reminder(s) for 1 task(s).', out.getvalue())
+        self.assertEqual(len(mail.outbox), 1)
+
+
+class CacheStatsCommandTest(TestCase):
+    """Tests for the hit and miss counting cache backends and the cache_stats command"""
+    def setUp(self):
+        """Start every test from empty counters"""
+        for alias in ('default', 'select2'):
+            caches[alias].clear()
+            caches[alias].reset_stats()
+
+    def test_reports_hit_ratio(self):
+        """Hits and misses of get and get_many are counted per cache"""
+        cache = caches['default']
+        cache.set('a', 1)
+        cache.set('b', None)
+        cache.get('a')
+        cache.get('b')  # a stored None is still a hit
+        cache.get('missing')
+        cache.get_many(['a', 'missing'])
+
+        out = StringIO()
+        call_command('cache_stats', stdout=out)
+
+        self.assertIn('default: 3 hits, 2 misses (60.0% hit ratio)', out.getvalue())
+        self.assertIn('select2: 0 hits, 0 misses', out.getvalue())
+
+    def test_reset(self):
+        """--reset sets the counters back to zero"""
+        caches['default'].get('missing')
+        call_command('cache_stats', reset=True, stdout=StringIO())
+
+        self.assertEqual(caches['default'].get_stats(), {'hits': 0, 'misses': 0})
+
+    def test_shared_backend_adds_up_processes(self):
+        """Two cache objects on one directory, like two workers, share their counters"""
+        with tempfile.TemporaryDirectory() as location:
+            worker1 = CountingFileBasedCache(location, {'STATS_ALIAS': 'shared'})
+            worker2 = CountingFileBasedCache(location, {'STATS_ALIAS': 'shared'})
+
+            worker1.set('quote', 'hello')
+            self.assertEqual(worker2.get('quote'), 'hello')
+            worker2.flush_stats()
+            worker1.get('missing')
+            # incr reads the value itself, which is not counted as a lookup
+            worker1.set('version', 1)
+            worker1.incr('version')
+
+            self.assertEqual(worker2.get_stats(), {'hits': 1, 'misses': 1})
+
+
+class ArchiveExpiredTasksCommandTest(TestCase):
+    """Tests for the archive_expired_tasks command"""
+    def setUp(self):
+        """Create completed tasks that went past their due date without being saved"""
+        self.user = User.objects.create_user(username='user1', password='password123')
+        future = timezone.now() + timedelta(days=1)
+        self.expired = [
+            Task.objects.create(name=f'Done {i}', creator=self.user, due_date=future,
+                                progress=100)
+            for i in range(5)
+        ]
+        self.open = Task.objects.create(name='Open', creator=self.user, due_date=future,
+                                        progress=50)
+        self.kept = Task.objects.create(name='Kept', creator=self.user, due_date=future,
+                                        progress=100, ignore_archive=True)
+        self.upcoming = Task.objects.create(name='Upcoming', creator=self.user,
+                                            due_date=future, progress=100)
+        # update() skips Task.save, which would have archived them
+        Task.objects.exclude(pk=self.upcoming.pk).update(
+            due_date=timezone.now() - timedelta(hours=1)
+        )
+
+    def test_archives_only_expired_tasks(self):
+        """Completed, past-due tasks are archived, the others are left alone"""
+        out = StringIO()
+        call_command('archive_expired_tasks', chunk_size=2, stdout=out)
+
+        archived = set(Task.objects.filter(is_archived=True).values_list('pk', flat=True))
+        self.assertEqual(archived, {task.pk for task in self.expired})
+        self.assertIn('Archived 5 expired tasks in', out.getvalue())
+        self.assertIn('rows/s', out.getvalue())
+
+    def test_one_update_per_chunk(self):
+        """Each chunk costs a select of its ids, two for the affected users and one UPDATE"""
+        with self.assertNumQueries(3 * 4):
+            call_command('archive_expired_tasks', chunk_size=2, stdout=StringIO())
+
+        out = StringIO()
+        call_command('archive_expired_tasks', stdout=out)
+        self.assertIn('Archived 0 expired tasks', out.getvalue())
+
+    def test_update_checks_the_conditions_again(self):
+        """A task reopened between the SELECT of a chunk and its UPDATE stays unarchived"""
+        reopened = self.expired[0]
+        update_tasks = TaskQuerySet.update_tasks
+
+        def reopen_first(queryset, **changes):
+            Task.objects.filter(pk=reopened.pk).update(progress=50, is_completed=False)
+            return update_tasks(queryset, **changes)
+
+        with patch.object(TaskQuerySet, 'update_tasks', reopen_first):
+            archived = sum(Task.objects.archive_expired(timezone.now()))
+
+        self.assertEqual(archived, 4)
+        reopened.refresh_from_db()
+        self.assertFalse(reopened.is_archived)
+
+    def test_scheduler_archives_periodically(self):
+        """The notification daemon archives expired tasks when given an interval"""
+        out = StringIO()
+        call_command('run_notification_scheduler', once=True, archive_interval=60, stdout=out)
+
+        self.assertIn('Archived 5 expired task(s)', out.getvalue())
+        self.assertEqual(Task.objects.filter(is_archived=True).count(), 5)
+
+
+class BenchmarkTaskPagesCommandTest(TestCase):
+    """Tests for the benchmark_task_pages command"""
+    def test_reports_each_page_and_rolls_back(self):
+        """Each size is timed for every way to load a page and nothing is kept"""
+        out = StringIO()
+        call_command('benchmark_task_pages', sizes=[30, 60], page_size=10, repeat=1,
+                     batch_size=20, stdout=out)
+
+        output = out.getvalue()
+        self.assertIn('== 60 archived tasks ==', output)
+        self.assertIn('whole list: 60 rows', output)
+        self.assertIn('keyset last page: 10 rows', output)
+        self.assertEqual(Task.objects.count(), 0)
+
+
+class PruneSyncTombstonesCommandTest(TestCase):
+    """Tests for the prune_sync_tombstones command"""
+    def test_prunes_only_expired_tombstones(self):
+        """Tombstones older than SYNC_TOMBSTONE_DAYS are deleted, recent ones kept"""
+        user = User.objects.create_user(username='pruneuser', password='password123')
+        old, recent = SyncTombstone.objects.record(SyncTombstone.TASK, [(1, user.pk), (2, user.pk)])
+        SyncTombstone.objects.filter(pk=old.pk).update(
+            deleted_at=timezone.now() - timedelta(days=31)
+        )
+        out = StringIO()
+
+        call_command('prune_sync_tombstones', stdout=out)
+
+        self.assertIn('Pruned 1 sync tombstones.', out.getvalue())
+        self.assertEqual(list(SyncTombstone.objects.values_list('object_id', flat=True)),
+                         [recent.object_id])
+
+
+class BenchmarkAsgiCommandTest(TransactionTestCase):
+    """Tests for the benchmark_asgi command"""
+    def test_reports_both_servers_and_cleans_up(self):
+        """Both pages are loaded over WSGI and ASGI without errors, then the data is removed"""
+        out = StringIO()
+        call_command('benchmark_asgi', requests=4, concurrency=2, wsgi_threads=2, tasks=3,
+                     quote_latency=0, cold_quote=True, stdout=out)
+
+        output = out.getvalue()
+        self.assertIn('== /tasks/ ==', output)
+        self.assertIn('== /home/ ==', output)
+        self.assertEqual(output.count(', 0 non-200'), 4)
+        self.assertFalse(User.objects.filter(username='bench_asgi_user').exists())
+
+
+class BenchmarkEventStreamsCommandTest(TransactionTestCase):
+    """Tests for the benchmark_event_streams command"""
+    def test_reports_connections_and_deliveries(self):
+        """Every stream opens, gets its events and is closed again"""
+        out = StringIO()
+        call_command('benchmark_event_streams', connections=6, users=2, events=2,
+                     trace_memory=True, stdout=out)
+
+        output = out.getvalue()
+        self.assertIn('Opened 6 streams', output)
+        self.assertIn('0 non-200, 6 subscriptions', output)
+        self.assertIn('Delivered 2 events to 6 streams', output)
+        self.assertIn('0 subscriptions left', output)
+        self.assertFalse(User.objects.exists())
+
+
+class RecountTaskCountersCommandTest(TestCase):
+    """Tests for the recount_task_counters command"""
+    def test_fixes_only_stale_counters(self):
+        """Counters that drifted are recounted, the correct ones are not written"""
+        user = User.objects.create_user(username='countuser', password='password123')
+        other = User.objects.create_user(username='otheruser', password='password123')
+        due = timezone.now() + timedelta(days=1)
+        tasks = [
+            Task.objects.create(name=f'Task {i}', creator=user, description='Count',
+                                due_date=due)
+            for i in range(3)
+        ]
+        tasks[0].assigned_users.add(user, other)
+        SubTask.objects.create(name='Done', task=tasks[0], is_completed=True)
+        SubTask.objects.create(name='Open', task=tasks[1])
+        # bypasses the signals that keep the counters
+        SubTask.objects.filter(task=tasks[1]).update(is_completed=True)
+        Task.objects.filter(pk=tasks[2].pk).update(collaborator_count=4, subtask_count=2)
+        untouched = Task.objects.get(pk=tasks[0].pk).updated_at
+        out = StringIO()
+
+        # per chunk: the aggregate query, two for the affected users and one UPDATE
+        with self.assertNumQueries(2 * 4):
+            call_command('recount_task_counters', chunk_size=2, stdout=out)
+
+        self.assertIn('Checked 3 tasks and fixed the counters of 2 in', out.getvalue())
+        counters = Task.objects.order_by('pk').values_list(*Task.COUNTER_FIELDS)
+        self.assertEqual(list(counters), [(1, 1, 2), (1, 1, 0), (0, 0, 0)])
+        self.assertEqual(Task.objects.get(pk=tasks[0].pk).updated_at, untouched)
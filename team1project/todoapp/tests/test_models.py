@@ -5,10 +5,13 @@ It tests the creation of each model here
 '''
 
 from datetime import timedelta
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 
+from todoapp.caching import get_task_version
 from todoapp.models import Category, Task, SubTask, TaskProgress
 
 User = get_user_model()
@@ -80,3 +83,104 @@ class ModelsTestCase(TestCase):
         self.assertEqual(self.task_progress.task, self.task)
         self.assertEqual(self.task_progress.user, self.user1)
         self.assertEqual(self.task_progress.progress, 75)
+
+
+class TaskCountersTestCase(TestCase):
+    '''Test the subtask and collaborator counters kept on tasks'''
+    def setUp(self):
+        """Create a task with two collaborators and no subtasks."""
+        self.user1 = User.objects.create_user(username="user1", password="password123")
+        self.user2 = User.objects.create_user(username="user2", password="password123")
+        self.task = Task.objects.create(
+            name="Pay Bills",
+            creator=self.user1,
+            description="Pay utility bills",
+            due_date=timezone.now() + timedelta(days=7),
+        )
+        self.task.assigned_users.add(self.user1, self.user2)
+
+    def assertCounters(self, task, subtasks, done, collaborators):
+        '''Check the stored counters of a task'''
+        task.refresh_from_db()
+        self.assertEqual(
+            (task.subtask_count, task.subtask_done_count, task.collaborator_count),
+            (subtasks, done, collaborators),
+        )
+
+    def test_subtasks_are_counted(self):
+        '''Creating, completing, moving and deleting subtasks updates the counters'''
+        first = SubTask.objects.create(name="First", task=self.task)
+        second = SubTask.objects.create(name="Second", task=self.task, is_completed=True)
+        self.assertCounters(self.task, 2, 1, 2)
+
+        first.is_completed = True
+        first.save()
+        first.save()
+        self.assertCounters(self.task, 2, 2, 2)
+
+        other = Task.objects.create(name="Other", creator=self.user1, description="Other",
+                                    due_date=timezone.now() + timedelta(days=1))
+        second.task = other
+        second.save()
+        self.assertCounters(self.task, 1, 1, 2)
+        self.assertCounters(other, 1, 1, 0)
+
+        # the stored row is counted, not the stale instance
+        SubTask.objects.filter(pk=first.pk).update(is_completed=False)
+        self.task.refresh_from_db()
+        Task.objects.filter(pk=self.task.pk).update(subtask_done_count=0)
+        first.delete()
+        self.assertCounters(self.task, 0, 0, 2)
+
+    def test_collaborators_are_counted(self):
+        '''Assignments from either side of the relation update collaborator_count'''
+        user3 = User.objects.create_user(username="user3", password="password123")
+        self.task.assigned_users.add(self.user1, user3)
+        self.assertCounters(self.task, 0, 0, 3)
+
+        self.task.assigned_users.remove(user3, User.objects.create_user(username="user4"))
+        self.assertCounters(self.task, 0, 0, 2)
+
+        self.user2.assigned_tasks.remove(self.task)
+        user3.assigned_tasks.add(self.task)
+        self.assertCounters(self.task, 0, 0, 2)
+
+        version = get_task_version(self.user1.pk)
+        user3.delete()
+        self.assertCounters(self.task, 0, 0, 1)
+        self.assertNotEqual(get_task_version(self.user1.pk), version)
+
+        self.task.assigned_users.clear()
+        self.assertCounters(self.task, 0, 0, 0)
+
+    def test_saving_a_loaded_task_keeps_the_counters(self):
+        '''A task saved after its counters changed does not write back the old values'''
+        stale = Task.objects.get(pk=self.task.pk)
+        SubTask.objects.create(name="First", task=self.task)
+        stale.name = "Renamed"
+        stale.save()
+
+        self.assertCounters(self.task, 1, 0, 2)
+        self.assertEqual(self.task.name, "Renamed")
+
+    def test_saving_a_copy_or_a_deleted_task_inserts_it(self):
+        '''Keeping the counters out of updates leaves the usual insert fallbacks alone'''
+        copy = Task.objects.get(pk=self.task.pk)
+        copy.pk = None
+        copy.save()
+        self.assertEqual(Task.objects.count(), 2)
+        self.assertCounters(copy, 0, 0, 0)
+
+        SubTask.objects.create(name="First", task=copy)
+        Task.objects.filter(pk=copy.pk).delete()
+        copy.save()
+        self.assertTrue(Task.objects.filter(pk=copy.pk).exists())
+        self.assertCounters(copy, 0, 0, 0)
+
+    def test_subtasks_deleted_with_their_task(self):
+        '''Subtasks going with their task do not update it on the way'''
+        SubTask.objects.create(name="First", task=self.task)
+        with CaptureQueriesContext(connection) as queries:
+            self.task.delete()
+        self.assertFalse(Task.objects.exists())
+        self.assertFalse([query for query in queries if query['sql'].startswith('UPDATE')])
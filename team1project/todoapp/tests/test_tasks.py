@@ -1,12 +1,24 @@
 """Tests relating to task functionality and task views (task sharing, task archiving, etc.)"""
 
+import json
+import sys
 from urllib.parse import quote
 from datetime import timedelta
-from django.test import TestCase, Client
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db import connection
+from django.test import AsyncClient, TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
+from todoapp.access import can_accept, can_manage, can_view, is_member
+from todoapp.caching import get_task_version
 from todoapp.forms import TaskCollabForm
-from todoapp.models import Task, TaskCollabRequest, User
+from todoapp.models import Category, Task, TaskCollabRequest, User, UserSearchIndex
+from todoapp.pagination import decode_cursor, encode_cursor
+from todoapp.user_search import prefix_range, search_users
+from todoapp.views import BULK_TASK_MAX_IDS
 
 class TaskTests(TestCase):
     """Tests for task actions and functionality"""
@@ -423,3 +435,511 @@ class TestTaskShareLink(TestCase):
 
         # Verify redirect and that the user is in assigned users
         self.assertRedirects(response, expected_url)
+
+
+class TaskListQueryCountTests(TestCase):
+    """Test that the task list pages do not issue queries per task"""
+    def setUp(self):
+        self.password = "Gl989bert48!"
+        self.user = User.objects.create_user(username="owner", password=self.password)
+        self.other_user = User.objects.create_user(username="other", password=self.password)
+        self.category = Category.objects.create(name="Work")
+        self.client.login(username="owner", password=self.password)
+
+    def add_tasks(self, count):
+        """Create count owned and count shared tasks with categories and collaborators"""
+        for i in range(count):
+            owned = Task.objects.create(
+                name=f"Owned {i}",
+                creator=self.user,
+                description="owned",
+                due_date=timezone.now() + timedelta(days=i + 1),
+            )
+            owned.categories.add(self.category)
+            owned.assigned_users.add(self.other_user)
+
+            shared = Task.objects.create(
+                name=f"Shared {i}",
+                creator=self.other_user,
+                description="shared",
+                due_date=timezone.now() + timedelta(days=i + 1),
+            )
+            shared.categories.add(self.category)
+            shared.assigned_users.add(self.user)
+
+    def count_queries(self, url_name):
+        """Return the number of queries issued when rendering the page"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(url_name))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_task_view_query_count_is_constant(self):
+        """Rendering the task page costs the same number of queries for 2 or 20 tasks"""
+        self.add_tasks(2)
+        few = self.count_queries('task_view')
+
+        self.add_tasks(18)
+        many = self.count_queries('task_view')
+
+        self.assertEqual(few, many)
+
+    def test_task_view_under_asgi(self):
+        """The async task page renders the same lists through the ASGI handler"""
+        self.add_tasks(2)
+        client = AsyncClient()
+        client.force_login(self.user)
+
+        response = async_to_sync(client.get)(reverse('task_view'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['my_tasks']), 2)
+        self.assertEqual(len(response.context['shared_tasks']), 2)
+        self.assertContains(response, 'Owned 1')
+
+    def test_task_archive_query_count_is_constant(self):
+        """Rendering the archive page costs the same number of queries for 2 or 20 tasks"""
+        self.add_tasks(2)
+        Task.objects.update(is_archived=True)
+        few = self.count_queries('task_archive')
+
+        self.add_tasks(18)
+        Task.objects.update(is_archived=True)
+        many = self.count_queries('task_archive')
+
+        self.assertEqual(few, many)
+
+
+class UserSearchTests(TestCase):
+    """Tests for the indexed, cached user search of the share task autocomplete"""
+    def setUp(self):
+        """Create a task, a collaborator, a pending request and some users to find"""
+        cache.clear()
+        self.user = User.objects.create_user(username='Owner', password='password123')
+        self.client.login(username='Owner', password='password123')
+        self.task = Task.objects.create(name="Share me", creator=self.user,
+                                        due_date=timezone.now() + timedelta(days=1))
+
+        self.members = {
+            name: User.objects.create_user(username=name, password='password123')
+            for name in ('alice', 'Alfred', 'albert', 'alvin', 'bob')
+        }
+        self.task.assigned_users.add(self.members['albert'])
+        TaskCollabRequest.objects.create(task=self.task, from_user=self.user,
+                                         to_user=self.members['alvin'])
+
+    def field_id(self):
+        """Render the share page and return the signed id of its user picker"""
+        response = self.client.get(reverse('share_task', args=[self.task.id]))
+        return response.context['form'].fields['to_user'].widget.field_id
+
+    def search(self, field_id, term):
+        """Return the usernames the autocomplete endpoint lists for a term"""
+        response = self.client.get(reverse('user_search'), {'field_id': field_id, 'term': term})
+        self.assertEqual(response.status_code, 200)
+        return [result['text'] for result in response.json()['results']]
+
+    def test_index_follows_users(self):
+        """New users and renames are indexed, logins leave the index alone"""
+        self.assertEqual(
+            UserSearchIndex.objects.get(user=self.members['Alfred']).username_key, 'alfred'
+        )
+
+        self.members['bob'].username = 'Robert'
+        self.members['bob'].save()
+        self.assertEqual(
+            UserSearchIndex.objects.get(user=self.members['bob']).username_key, 'robert'
+        )
+
+        user = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(1):
+            user.save(update_fields=['last_login'])
+
+    def test_prefix_search_is_case_insensitive(self):
+        """Usernames are matched by prefix regardless of case"""
+        found = search_users('AL')
+        self.assertEqual([user.username for user in found],
+                         ['albert', 'Alfred', 'alice', 'alvin'])
+        self.assertEqual([user.username for user in search_users('b')], ['bob'])
+
+    def test_prefix_at_the_end_of_unicode(self):
+        """Terms ending in the last code point or before the surrogates still search"""
+        last = chr(sys.maxunicode)
+        User.objects.create_user(username=f'al{last}x', password='password123')
+        User.objects.create_user(username=last * 2, password='password123')
+
+        self.assertEqual(prefix_range(f'a{last}'), (f'a{last}', 'b'))
+        self.assertEqual(prefix_range(last), (last, None))
+        self.assertEqual(prefix_range('\ud7ff'), ('\ud7ff', '\ue000'))
+        self.assertEqual([user.username for user in search_users(f'al{last}')],
+                         [f'al{last}x'])
+        self.assertEqual([user.username for user in search_users(last)], [last * 2])
+        self.assertEqual(self.search(self.field_id(), last), [last * 2])
+
+    def test_autocomplete_excludes_members_and_requests(self):
+        """The owner, collaborators and users with a pending request are not offered"""
+        self.assertEqual(self.search(self.field_id(), 'al'), ['Alfred', 'alice'])
+        self.assertEqual(self.search(self.field_id(), 'owner'), [])
+
+    def test_autocomplete_results_are_cached(self):
+        """A repeated search is answered from the cache until users change"""
+        field_id = self.field_id()
+        self.search(field_id, 'al')
+
+        with self.assertNumQueries(2):  # session and user of the logged in client
+            self.assertEqual(self.search(field_id, 'al'), ['Alfred', 'alice'])
+
+        User.objects.create_user(username='Alma', password='password123')
+        self.assertEqual(self.search(field_id, 'al'), ['Alfred', 'alice', 'Alma'])
+
+    def test_forms_get_their_own_picker(self):
+        """Forms for different tasks do not share the cached widget"""
+        other = Task.objects.create(name="Other", creator=self.user,
+                                    due_date=timezone.now() + timedelta(days=1))
+        first = TaskCollabForm(user=self.user, task=self.task)
+        second = TaskCollabForm(user=self.user, task=other)
+
+        self.assertNotEqual(first.fields['to_user'].widget.field_id,
+                            second.fields['to_user'].widget.field_id)
+        self.assertIn(self.members['albert'].id, first.fields['to_user'].widget.exclude_ids)
+        self.assertNotIn(self.members['albert'].id, second.fields['to_user'].widget.exclude_ids)
+
+
+class TaskAccessTests(TestCase):
+    """Tests for the task access checks and the views using them"""
+    def setUp(self):
+        """Create a task with a collaborator, a user with a request and an outsider"""
+        self.creator = User.objects.create_user(username='creator', password='password123')
+        self.member = User.objects.create_user(username='member', password='password123')
+        self.invited = User.objects.create_user(username='invited', password='password123')
+        self.outsider = User.objects.create_user(username='outsider', password='password123')
+
+        self.task = Task.objects.create(name="Team task", creator=self.creator,
+                                        due_date=timezone.now() + timedelta(days=1))
+        self.task.assigned_users.add(self.member)
+        self.collab_request = TaskCollabRequest.objects.create(
+            task=self.task, from_user=self.creator, to_user=self.invited
+        )
+
+    def test_checks(self):
+        """The checks agree with who created, joined or was invited to the task"""
+        expected = {
+            self.creator: (False, True, False),
+            self.member: (True, True, False),
+            self.invited: (False, False, False),
+            self.outsider: (False, False, True),
+        }
+        for user, (member, view, accept) in expected.items():
+            with self.subTest(user=user.username):
+                self.assertEqual(is_member(user, self.task), member)
+                self.assertEqual(can_view(user, self.task), view)
+                self.assertEqual(can_accept(user, self.task), accept)
+
+    def test_each_check_is_one_query(self):
+        """Without annotations a check costs at most one query"""
+        with self.assertNumQueries(1):
+            is_member(self.member, self.task)
+        with self.assertNumQueries(1):
+            can_accept(self.outsider, self.task)
+        with self.assertNumQueries(0):
+            can_view(self.creator, self.task)
+
+    def test_annotated_checks_are_free(self):
+        """A task loaded with_access answers every check without another query"""
+        for user in (self.member, self.invited, self.outsider):
+            task = Task.objects.with_access(user).get(pk=self.task.pk)
+            with self.assertNumQueries(0):
+                is_member(user, task)
+                can_view(user, task)
+                can_accept(user, task)
+
+        # flags loaded for another user are not reused
+        task = Task.objects.with_access(self.member).get(pk=self.task.pk)
+        self.assertFalse(is_member(self.outsider, task))
+
+    def test_shared_task_view_query_count(self):
+        """The share link page loads the task and the access flags in one query"""
+        self.client.login(username='outsider', password='password123')
+        url = reverse('shared_task_view', args=[self.task.id])
+
+        with self.assertNumQueries(3):  # session, user and the task
+            response = self.client.get(url)
+
+        self.assertTrue(response.context['show_button'])
+        self.assertContains(response, 'creator')
+
+    def test_outsiders_cannot_manage_task(self):
+        """Users who cannot view a task get a 404 when changing it"""
+        self.client.login(username='outsider', password='password123')
+
+        for name in ('delete_task', 'archive_task', 'edit_task', 'share_task'):
+            with self.subTest(view=name):
+                response = self.client.get(reverse(name, args=[self.task.id]))
+                self.assertEqual(response.status_code, 404)
+
+        self.task.refresh_from_db()
+        self.assertFalse(self.task.is_archived)
+
+    def test_only_creator_can_manage_task(self):
+        """Collaborators can't archive, restore or delete a task, its creator can"""
+        self.assertTrue(can_manage(self.creator, self.task))
+        for user in (self.member, self.outsider, AnonymousUser()):
+            self.assertFalse(can_manage(user, self.task))
+
+        self.client.login(username='member', password='password123')
+        response = self.client.get(reverse('archive_task', args=[self.task.id]))
+        self.assertRedirects(response, reverse('task_view'))
+        self.task.refresh_from_db()
+        self.assertFalse(self.task.is_archived)
+
+        self.client.login(username='creator', password='password123')
+        self.client.get(reverse('archive_task', args=[self.task.id]))
+        self.task.refresh_from_db()
+        self.assertTrue(self.task.is_archived)
+
+        self.client.login(username='member', password='password123')
+        self.client.get(reverse('restore_task', args=[self.task.id]))
+        self.task.refresh_from_db()
+        self.assertTrue(self.task.is_archived)
+
+        response = self.client.get(reverse('delete_task', args=[self.task.id]))
+        self.assertRedirects(response, reverse('task_view'))
+        self.assertTrue(Task.objects.filter(pk=self.task.pk).exists())
+
+        self.client.login(username='creator', password='password123')
+        self.client.get(reverse('restore_task', args=[self.task.id]))
+        self.task.refresh_from_db()
+        self.assertFalse(self.task.is_archived)
+
+        self.client.get(reverse('delete_task', args=[self.task.id]))
+        self.assertFalse(Task.objects.filter(pk=self.task.pk).exists())
+
+    def test_requests_only_accepted_by_recipient(self):
+        """A collaboration request can only be answered by the user it was sent to"""
+        url = reverse('accept_task', args=[self.collab_request.id])
+
+        self.client.login(username='outsider', password='password123')
+        response = self.client.post(url, {'accept_request': ''})
+        self.assertEqual(response.status_code, 404)
+
+        self.client.login(username='invited', password='password123')
+        self.client.post(url, {'accept_request': ''})
+        self.assertTrue(is_member(self.invited, self.task))
+
+
+class BulkTaskActionTests(TestCase):
+    """Tests for the bulk task endpoints and the queryset methods behind them"""
+    def setUp(self):
+        """Log in a user with a few tasks and create a task of another user"""
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username='bulkuser', password='password123')
+        self.other = User.objects.create_user(username='otheruser', password='password123')
+        self.client.login(username='bulkuser', password='password123')
+
+        self.tasks = [
+            Task.objects.create(name=f"Task {i}", creator=self.user,
+                                due_date=timezone.now() + timedelta(days=1))
+            for i in range(3)
+        ]
+        self.foreign = Task.objects.create(name="Foreign", creator=self.other,
+                                           due_date=timezone.now() + timedelta(days=1))
+
+    def post(self, action, data):
+        """Post a JSON body to the bulk endpoint of action"""
+        return self.client.post(reverse('bulk_task_action', args=[action]),
+                                data=json.dumps(data), content_type='application/json')
+
+    def test_archive_and_restore(self):
+        """Archiving and restoring update every selected task"""
+        ids = [task.id for task in self.tasks]
+
+        response = self.post('archive', {'ids': ids})
+
+        self.assertEqual(response.json()['updated'], 3)
+        self.assertEqual(Task.objects.filter(is_archived=True).count(), 3)
+
+        response = self.post('restore', {'ids': ids})
+
+        self.assertEqual(response.json()['updated'], 3)
+        self.assertFalse(Task.objects.filter(is_archived=True).exists())
+        self.assertTrue(all(Task.objects.filter(pk__in=ids).values_list('ignore_archive', flat=True)))
+
+    def test_delete(self):
+        """Deleting removes the tasks and reports how many were deleted"""
+        response = self.post('delete', {'ids': [self.tasks[0].id, self.tasks[1].id]})
+
+        self.assertEqual(response.json()['updated'], 2)
+        self.assertEqual(list(Task.objects.filter(creator=self.user)), [self.tasks[2]])
+
+    def test_tasks_of_others_are_skipped(self):
+        """Tasks the user cannot view are left alone and counted as skipped"""
+        response = self.post('delete', {'ids': [self.tasks[0].id, self.foreign.id, 999999]})
+
+        self.assertEqual(response.json(), {
+            'success': True, 'action': 'delete', 'requested': 3, 'updated': 1, 'skipped': 2,
+        })
+        self.assertTrue(Task.objects.filter(pk=self.foreign.id).exists())
+
+    def test_collaborators_only_set_progress(self):
+        """A task shared with the user can have its progress set, but only its creator
+        may archive, restore or delete it"""
+        self.foreign.assigned_users.add(self.user)
+
+        for action in ('archive', 'restore', 'delete'):
+            with self.subTest(action=action):
+                response = self.post(action, {'ids': [self.foreign.id]})
+                self.assertEqual(response.json()['skipped'], 1)
+        self.foreign.refresh_from_db()
+        self.assertFalse(self.foreign.is_archived)
+
+        response = self.post('progress', {'ids': [self.foreign.id], 'progress': 40})
+        self.assertEqual(response.json()['updated'], 1)
+        self.foreign.refresh_from_db()
+        self.assertEqual(self.foreign.progress, 40)
+
+    def test_progress_applies_save_rules(self):
+        """100% completes the tasks and archives only the overdue ones"""
+        overdue = Task.objects.create(name="Overdue", creator=self.user,
+                                      due_date=timezone.now() - timedelta(days=1))
+
+        self.post('progress', {'ids': [self.tasks[0].id, overdue.id], 'progress': 100})
+
+        self.tasks[0].refresh_from_db()
+        overdue.refresh_from_db()
+        self.assertTrue(self.tasks[0].is_completed)
+        self.assertFalse(self.tasks[0].is_archived)
+        self.assertTrue(overdue.is_completed)
+        self.assertTrue(overdue.is_archived)
+
+    def test_invalid_requests(self):
+        """Bad bodies are rejected with 400 and unknown actions with 404"""
+        url = reverse('bulk_task_action', args=['archive'])
+        response = self.client.post(url, data='not json', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+        response = self.post('progress', {'ids': [self.tasks[0].id], 'progress': 150})
+        self.assertEqual(response.status_code, 400)
+
+        response = self.post('progress', {'ids': [self.tasks[0].id]})
+        self.assertEqual(response.status_code, 400)
+
+        response = self.post('archive', {'ids': list(range(BULK_TASK_MAX_IDS + 1))})
+        self.assertEqual(response.status_code, 400)
+
+        response = self.post('complete', {'ids': [self.tasks[0].id]})
+        self.assertEqual(response.status_code, 404)
+
+        response = self.client.get(reverse('bulk_task_action', args=['archive']))
+        self.assertEqual(response.status_code, 405)
+
+    def test_query_count_does_not_grow_with_tasks(self):
+        """Each action costs the same queries for 5 tasks as for 50"""
+        def count_queries(action, size):
+            tasks = Task.objects.bulk_create(
+                Task(name=f"Bulk {i}", creator=self.user,
+                     due_date=timezone.now() + timedelta(days=1))
+                for i in range(size)
+            )
+            for task in tasks:
+                task.assigned_users.add(self.other)
+            with CaptureQueriesContext(connection) as queries:
+                response = self.post(action, {'ids': [task.id for task in tasks], 'progress': 50})
+            self.assertEqual(response.json()['updated'], size)
+            return len(queries)
+
+        for action in ('archive', 'progress', 'delete'):
+            with self.subTest(action=action):
+                self.assertEqual(count_queries(action, 5), count_queries(action, 50))
+
+    def test_task_version_is_bumped(self):
+        """Cached task lists of the creator and collaborators are invalidated"""
+        self.tasks[0].assigned_users.add(self.other)
+        versions = (get_task_version(self.user.id), get_task_version(self.other.id))
+
+        self.post('archive', {'ids': [self.tasks[0].id]})
+
+        self.assertNotEqual(get_task_version(self.user.id), versions[0])
+        self.assertNotEqual(get_task_version(self.other.id), versions[1])
+
+
+@override_settings(TASK_PAGE_SIZE=2, TASK_PAGE_SIZE_MAX=3)
+class TaskPaginationTests(TestCase):
+    """Tests for the keyset pagination of the task and archive lists"""
+    def setUp(self):
+        """Log in a user with owned tasks created out of due order, with ties"""
+        self.client = Client()
+        self.user = User.objects.create_user(username='pager', password='password123')
+        self.other = User.objects.create_user(username='sharer', password='password123')
+        self.client.login(username='pager', password='password123')
+
+        due = timezone.now() + timedelta(days=1)
+        self.tasks = [
+            Task.objects.create(name=f"Task {i}", creator=self.user,
+                                due_date=due + timedelta(hours=hours))
+            for i, hours in enumerate([2, 0, 1, 0, 2])
+        ]
+        self.tasks.sort(key=lambda task: (task.due_date, task.id))
+
+    def walk(self, url_name, context_name, list_name):
+        """Follow the next links of a list and return the tasks of every page"""
+        pages = []
+        query = ''
+        while query is not None:
+            response = self.client.get(f'{reverse(url_name)}?{query}')
+            page = response.context[context_name]
+            pages.append(list(page))
+            query = page.next_query
+            if query is not None:
+                self.assertIn(f'{list_name}_after=', query)
+        return pages
+
+    def test_pages_cover_list_in_order(self):
+        """Walking the pages returns every task once, in (due_date, id) order"""
+        pages = self.walk('task_view', 'my_tasks', 'owned')
+
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        self.assertEqual([task for page in pages for task in page], self.tasks)
+
+    def test_archive_merges_owned_and_shared_tasks(self):
+        """The archive pages through owned and shared archived tasks as one list"""
+        shared = Task.objects.create(name="Shared", creator=self.other,
+                                     due_date=self.tasks[2].due_date)
+        shared.assigned_users.add(self.user)
+        Task.objects.update(is_archived=True)
+
+        pages = self.walk('task_archive', 'archived_tasks', 'archived')
+
+        expected = sorted(self.tasks + [shared], key=lambda task: (task.due_date, task.id))
+        self.assertEqual([task for page in pages for task in page], expected)
+
+    def test_cursor_keeps_filters_and_first_page_link(self):
+        """Next links keep the other parameters, later pages link back to the first"""
+        response = self.client.get(reverse('task_view'), {'page_size': 3})
+        page = response.context['my_tasks']
+        self.assertEqual(len(page), 3)
+        self.assertIsNone(page.first_query)
+        self.assertIn('page_size=3', page.next_query)
+
+        response = self.client.get(f"{reverse('task_view')}?{page.next_query}")
+        page = response.context['my_tasks']
+        self.assertEqual(list(page), self.tasks[3:])
+        self.assertEqual(page.first_query, 'page_size=3')
+        self.assertContains(response, 'First page')
+
+    def test_page_size_is_bounded(self):
+        """Page sizes above TASK_PAGE_SIZE_MAX or invalid fall back to the limits"""
+        response = self.client.get(reverse('task_view'), {'page_size': 1000})
+        self.assertEqual(len(response.context['my_tasks']), 3)
+
+        response = self.client.get(reverse('task_view'), {'page_size': 'all'})
+        self.assertEqual(len(response.context['my_tasks']), 2)
+
+    def test_invalid_cursor_shows_first_page(self):
+        """A malformed cursor is ignored instead of failing the page"""
+        self.assertIsNone(decode_cursor('not-a-cursor'))
+        self.assertEqual(decode_cursor(encode_cursor(self.tasks[0].due_date, self.tasks[0].pk)),
+                         (self.tasks[0].due_date, self.tasks[0].id))
+
+        response = self.client.get(reverse('task_view'), {'owned_after': 'not-a-cursor'})
+        self.assertEqual(list(response.context['my_tasks']), self.tasks[:2])
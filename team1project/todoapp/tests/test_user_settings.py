@@ -33,3 +33,14 @@ class EditProfileUpdateTest(TestCase):
         self.assertEqual(self.user.username, 'updatedusername')
         self.assertEqual(self.user.email, 'updated@gmail.com')
         self.assertTrue(self.user.check_password('updatedpassword123'))
+
+    def test_update_holiday_country(self):
+        """Testing that the holiday country is saved for the user's session"""
+        self.client.login(username="test", password="thisisatest123")
+
+        self.client.post(reverse('edit_profile'), {'holiday_country': 'CA'})
+        self.assertEqual(self.client.session['holiday_country'], 'CA')
+
+        # countries that are not configured are ignored
+        self.client.post(reverse('edit_profile'), {'holiday_country': 'XX'})
+        self.assertEqual(self.client.session['holiday_country'], 'CA')
@@ -1,19 +1,31 @@
 """Tests for all the user-facing views in todoapp (index, auth, profile, task APIs)."""
 
 import json
+import time
 from datetime import timedelta
-from unittest.mock import patch, Mock, MagicMock
+from unittest.mock import patch, Mock
 
+import aiohttp
 import requests
+from asgiref.sync import async_to_sync
 
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
-from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test import AsyncClient, Client, RequestFactory, TestCase, override_settings
 from django.urls import reverse
 from django.utils import timezone
 
-from todoapp.models import Category, Task, User
-from todoapp.views import get_filtered_tasks, show_quote, get_ai_task_suggestion
+from todoapp.checks import check_shared_cache
+from todoapp.models import Category, Task, User, WebPushSubscription
+from todoapp.quotes import (
+    QUOTE_UNAVAILABLE, FixtureQuoteProvider, aget_today_quote, get_today_quote,
+    seconds_until_midnight
+)
+from todoapp.suggestions import (
+    PatternSuggestionEngine, TaskSnapshot, build_prompt_context, get_suggestion_client,
+    get_suggestion_job
+)
+from todoapp.views import get_task_partitions
 
 User = get_user_model()
 
@@ -172,85 +184,79 @@ class FilterTasksViewTest(TestCase): # pylint: disable=R0902
         )
         self.archived_task.categories.add(self.category_personal)
 
-    def test_get_filtered_tasks_no_filter(self):
-        """Default view shows all owned and shared tasks when no filter is applied."""
+    def test_get_task_partitions_query_count(self):
+        '''
+        Test that each partition costs one keyset query per part (two for the archive)
+        plus the two prefetches shared by all of them, however many tasks there are
+
+        The lists used to come from one query over every visible task, which had to be
+        read in full; paging each part from its index takes one query per part instead.
+        '''
         factory = RequestFactory()
         request = factory.get('/')
         request.user = self.user
 
-        form, my_tasks, shared_tasks, filtered_archived_tasks = get_filtered_tasks(request)
+        with self.assertNumQueries(4 + 2):
+            _, partitions = get_task_partitions(request, 'owned', 'shared', 'archived')
 
-        # Test that form was not submitted
-        self.assertEqual(form.is_valid(), False)
+        self.assertCountEqual(partitions['owned'], [self.task_1, self.task_3])
+        self.assertEqual(list(partitions['shared']), [self.task_2])
+        self.assertEqual(list(partitions['archived']), [self.archived_task])
 
-        # Test that all tasks appear
-        self.assertEqual(my_tasks.count(), 2)
-        self.assertEqual(shared_tasks.count(), 1)
-        self.assertEqual(filtered_archived_tasks.count(), 1)
+        for i in range(30):
+            Task.objects.create(name=f'More {i}', creator=self.user, description='More',
+                                due_date=timezone.now() + timedelta(days=i))
+        with self.assertNumQueries(4 + 2):
+            get_task_partitions(request, 'owned', 'shared', 'archived')
 
-        # Test that all of them appear on page
-        self.assertTrue(self.task_1 in my_tasks)
-        self.assertTrue(self.task_2 in shared_tasks)
-        self.assertTrue(self.task_3 in my_tasks)
-        self.assertTrue(self.archived_task in filtered_archived_tasks)
+    def test_get_task_partitions_only_requested(self):
+        '''
+        Test that only the requested partitions are built
+        '''
+        factory = RequestFactory()
+        request = factory.get('/')
+        request.user = self.user
+
+        _, partitions = get_task_partitions(request, 'archived')
 
+        self.assertEqual(list(partitions), ['archived'])
+        self.assertEqual(list(partitions['archived']), [self.archived_task])
 
-    def test_get_filtered_tasks_filter(self):
+    def test_get_task_partitions_filter_archived(self):
         '''
-            Test that filter works
+        Test that archived tasks can be filtered
         '''
         factory = RequestFactory()
         request = factory.get('/',{
             'make-filter': 'true',
-            'user_category_filter': [self.category_work.id]
+            'user_category_filter': [self.category_personal.id]
         })
-
         request.user = self.user
 
-        form, my_tasks, shared_tasks, filtered_archived_tasks = get_filtered_tasks(request)
-
-        # Test that the form is valid
-        self.assertEqual(form.is_valid(), True)
-
-        # Test that there is only one task in my_tasks and
-        # shared_tasks and none in archived tasks
-        self.assertEqual(my_tasks.count(), 1)
-        self.assertEqual(shared_tasks.count(), 1)
-        self.assertEqual(filtered_archived_tasks.count(), 0)
-
-        # Check that task 1 and 2 were filtred, but task 3
-        # was not included. Also check that archived task was not included
-        self.assertTrue(self.task_1 in my_tasks)
-        self.assertTrue(self.task_2 in shared_tasks)
-        self.assertFalse(self.task_3 in my_tasks)
-        self.assertFalse(self.archived_task in filtered_archived_tasks)
+        _, partitions = get_task_partitions(request, 'owned', 'shared', 'archived')
 
+        # tasks without a category are kept by every filter
+        self.assertEqual(list(partitions['owned']), [self.task_1])
+        self.assertEqual(list(partitions['shared']), [])
+        self.assertEqual(list(partitions['archived']), [self.archived_task])
 
-    def test_get_filtered_tasks_filter_archived(self):
+    def test_get_task_partitions_filter(self):
         '''
-        Test that archived tasks can be filtered
+        Test that the category filter is applied to every partition
         '''
         factory = RequestFactory()
         request = factory.get('/',{
             'make-filter': 'true',
-            'user_category_filter': [self.category_personal.id]
+            'user_category_filter': [self.category_work.id]
         })
-
         request.user = self.user
 
-        form, my_tasks , shared_tasks, filtered_archived_tasks = get_filtered_tasks(request)
+        form, partitions = get_task_partitions(request, 'owned', 'shared', 'archived')
 
-        # Test that the form is valid
         self.assertEqual(form.is_valid(), True)
-
-        # Test that there is one task in my_tasks and
-        # none in shared_tasks, and one in archived tasks
-        self.assertEqual(my_tasks.count(), 1)
-        self.assertEqual(shared_tasks.count(), 0)
-        self.assertEqual(filtered_archived_tasks.count(), 1)
-
-        # Check that the archived task was filtered
-        self.assertTrue(self.archived_task in filtered_archived_tasks)
+        self.assertEqual(list(partitions['owned']), [self.task_1])
+        self.assertEqual(list(partitions['shared']), [self.task_2])
+        self.assertEqual(list(partitions['archived']), [])
 
 @override_settings(TRUSTED_ORIGINS=["https://testserver"])
 class PushNotificationViewsTests(TestCase):
@@ -298,123 +304,257 @@ class PushNotificationViewsTests(TestCase):
         self.assertEqual(response.status_code, 400)
         self.assertIn("Invalid JSON", response.json()["error"])
 
+    def test_save_subscription_async(self):
+        ''' The subscription is saved when the view runs under ASGI '''
+        client = AsyncClient()
+        client.force_login(self.user)
 
-class GetAITaskSuggestionTest(TestCase):
-    ''' Tests for the get_ai_task_suggestion view'''
-    def setUp(self):
-        self.factory = RequestFactory()
-        self.user = User.objects.create_user(username='testuser', password='test123')
-
-    @patch('todoapp.views.OpenAI')
-    def test_returns_suggestion_when_generate_task_in_get(self, mock_openai):
-        '''ensures that the OpenAI API returns an acceptable response when the user 
-        has one task created and the generate-task parameter is in the URL'''
-        # create a mock task
-        cat = Category.objects.create(name='Personal')
-        t = Task.objects.create(
-            name='some task',
-            description='do something',
-            due_date='2025-04-25',
-            creator=self.user
+        response = async_to_sync(client.post)(
+            "/save-subscription/",
+            data=json.dumps(self.subscription_data),
+            content_type="application/json",
+            headers={"origin": "https://testserver"},
         )
-        t.categories.add(cat)
 
-        req = self.factory.get('/fake-url?generate-task')
-        req.user = self.user
+        self.assertEqual(response.status_code, 200)
+        subscription = WebPushSubscription.objects.get(user=self.user)
+        self.assertEqual(subscription.subscription_info, self.subscription_data)
 
-        # create a mock suggested task
-        json_payload = {
-            'name': 'suggested Task',
-            'description': 'do something else',
-            'due_date': '2025-04-30',
-            'categories': ['Work']
-        }
-        choice = MagicMock()
-        # choice.message is an object with attribute content
-        choice.message = MagicMock()
-        choice.message.content = json.dumps(json_payload)
-
-        mock_resp = MagicMock()
-        mock_resp.choices = [choice]
-
-        client = MagicMock()
-        client.chat.completions.create.return_value = mock_resp
-        mock_openai.return_value = client
-
-        result = get_ai_task_suggestion(req)
-
-        # assertions
-        self.assertIsInstance(result, dict)
-        self.assertEqual(result['name'], json_payload['name'])
-        self.assertEqual(result['categories'], json_payload['categories'])
-        mock_openai.assert_called_once()
-
-    @patch('todoapp.views.OpenAI')
-    def test_raises_json_decode_error_on_bad_json(self, mock_openai):
-        """If the assistant returns invalid JSON, json.loads() should propagate."""
-        req = self.factory.get('/fake-url?generate-task')
-        req.user = self.user
-        # give the user at least one existing task
-        category = Category.objects.create(name='Personal')
+
+class BuildPromptContextTest(TestCase):
+    ''' Tests for the bounded, cached prompt context of task suggestions '''
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='test123')
+        self.category = Category.objects.create(name='Work')
+
+    def add_tasks(self, count, description='do something'):
+        ''' create count tasks with a category for the user '''
+        for i in range(count):
+            Task.objects.create(
+                name=f'task {i}',
+                description=description,
+                due_date=timezone.now() + timedelta(days=i),
+                creator=self.user
+            ).categories.add(self.category)
+
+    def test_empty_without_tasks(self):
+        ''' no tasks gives an empty context '''
+        self.assertEqual(build_prompt_context(self.user), '')
+
+    def test_limited_to_recent_tasks(self):
+        ''' only the most recent tasks are included, using two queries '''
+        self.add_tasks(40)
+
+        with self.assertNumQueries(2):
+            context = build_prompt_context(self.user, limit=5)
+
+        self.assertEqual(context.count('Task: '), 5)
+        self.assertIn('Task: task 39', context)
+        self.assertNotIn('Task: task 34', context)
+        self.assertIn('Categories: Work', context)
+
+    def test_token_budget(self):
+        ''' long histories are cut to the token budget '''
+        self.add_tasks(10, description='x' * 1000)
+
+        context = build_prompt_context(self.user, token_budget=200)
+
+        self.assertLessEqual(len(context) // 4, 200)
+        self.assertGreater(context.count('Task: '), 0)
+        self.assertLess(context.count('Task: '), 10)
+
+    def test_cached_until_tasks_change(self):
+        ''' the context is reused without queries until a task changes '''
+        self.add_tasks(2)
+        build_prompt_context(self.user)
+
+        with self.assertNumQueries(0):
+            build_prompt_context(self.user)
+
+        self.add_tasks(1)
+        self.assertEqual(build_prompt_context(self.user).count('Task: '), 3)
+
+@override_settings(TASK_SUGGESTION_CLIENT='local')
+class TaskSuggestionJobTest(TestCase):
+    ''' Tests for suggestions generated in the background and polled for '''
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='test123')
+        self.client.login(username='testuser', password='test123')
+        self.category = Category.objects.create(name='Work')
         Task.objects.create(
-        name='some task',
-            description='this is just a placeholder task',
-            due_date='2025-04-25',
+            name='Write report',
+            description='quarterly numbers',
+            due_date=timezone.now() + timedelta(days=1),
             creator=self.user
-        ).categories.add(category)
+        ).categories.add(self.category)
+
+    def wait_for_job(self, job_id):
+        ''' poll the job state until the worker thread finished it '''
+        for _ in range(100):
+            job = get_suggestion_job(job_id)
+            if job['status'] != 'pending':
+                return job
+            time.sleep(0.02)
+        self.fail('suggestion job did not finish')
+
+    def test_page_renders_without_waiting_for_the_model(self):
+        ''' the task page returns a job id instead of calling the model inline '''
+        with patch('todoapp.suggestions.run_suggestion_job') as run_job:
+            response = self.client.get(reverse('task_view'), {'generate-task': ''})
 
-        req = self.factory.get('/fake-url?generate-task')
-        req.user = self.user
+        self.assertEqual(response.status_code, 200)
+        job_id = response.context['suggestion_job']
+        self.assertIsNotNone(job_id)
+        self.assertContains(response, reverse('task_suggestion_status', args=[job_id]))
+
+        # the job is still pending, so polling reports it as such
+        pending = self.client.get(reverse('task_suggestion_status', args=[job_id]))
+        self.assertEqual(pending.json(), {'status': 'pending', 'suggestion': None})
+        run_job.assert_called_once()
+
+    def test_poll_returns_finished_suggestion(self):
+        ''' the local client suggestion is served by the polling endpoint '''
+        response = self.client.get(reverse('task_view'), {'generate-task': ''})
+        job_id = response.context['suggestion_job']
+        self.wait_for_job(job_id)
+
+        data = self.client.get(reverse('task_suggestion_status', args=[job_id])).json()
+
+        self.assertEqual(data['status'], 'done')
+        self.assertEqual(data['suggestion']['name'], 'Follow up on Write report')
+        self.assertEqual(data['suggestion']['categories'], ['Work'])
+
+    def test_running_job_is_reused(self):
+        ''' reloading the page while a job runs does not queue another one '''
+        with patch('todoapp.suggestions.run_suggestion_job') as run_job:
+            first = self.client.get(reverse('task_view'), {'generate-task': ''})
+            second = self.client.get(reverse('task_view'), {'generate-task': ''})
+
+        self.assertEqual(first.context['suggestion_job'], second.context['suggestion_job'])
+        run_job.assert_called_once()
+
+    def test_failed_job(self):
+        ''' a model error is reported as a failed job '''
+        with patch('todoapp.suggestions.request_suggestion', side_effect=ValueError('boom')), \
+                self.assertLogs('todoapp.suggestions', 'ERROR'):
+            response = self.client.get(reverse('task_view'), {'generate-task': ''})
+            job = self.wait_for_job(response.context['suggestion_job'])
+
+        self.assertEqual(job['status'], 'failed')
+
+    def test_other_users_cannot_poll(self):
+        ''' a job id is only visible to the user that started it '''
+        with patch('todoapp.suggestions.run_suggestion_job'):
+            response = self.client.get(reverse('task_view'), {'generate-task': ''})
+        job_id = response.context['suggestion_job']
+
+        User.objects.create_user(username='other', password='test123')
+        self.client.login(username='other', password='test123')
+
+        response = self.client.get(reverse('task_suggestion_status', args=[job_id]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_suggestion_cached_for_unchanged_tasks(self):
+        ''' a second click reuses the suggestion until the user's tasks change '''
+        first = self.client.get(reverse('task_view'), {'generate-task': ''})
+        self.wait_for_job(first.context['suggestion_job'])
+
+        with patch('todoapp.suggestions.request_suggestion') as request_suggestion:
+            second = self.client.get(reverse('task_view'), {'generate-task': ''})
+            job = get_suggestion_job(second.context['suggestion_job'])
+            self.assertEqual(job['status'], 'done')
+            self.assertEqual(job['suggestion']['name'], 'Follow up on Write report')
+            request_suggestion.assert_not_called()
+
+        Task.objects.create(name='Call bank', creator=self.user,
+                            due_date=timezone.now() + timedelta(days=2))
+        third = self.client.get(reverse('task_view'), {'generate-task': ''})
+        job = self.wait_for_job(third.context['suggestion_job'])
+        self.assertEqual(job['suggestion']['name'], 'Follow up on Call bank')
+
+    def test_client_is_reused(self):
+        ''' the model client is built once instead of on every suggestion '''
+        self.assertIs(get_suggestion_client(), get_suggestion_client())
+
+    @override_settings(TASK_SUGGESTION_ENGINE='pattern')
+    def test_local_engine_runs_inline(self):
+        ''' the pattern engine finishes the job before the page is rendered '''
+        with patch('todoapp.suggestions.get_executor') as get_executor:
+            response = self.client.get(reverse('task_view'), {'generate-task': ''})
+
+        job = get_suggestion_job(response.context['suggestion_job'])
+        self.assertEqual(job['status'], 'done')
+        get_executor.assert_not_called()
+
+    def test_job_state_needs_a_shared_cache(self):
+        ''' a per-process cache outside of development is reported by a system check '''
+        with override_settings(TESTING=False):
+            self.assertEqual([error.id for error in check_shared_cache(None)],
+                             ['todoapp.W001'])
+        with override_settings(TESTING=False, DEBUG=True):
+            self.assertEqual(check_shared_cache(None), [])
+
+class PatternSuggestionEngineTest(TestCase):
+    ''' Tests for the offline recurring task suggestion engine '''
+    def setUp(self):
+        self.engine = PatternSuggestionEngine()
+        self.now = timezone.now()
 
-        bad_choice = MagicMock()
-        bad_choice.message = MagicMock()
-        bad_choice.message.content = "not a JSON string"
+    def snapshot(self, name, days, categories=()):
+        ''' a task snapshot due the given number of days from now '''
+        return TaskSnapshot(name, '', self.now + timedelta(days=days), tuple(categories))
 
-        mock_resp = MagicMock()
-        mock_resp.choices = [bad_choice]
+    def test_suggests_next_occurrence_of_recurring_task(self):
+        ''' weekly tasks suggest the next week, ignoring one-off tasks '''
+        tasks = [self.snapshot('Gym', -7 * i, ['Health']) for i in range(4)]
+        tasks += [self.snapshot('Dentist', -3, ['Personal'])]
 
-        client = MagicMock()
-        client.chat.completions.create.return_value = mock_resp
-        mock_openai.return_value = client
+        suggestion = self.engine.suggest(tasks)
 
-        # json.loads will run and raise JSONDecodeError
-        with self.assertRaises(json.JSONDecodeError):
-            get_ai_task_suggestion(req)
+        self.assertEqual(suggestion['name'], 'Gym')
+        self.assertEqual(suggestion['categories'], ['Health'])
+        self.assertEqual(suggestion['due_date'], (self.now + timedelta(days=7)).isoformat())
+        self.assertIn('every 7 days', suggestion['description'])
 
-    def test_returns_none_without_generate_task_param(self):
-        '''ensures that nothing is returned if the generate-task 
-        parameter is not included in the url'''
-        req = self.factory.get('/fake-url')
-        req.user = self.user
-        self.assertIsNone(get_ai_task_suggestion(req))
+    def test_past_recurrence_moves_to_the_future(self):
+        ''' a pattern that stopped a while ago is projected past now '''
+        tasks = [self.snapshot('Report', -30 - 2 * i, ['Work']) for i in range(3)]
 
-    def test_returns_none_when_no_tasks_exist(self):
-        """If the user has no existing tasks, view returns None."""
-        req = self.factory.get('/fake-url?generate-task')
-        req.user = self.user
-        # ensure no tasks for this user
-        Task.objects.filter(creator=self.user).delete()
-        self.assertIsNone(get_ai_task_suggestion(req))
+        suggestion = self.engine.suggest(tasks)
 
+        self.assertGreaterEqual(suggestion['due_date'], self.now.isoformat())
+
+    def test_falls_back_without_recurrence(self):
+        ''' without repeated category sets the latest task is followed up '''
+        tasks = [self.snapshot('Paint fence', 1, ['Home']), self.snapshot('Call mom', 2)]
+
+        suggestion = self.engine.suggest(tasks)
+
+        self.assertEqual(suggestion['name'], 'Follow up on Paint fence')
+        self.assertEqual(suggestion['categories'], ['Home'])
+
+@override_settings(QUOTE_PROVIDER='zenquotes')
 class GetTodayQuoteTest(TestCase):
-    '''Test and mock the zenquotes api responses in show_quote function'''
+    '''Test and mock the zenquotes api responses in get_today_quote'''
     def setUp(self):
         '''Set up for it'''
         self.zenquote_url = 'https://zenquotes.io/api/today/'
-        cache.delete('zenquote_today')
+        cache.clear()
 
     def test_cached_quote(self):
-        '''Test if a cached quote is accessed when calling show_quote'''
+        '''Test if a cached quote is accessed when calling get_today_quote'''
         # Cache quote to test function
         my_quote = "To be or not to be, that is the question"
         cache.set('zenquote_today', my_quote)
 
-        get_quote = show_quote()
+        get_quote = get_today_quote()
 
         # Check that the quote was cached
         self.assertEqual(get_quote, my_quote)
 
-    @patch('todoapp.views.requests.get')
+    @patch('todoapp.quotes.requests.get')
     def test_get_today_quote(self, mock_get):
         '''Mock api call to zenquote and check it responds'''
         mock_response = Mock()
@@ -422,18 +562,93 @@ class GetTodayQuoteTest(TestCase):
         mock_get.return_value = mock_response
 
         # Test the response
-        response = show_quote()
+        response = get_today_quote()
 
         mock_get.assert_called_once_with(self.zenquote_url, timeout=5)
         self.assertEqual(response, "<blockquote>New quote</blockquote>")
         self.assertEqual(cache.get('zenquote_today'), "<blockquote>New quote</blockquote>")
 
     # Test that exception can be raised
-    @patch('todoapp.views.requests.get')
+    @patch('todoapp.quotes.requests.get')
     def test_get_today_quote_exception(self, mock_get):
         '''Mock an api call that returns an exception'''
         mock_get.side_effect = requests.exceptions.RequestException()
 
-        result = show_quote()
+        result = get_today_quote()
 
         self.assertEqual(result, "Could not fetch today's quote.")
+
+    @patch('todoapp.quotes.requests.get')
+    def test_failure_is_cached(self, mock_get):
+        '''An outage is only paid for once, later requests skip the upstream call'''
+        mock_get.side_effect = requests.exceptions.Timeout()
+
+        self.assertEqual(get_today_quote(), QUOTE_UNAVAILABLE)
+        self.assertEqual(get_today_quote(), QUOTE_UNAVAILABLE)
+
+        mock_get.assert_called_once()
+
+    @patch('todoapp.quotes.cache.set')
+    @patch('todoapp.quotes.requests.get')
+    def test_quote_expires_at_midnight(self, mock_get, mock_set):
+        '''The fresh quote is cached until the next local midnight'''
+        mock_get.return_value.json.return_value = [{"h": "<blockquote>q</blockquote>"}]
+
+        with patch('todoapp.quotes.seconds_until_midnight', return_value=1234):
+            get_today_quote()
+
+        mock_set.assert_any_call('zenquote_today', "<blockquote>q</blockquote>", timeout=1234)
+
+    def test_seconds_until_midnight(self):
+        '''The expiry is aligned to the local day'''
+        local = timezone.localtime().replace(hour=23, minute=59, second=30, microsecond=0)
+        self.assertEqual(seconds_until_midnight(local), 30)
+
+    @patch('todoapp.quotes.requests.get')
+    def test_stale_quote_served_while_refreshing(self, mock_get):
+        '''After expiry the last quote is served at once and refreshed in the background'''
+        mock_get.return_value.json.return_value = [{"h": "<blockquote>New</blockquote>"}]
+        cache.set('zenquote_last', "<blockquote>Old</blockquote>")
+
+        with patch('todoapp.quotes.threading.Thread') as mock_thread:
+            self.assertEqual(get_today_quote(), "<blockquote>Old</blockquote>")
+            # a second request does not start another refresh
+            get_today_quote()
+
+        mock_thread.assert_called_once()
+        mock_get.assert_not_called()
+
+        # run the refresh the thread would have run, which closes its DB connections
+        with patch('todoapp.quotes.connections') as mock_connections:
+            mock_thread.call_args.kwargs['target']()
+        mock_connections.close_all.assert_called_once_with()
+        self.assertEqual(get_today_quote(), "<blockquote>New</blockquote>")
+
+    @override_settings(QUOTE_PROVIDER='fixture')
+    @patch('todoapp.quotes.requests.get')
+    def test_fixture_provider(self, mock_get):
+        '''The fixture provider works offline'''
+        quote = get_today_quote()
+
+        self.assertIn(quote, [
+            f'<blockquote>&ldquo;{text}&rdquo; &mdash; <footer>{author}</footer></blockquote>'
+            for text, author in FixtureQuoteProvider.quotes
+        ])
+        mock_get.assert_not_called()
+
+    @override_settings(QUOTE_PROVIDER='fixture')
+    def test_async_quote(self):
+        '''The async views fetch and cache the quote like the sync ones'''
+        quote = async_to_sync(aget_today_quote)()
+
+        self.assertEqual(quote, FixtureQuoteProvider().fetch())
+        self.assertEqual(cache.get('zenquote_today'), quote)
+        self.assertEqual(cache.get('zenquote_last'), quote)
+
+    @patch('todoapp.quotes.ZenQuotesProvider.afetch', side_effect=aiohttp.ClientError())
+    def test_async_quote_failure_is_cached(self, mock_afetch):
+        '''A failed async fetch falls back and is not retried by the next request'''
+        self.assertEqual(async_to_sync(aget_today_quote)(), QUOTE_UNAVAILABLE)
+        self.assertEqual(async_to_sync(aget_today_quote)(), QUOTE_UNAVAILABLE)
+
+        mock_afetch.assert_called_once()
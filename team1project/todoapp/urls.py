@@ -5,12 +5,13 @@ Configure available urls in todoapp and their respective views
 from django.urls import path, include
 from django.contrib.auth.views import LogoutView
 from .views import index, ProfileSettings, EditProfile, register, task_archive
-from . import views
+from . import api, views
 
 
 urlpatterns = [
 	path('', index, name='index'),
 	path('select2/', include('django_select2.urls')),
+	path('user_search/', views.UserSearchView.as_view(), name='user_search'),
 	path('profile_settings/', ProfileSettings.as_view(), name='profile_settings'),
 	path('logout/', LogoutView.as_view(), name='logout'),
 	path('register/', register, name='register'),
@@ -19,6 +20,9 @@ urlpatterns = [
 	path('tasks/delete/<int:task_id>/', views.delete_task, name='delete_task'),
 	path('tasks/archive/<int:task_id>/', views.archive_task, name='archive_task'),
 	path('tasks/restore/<int:task_id>/', views.restore_task, name='restore_task'),
+	path('tasks/suggestion/<str:job_id>/', views.task_suggestion_status,
+		name='task_suggestion_status'),
+	path('tasks/bulk/<str:action>/', views.bulk_task_action, name='bulk_task_action'),
 	path('tasks/add/', views.add_task, name='add_task'),
 	path('tasks/edit/<int:task_id>/', views.edit_task, name='edit_task'),
 	path('tasks/share/<int:task_id>', views.share_task, name='share_task'),
@@ -34,4 +38,16 @@ urlpatterns = [
 	path('save-subscription/', views.save_subscription, name='save_subscription'),
 	path('service-worker.js', views.service_worker, name='service_worker'),
 	path('about/', views.about, name='about'),
+	path('api/tasks/', api.task_list, name='api_task_list'),
+	path('api/tasks/<int:task_id>/', api.task_detail, name='api_task_detail'),
+	path('api/tasks/<int:task_id>/subtasks/', api.subtask_list, name='api_subtask_list'),
+	path('api/subtasks/<int:subtask_id>/', api.subtask_detail, name='api_subtask_detail'),
+	path('api/categories/', api.category_list, name='api_category_list'),
+	path('api/requests/', api.request_list, name='api_request_list'),
+	path('api/requests/<int:request_id>/', api.request_detail, name='api_request_detail'),
+	path('api/requests/<int:request_id>/accept/', api.accept_request,
+		name='api_accept_request'),
+	path('api/sync/', api.sync_changes, name='api_sync'),
+	path('api/events/stream/', api.event_stream, name='api_event_stream'),
+	path('api/events/poll/', api.event_poll, name='api_event_poll'),
 ]
@@ -0,0 +1,103 @@
+"""Username search used by the share task autocomplete.
+
+Usernames are matched by prefix, case-insensitively, against UserSearchIndex. The
+prefix is turned into a [term, next term) range on the indexed username_key, which
+every database can answer from its B-tree index without reading the whole user table.
+Pages of results are cached per task and term, and the cache is invalidated by a
+version that changes whenever a user is added, renamed or removed."""
+import hashlib
+import sys
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+
+from .models import UserSearchIndex
+
+User = get_user_model()
+
+USER_SEARCH_VERSION_KEY = 'user_search_version'
+USER_SEARCH_TIMEOUT = 60 * 5
+
+
+def normalize_username(username):
+    """Return the key a username is indexed and searched by."""
+    return username.casefold()
+
+
+def prefix_range(term):
+    """Return the (lower, upper) bounds of the keys starting with term. upper is None
+    when no string sorts after those keys, i.e. term only holds the last code point."""
+    key = normalize_username(term)
+    # keys starting with the last code point end where the rest of the prefix ends
+    stem = key.rstrip(chr(sys.maxunicode))
+    if not stem:
+        return key, None
+    following = ord(stem[-1]) + 1
+    if 0xD800 <= following <= 0xDFFF:
+        # surrogates cannot be stored, the next storable code point sorts after them
+        following = 0xE000
+    return key, stem[:-1] + chr(following)
+
+
+def search_users(term, exclude_ids=(), queryset=None):
+    """Return the users whose username starts with term, ordered by username."""
+    if queryset is None:
+        queryset = User.objects.all()
+    queryset = queryset.exclude(pk__in=exclude_ids)
+
+    term = term.strip()
+    if term:
+        lower, upper = prefix_range(term)
+        queryset = queryset.filter(search_index__username_key__gte=lower)
+        if upper is not None:
+            queryset = queryset.filter(search_index__username_key__lt=upper)
+    return queryset.order_by('search_index__username_key')
+
+
+def index_users(users):
+    """Add or refresh the index rows of the given users in one query.
+
+    Needed after bulk_create or update(), which skip the signals keeping it in sync."""
+    UserSearchIndex.objects.bulk_create(
+        [
+            UserSearchIndex(user_id=user.pk, username_key=normalize_username(user.username))
+            for user in users
+        ],
+        update_conflicts=True,
+        unique_fields=['user'],
+        update_fields=['username_key'],
+    )
+    bump_user_search_version()
+
+
+def get_user_search_version():
+    """Return the current version of the cached search results."""
+    version = cache.get(USER_SEARCH_VERSION_KEY)
+    if version is None:
+        cache.add(USER_SEARCH_VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(USER_SEARCH_VERSION_KEY)
+    return version
+
+
+def bump_user_search_version():
+    """Invalidate every cached search result."""
+    try:
+        cache.incr(USER_SEARCH_VERSION_KEY)
+    except ValueError:
+        # evicted, start from a value no earlier version can have used
+        cache.set(USER_SEARCH_VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def user_search_cache_key(task_id, exclude_ids, term, page):
+    """Return the cache key of one page of search results for a task.
+
+    The excluded users are part of the key, so new collaborators or requests give a
+    fresh key instead of serving users that can no longer be picked. The term
+    and page are hashed so any input makes a valid key for every cache backend."""
+    search = hashlib.blake2b(digest_size=16)
+    search.update(','.join(str(pk) for pk in sorted(exclude_ids)).encode())
+    search.update(b'\0' + normalize_username(term.strip()).encode())
+    search.update(b'\0' + str(page).encode())
+    return f'user_search:{get_user_search_version()}:{task_id}:{search.hexdigest()}'
+
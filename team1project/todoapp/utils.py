@@ -1,7 +1,53 @@
-"""Module providing an HTMLTaskCalendar that displays tasks and holidays."""
+"""Module providing an HTMLTaskCalendar that displays tasks and holidays,
+plus the date range and holiday helpers used by the calendar page."""
 
 import calendar
-from datetime import datetime
+from datetime import datetime, timedelta
+from functools import lru_cache
+from types import MappingProxyType
+
+import holidays
+from django.utils import timezone
+
+
+def month_range(year, month):
+    """Return the aware [start, end) datetimes covering a month in the current time zone."""
+    start = timezone.make_aware(datetime(year, month, 1))
+    if month == 12:
+        end = timezone.make_aware(datetime(year + 1, 1, 1))
+    else:
+        end = timezone.make_aware(datetime(year, month + 1, 1))
+    return start, end
+
+
+def day_range(year, month, day):
+    """Return the aware [start, end) datetimes covering one day in the current time zone."""
+    start = timezone.make_aware(datetime(year, month, day))
+    return start, start + timedelta(days=1)
+
+
+@lru_cache(maxsize=32)
+def _year_holidays(country, year):
+    """Compute a country's holidays for one year (pure, so safe to cache per process)."""
+    return dict(holidays.country_holidays(country, years=year))
+
+
+@lru_cache(maxsize=512)
+def get_month_holidays(country, year, month):
+    """Return a read-only {day: name} mapping of a country's holidays in a month."""
+    return MappingProxyType({
+        dt.day: name
+        for dt, name in _year_holidays(country, year).items()
+        if dt.month == month
+    })
+
+
+def warm_holiday_cache(countries, around_year, spread=1):
+    """Precompute every month of the years around around_year for each country."""
+    for country in countries:
+        for year in range(around_year - spread, around_year + spread + 1):
+            for month in range(1, 13):
+                get_month_holidays(country, year, month)
 
 class TaskCalendar(calendar.HTMLCalendar):
     """An HTMLCalendar subclass that shows tasks (and marks shared/archived)
@@ -20,7 +66,7 @@ class TaskCalendar(calendar.HTMLCalendar):
         """Organize tasks by their due day for quick lookup."""
         task_dict = {}
         for task in tasks:
-            day = task.due_date.day
+            day = timezone.localtime(task.due_date).day
             task_dict.setdefault(day, []).append(task)
         return task_dict
 
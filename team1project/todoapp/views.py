@@ -3,83 +3,73 @@
 # disabling django specific stuff and ambiguous suggestions
 # pylint: disable=W0613,R0914,R1710,R0911,W0718
 import os
+import asyncio
+import calendar
 from datetime import datetime
+from functools import wraps
 import json
 import logging
 
+from asgiref.sync import sync_to_async
 from django.contrib.auth import get_user_model
+from django.contrib.auth.views import redirect_to_login
 from django.contrib.auth import login, logout, update_session_auth_hash
 from django.contrib import messages
-from django.shortcuts import render, redirect, get_object_or_404
+from django.shortcuts import render, redirect, get_object_or_404, resolve_url
 from django.views import View
-from django.http import HttpResponse
+from django.http import Http404, HttpResponse
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_GET
+from django.views.decorators.http import require_GET, require_POST
 from django.conf import settings
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Q, prefetch_related_objects
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.core.cache import cache
+from django.utils import timezone
 
-import holidays
-import requests
-from openai import OpenAI
+from django_select2.views import AutoResponseView
 
 from .forms import CustomUserCreationForm, TaskForm, TaskCollabForm, FilterTasksForm
 from .models import Task, TaskCollabRequest, Category, WebPushSubscription
-from .utils import TaskCalendar
+from .utils import TaskCalendar, month_range, day_range, get_month_holidays
+from .caching import calendar_cache_key, CALENDAR_CACHE_TIMEOUT
+from .access import can_accept, can_manage, can_view, is_member
+from .pagination import keyset_page
+from .quotes import aget_today_quote
+from .user_search import USER_SEARCH_TIMEOUT, user_search_cache_key
+from .suggestions import get_suggestion_job, start_suggestion_job
 from .forms import CustomAuthenticationForm
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
 TRUSTED_ORIGINS = settings.TRUSTED_ORIGINS
 
+# Actions of bulk_task_action, each applied to all the selected tasks in one statement
+BULK_TASK_ACTIONS = ('archive', 'restore', 'delete', 'progress')
+# Actions only the creator of a task may apply, collaborators may set its progress
+BULK_TASK_OWNER_ACTIONS = ('archive', 'restore', 'delete')
+# Most task ids one bulk request may name, keeping the IN (...) list well under the
+# bound variables a statement may hold
+BULK_TASK_MAX_IDS = 500
 
-# Retrieves user data and sends to OpenAI API to facilitate task suggestions
-def get_ai_task_suggestion(request):
-    """ Helper view for task_view: if ?generate-task= in the URL, call GPT-4 and
-    return {'name':…, 'description':…, 'categories':[…], 'due_date':…} else return None. """
 
-    if 'generate-task' not in request.GET:
-        return None
+def async_login_required(login_url):
+    """login_required for async views, which Django only supports from 5.1.
 
-    tasks = Task.objects.filter(creator=request.user)
-    if not tasks.exists():
-        return None
-
-    # build the prompt
-    task_data_str = "\n".join(
-        f"Task: {t.name}\n"
-        f"Description: {t.description}\n"
-        f"Due Date: {t.due_date.isoformat() if t.due_date else None}\n"
-        f"Categories: {', '.join(c.name for c in t.categories.all())}"
-        for t in tasks
-    )
-
-    prompt = f"""
-    Based on the user's previous tasks and patterns, suggest a new task.
-    Return **only** a JSON object with keys: name, description, due_date, categories.
-
-    User's Tasks:
-    {task_data_str}
-    """
-
-    client = OpenAI(api_key=settings.OPENAI_TASK_SUGGESTION)
-    try:
-        resp = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role":"system","content":"You are an intelligent task suggestion assistant."},
-                {"role":"user","content":prompt}
-            ],
-            max_tokens=300,
-            temperature=0.7,
-        )
-        content = resp.choices[0].message.content.strip()
-        return json.loads(content)
-    except Exception as e:
-        raise e
+    The user is loaded once without blocking the event loop and set on request.user,
+    so the sync code the view hands off to does not load it again."""
+    def decorator(view_func):
+        @wraps(view_func)
+        async def wrapper(request, *args, **kwargs):
+            user = await request.auser()
+            if not user.is_authenticated:
+                return redirect_to_login(request.get_full_path(), resolve_url(login_url))
+            request.user = user
+            return await view_func(request, *args, **kwargs)
+        return wrapper
+    return decorator
 
 
 def index(request):
@@ -126,13 +116,44 @@ class ProfileSettings(LoginRequiredMixin, View):
             messages.success(request, "You have been logged out.")
             return redirect("index")
 
+class UserSearchView(LoginRequiredMixin, AutoResponseView):
+    """select2 endpoint of the share task user picker.
+
+    Each page of results is cached per task and search term, so repeated keystrokes
+    and other users sharing the same task are served without a query."""
+    login_url = '/'
+
+    def get(self, request, *args, **kwargs):
+        self.widget = self.get_widget_or_404()
+        self.term = request.GET.get('term', '')
+        key = user_search_cache_key(
+            self.widget.task_id, self.widget.exclude_ids, self.term, request.GET.get('page', 1)
+        )
+
+        data = cache.get(key)
+        if data is None:
+            self.object_list = self.get_queryset()
+            context = self.get_context_data()
+            data = {
+                'results': [
+                    self.widget.result_from_instance(obj, request)
+                    for obj in context['object_list']
+                ],
+                'more': context['page_obj'].has_next(),
+            }
+            cache.set(key, data, timeout=USER_SEARCH_TIMEOUT)
+        return JsonResponse(data)
+
 class EditProfile(LoginRequiredMixin, View):
     """Class that contains settings to change password, email, dark/light mode"""
     login_url = '/'
 
     def get(self, request):
         """Getter function to render a page to edit the profile"""
-        return render(request, "edit_profile.html")
+        return render(request, "edit_profile.html", {
+            "holiday_countries": settings.HOLIDAY_COUNTRIES,
+            "holiday_country": get_holiday_country(request),
+        })
 
     def post(self, request):
         """Function to store edits to the profile in the DB"""
@@ -140,6 +161,7 @@ class EditProfile(LoginRequiredMixin, View):
         username = request.POST.get("username")
         email = request.POST.get("email")
         password = request.POST.get("password")
+        holiday_country = request.POST.get("holiday_country")
 
         # update appropriate fields for the currently logged in user
         user = request.user
@@ -153,107 +175,92 @@ class EditProfile(LoginRequiredMixin, View):
 
         user.save()
 
+        # calendar holidays are a per-user preference kept in the session
+        if holiday_country in settings.HOLIDAY_COUNTRIES:
+            request.session["holiday_country"] = holiday_country
+
         messages.success(request, "Profile updated successfully!")
         return redirect("profile_settings")
 
-@login_required(login_url='/')
-def task_view(request):
+@async_login_required(login_url='/')
+async def task_view(request):
     """Function that returns tasks that were creted by the user.
 
+    The ORM work runs on the sync thread through sync_to_async, one query after the
+    other, leaving the event loop free for other requests while it waits.
+
     Returns:
         tasks with the user ID, form, suggested tasks."""
-    task_requests = TaskCollabRequest.objects.filter(to_user=request.user)
-
-    has_task = Task.objects.filter(creator=request.user).exists()
-
+    task_requests = await sync_to_async(list)(TaskCollabRequest.objects.filter(
+        to_user=request.user
+    ).select_related('task__creator'))
+    has_task = await Task.objects.filter(creator=request.user).aexists()
     # Render the tasks based on current filters set
-    form, filtered_tasks, shared_filtered_tasks, _ = get_filtered_tasks(request)
+    form, partitions = await sync_to_async(get_task_partitions)(request, 'owned', 'shared')
 
-    suggestion = get_ai_task_suggestion(request)
-    suggested_name        = suggestion.get('name','')        if suggestion else ''
-    suggested_description = suggestion.get('description','') if suggestion else ''
-    suggested_categories  = suggestion.get('categories',[])  if suggestion else []
+    # The suggestion is generated in the background and polled for by the page
+    suggestion_job = None
+    if has_task and 'generate-task' in request.GET:
+        suggestion_job = await sync_to_async(start_suggestion_job)(request.user)
 
-    return render(request, 'task_view.html', {
-        'my_tasks':             filtered_tasks,
-        'shared_tasks':         shared_filtered_tasks,
+    # The form and the templates read categories and users, so rendering is sync too
+    return await sync_to_async(render)(request, 'task_view.html', {
+        'my_tasks':             partitions['owned'],
+        'shared_tasks':         partitions['shared'],
         'task_requests':        task_requests,
         'form':                 form,
         'has_task':             has_task,
-        'suggested_name':       suggested_name,
-        'suggested_description':suggested_description,
-        'suggested_categories': suggested_categories,
+        'suggestion_job':       suggestion_job,
     })
 
-def get_filtered_tasks(request):
+@login_required(login_url='/')
+@require_GET
+def task_suggestion_status(request, job_id):
+    """Return the state of a background task suggestion as JSON.
+
+    Returns:
+        {'status': 'pending' | 'done' | 'failed', 'suggestion': {...} or None}"""
+    job = get_suggestion_job(job_id, request.user)
+    if job is None:
+        return JsonResponse({'error': 'Unknown suggestion'}, status=404)
+    return JsonResponse({'status': job['status'], 'suggestion': job.get('suggestion')})
+
+def get_task_partitions(request, *partitions):
     '''
-    Return the form and filtered tasks for user
+    Fetch one page of each of the user's task lists
+
+    Each list is paginated on its own with the ?<name>_after= cursor and ?page_size=,
+    so a page costs the same however many tasks the list holds.
 
     Parameters:
     request: User request to check for a get request or None
+    partitions: names of the lists the view needs ('owned', 'shared', 'archived')
 
     Returns:
-    form for processing the request and filtered
-    tasks that are the user's, shared, or archived in that order
-    - form, my_filtered_tasks, shared_filtered_tasks, filtered_archived_tasks
+    form for processing the request and a dict mapping each requested
+    partition name to its TaskPage
+    - form, {'owned': TaskPage, 'shared': TaskPage, 'archived': TaskPage}
     '''
     form = FilterTasksForm(request.GET or None)
-    my_filtered_tasks = Task.objects.filter(
-        creator=request.user,
-        is_archived=False
-    )
-    shared_filtered_tasks = Task.objects.filter(
-        assigned_users=request.user,
-        is_archived=False
+    user_filter = None
+    if 'make-filter' in request.GET and form.is_valid():
+        user_filter = form.cleaned_data['user_category_filter']
+
+    pages = {}
+    for name in partitions:
+        parts = Task.objects.select_related('creator').list_parts(request.user, name)
+        if user_filter:
+            parts = [
+                tasks.filter(Q(categories__in=user_filter) | Q(categories=None)).distinct()
+                for tasks in parts
+            ]
+        pages[name] = keyset_page(parts, name, request.GET)
+
+    # One prefetch for the tasks of every page instead of one per list
+    prefetch_related_objects(
+        [task for page in pages.values() for task in page], 'categories', 'assigned_users'
     )
-
-    filtered_archived_tasks = Task.objects.filter(
-        is_archived=True
-    ).filter(
-        Q(creator=request.user) | Q(assigned_users=request.user)
-    ).distinct()
-
-    if 'make-filter' in request.GET:
-        if form.is_valid():
-            user_filter = form.cleaned_data['user_category_filter']
-            if user_filter:
-                my_filtered_tasks = my_filtered_tasks.filter(
-                    Q(categories__in=user_filter) | Q(categories=None)
-                ).distinct()
-                shared_filtered_tasks = shared_filtered_tasks.filter(
-                    Q(categories__in=user_filter) | Q(categories=None)
-                ).distinct()
-                filtered_archived_tasks = filtered_archived_tasks.filter(
-                    Q(categories__in=user_filter) | Q(categories=None)
-                ).distinct()
-
-    return form, my_filtered_tasks, shared_filtered_tasks, filtered_archived_tasks
-
-def show_quote():
-    '''
-    Return today's quote from ZenQuotes API
-
-    Returns:
-    string: Pre-formatted html quote
-    '''
-    # If quote is stashed, use that stashed quote
-    quote = cache.get('zenquote_today')
-
-    if quote:
-        return quote
-
-    url = 'https://zenquotes.io/api/today/'
-    try:
-        response = requests.get(url, timeout=5)
-        response.raise_for_status()
-        data = response.json()
-        quote = data[0]["h"]
-
-        # Cache quote for ten minutes
-        cache.set('zenquote_today', quote, timeout=60 * 10)
-        return quote
-    except requests.exceptions.RequestException as _:
-        return "Could not fetch today's quote."
+    return form, pages
 
 @login_required(login_url='/')
 def add_task(request):
@@ -303,19 +310,29 @@ def add_task(request):
     return render(request, 'add_task.html', {'form': form})
 
 
+def get_task_or_404(request, task_id):
+    """Return the task if the user can view it, otherwise raise Http404.
+
+    The task and the user's access to it are loaded in one query."""
+    task = get_object_or_404(Task.objects.with_access(request.user), id=task_id)
+    if not can_view(request.user, task):
+        raise Http404("No Task matches the given query.")
+    return task
+
 @login_required(login_url='/')
 def delete_task(request, task_id):
     """Function to deleted a task from the DB for a logged in user."""
-    task = get_object_or_404(Task, id=task_id)
+    task = get_task_or_404(request, task_id)
 
-    task.delete()
+    if can_manage(request.user, task):
+        task.delete()
 
     return redirect('task_view')  # Redirect back to task list
 
 @login_required(login_url = '/')
 def edit_task(request, task_id):
     """Function to edit the task info and store updates in the DB."""
-    task = get_object_or_404(Task, id=task_id)
+    task = get_task_or_404(request, task_id)
 
     if request.method == 'POST':
         form = TaskForm(request.POST, instance=task)
@@ -336,7 +353,7 @@ def share_task(request, task_id):
 
     Returns:
         task url, task form"""
-    task = get_object_or_404(Task, id=task_id)
+    task = get_task_or_404(request, task_id)
     share_url = f"{request.get_host()}/shared_task/{task_id}"
 
     if request.method == 'POST':
@@ -360,7 +377,6 @@ def share_task(request, task_id):
             return HttpResponse('Request was already sent')
 
     else:
-        task = get_object_or_404(Task, id=task_id)
         form = TaskCollabForm(user=request.user, task=task)
 
     return render(request, 'share_task.html', {'form': form, 'task': task, 'url': share_url, })
@@ -372,7 +388,9 @@ def accept_task(request, request_id):
     Returns:
         task page render."""
     if request.method == 'POST':
-        collab_request = get_object_or_404(TaskCollabRequest, id=request_id)
+        collab_request = get_object_or_404(
+            TaskCollabRequest.objects.select_related('task'), id=request_id, to_user=request.user
+        )
         if 'accept_request' in request.POST:
             collab_request.task.assigned_users.add(collab_request.to_user)
             collab_request.delete()
@@ -395,23 +413,12 @@ def shared_task_view(request, task_id):
     Returns: 
         If successful, redirects user back to task view page
     '''
-    task = get_object_or_404(Task, id=task_id)
-    no_requests = True
-    if request.user.is_authenticated:
-        task_collab_filter = TaskCollabRequest.objects.filter(
-            task_id = task_id, to_user=request.user)
-        if task_collab_filter.exists():
-            no_requests = False
-
-    can_accept = (
-        request.user.is_authenticated and
-		request.user.username != task.creator.username and
-		request.user not in task.assigned_users.all()
-		and no_requests
-		)
+    task = get_object_or_404(
+        Task.objects.with_access(request.user).select_related('creator'), id=task_id
+    )
     context = {
 		"task": task,
-		"show_button": can_accept
+		"show_button": can_accept(request.user, task)
 	}
 
     return render(request, 'shared_task_view.html', context)
@@ -419,28 +426,11 @@ def shared_task_view(request, task_id):
 @login_required(login_url='/')
 def accept_task_link(request, task_id):
     """Function that allows the user to accept a shred task using only a link."""
-    task = get_object_or_404(Task, id=task_id)
-    task_collab_filter = TaskCollabRequest.objects.filter(task_id = task_id, to_user=request.user)
-
-	# anonymous users do not have requests,
-    # but check if authenticated users have an outstanding request
-    no_requests = True
-    if request.user.is_authenticated:
-        task_collab_filter = TaskCollabRequest.objects.filter(
-            task_id = task_id, to_user=request.user)
-        if task_collab_filter.exists():
-            no_requests = False
-
-    can_accept = (
-		request.user.is_authenticated and
-		request.user.username != task.creator.username and
-		request.user not in task.assigned_users.all()
-		and no_requests
-		)
+    task = get_object_or_404(Task.objects.with_access(request.user), id=task_id)
 
 	# Check if user is valid for accepting the task
     if request.method =='POST' and 'accept_task_link' in request.POST:
-        if can_accept:
+        if can_accept(request.user, task):
             task.assigned_users.add(request.user)
             return redirect('task_view')
     return redirect('shared_task_view', task_id=task.id)
@@ -452,47 +442,109 @@ def exit_task(request, task_id):
 
     Returns:
         task view page."""
-    task = get_object_or_404(Task, id=task_id)
-    task.assigned_users.remove(request.user)
+    task = get_object_or_404(Task.objects.with_access(request.user), id=task_id)
+    if is_member(request.user, task):
+        task.assigned_users.remove(request.user)
     return redirect('task_view')
 
 
 def archive_task(request, task_id):
     """Function to archive a task."""
-    task = get_object_or_404(Task, id=task_id)
-    task.ignore_archive = False
-    task.is_archived = True
-    task.save()
+    task = get_task_or_404(request, task_id)
+    if can_manage(request.user, task):
+        task.ignore_archive = False
+        task.is_archived = True
+        task.save()
     return redirect('task_view')
 
 
 def restore_task(request, task_id):
     """Function to restore a page from a task archive."""
     task = get_object_or_404(Task, id=task_id)
-    if task.creator == request.user or request.user in task.assigned_users.all():
+    if can_manage(request.user, task):
         task.ignore_archive = True
         task.is_archived = False
         task.save()
     return redirect('task_archive')
 
 
+@login_required(login_url='/')
+@require_POST
+def bulk_task_action(request, action):
+    """Archive, restore, delete or set the progress of many tasks in one request.
+
+    Expects a JSON body {"ids": [...]} of at most BULK_TASK_MAX_IDS ids, with
+    "progress": 0-100 for the progress action. Archive, restore and delete apply to the
+    tasks the user created, progress also to the tasks shared with them, and the other
+    tasks are skipped.
+
+    Returns:
+        JSON with the number of tasks requested, updated and skipped."""
+    if action not in BULK_TASK_ACTIONS:
+        return JsonResponse({'success': False, 'error': 'Unknown action'}, status=404)
+
+    try:
+        data = json.loads(request.body.decode('utf-8'))
+        ids = data['ids']
+        if len(ids) > BULK_TASK_MAX_IDS:
+            raise ValueError(f'At most {BULK_TASK_MAX_IDS} tasks per request')
+        task_ids = {int(task_id) for task_id in ids}
+        if action == 'progress':
+            progress = int(data['progress'])
+            if not 0 <= progress <= 100:
+                raise ValueError('Progress must be between 0 and 100')
+    except json.JSONDecodeError:
+        return JsonResponse({'success': False, 'error': 'Invalid JSON'}, status=400)
+    except KeyError as e:
+        return JsonResponse({'success': False, 'error': f"Missing field: {str(e)}"}, status=400)
+    except (TypeError, ValueError) as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+    with transaction.atomic():
+        # ownership of every task is checked in one query, like can_manage
+        if action in BULK_TASK_OWNER_ACTIONS:
+            permitted = Task.objects.filter(creator=request.user)
+        else:
+            permitted = Task.objects.visible_to(request.user)
+        allowed = list(permitted.filter(pk__in=task_ids).values_list('pk', flat=True))
+        tasks = Task.objects.filter(pk__in=allowed)
+
+        if action == 'archive':
+            updated = tasks.archive()
+        elif action == 'restore':
+            updated = tasks.restore()
+        elif action == 'delete':
+            updated = tasks.delete_tasks()
+        else:
+            updated = tasks.set_progress(progress)
+
+    return JsonResponse({
+        'success': True,
+        'action': action,
+        'requested': len(task_ids),
+        'updated': updated,
+        'skipped': len(task_ids) - len(allowed),
+    })
+
+
 def task_archive(request):
     """Function to render a task archive page."""
-    form, _, _, filtered_archived_tasks = get_filtered_tasks(request)
+    form, partitions = get_task_partitions(request, 'archived')
 
     return render(request, 'task_archive.html', {
-        'archived_tasks': filtered_archived_tasks,
+        'archived_tasks': partitions['archived'],
         'form': form,
     })
 
 
 @csrf_exempt
-def save_subscription(request):
+async def save_subscription(request):
     """Securely save a push subscription for an authenticated user."""
     if request.method != 'POST':
         return JsonResponse({'success': False, 'error': 'Invalid method'}, status=405)
 
-    if not request.user.is_authenticated:
+    user = await request.auser()
+    if not user.is_authenticated:
         return JsonResponse({'success': False, 'error': 'User not authenticated'}, status=403)
 
     origin = request.META.get('HTTP_ORIGIN', '')
@@ -501,7 +553,7 @@ def save_subscription(request):
 
     try:
         subscription_data = json.loads(request.body.decode('utf-8'))
-        save_info(request.user, subscription_data)
+        await asave_info(user, subscription_data)
         return JsonResponse({'success': True})
 
     except json.JSONDecodeError:
@@ -529,6 +581,14 @@ def save_info(user, subscription_data):
     )
 
 
+async def asave_info(user, subscription_data):
+    """Async version of save_info."""
+    await WebPushSubscription.objects.aupdate_or_create(
+        user=user,
+        defaults={'subscription_info': subscription_data}
+    )
+
+
 @require_GET
 @csrf_exempt
 def service_worker(request):
@@ -544,32 +604,36 @@ def service_worker(request):
     return HttpResponse(content, content_type='application/javascript')
 
 
+def get_holiday_country(request):
+    """Return the user's chosen holiday country, falling back to the default one."""
+    country = request.session.get('holiday_country')
+    if country in settings.HOLIDAY_COUNTRIES:
+        return country
+    return settings.HOLIDAY_COUNTRIES[0]
+
+
 def about(request):
     """Function to render an about page"""
     return render(request, 'about.html')
 
 
-@login_required(login_url='index')
-@require_GET
-def calender_view(request):
-    """Function to show tasks on the calendar on the calendar page."""
+def get_calendar_tasks(request, year, month):
+    '''
+    Return the filter form, the chosen categories, the tasks of the month and the
+    sidebar task list for the calendar page
+
+    Returns:
+    - form, categories or None, monthly tasks (lazy), sidebar tasks (evaluated)
+    '''
     # A) Category‑filter form
     form = FilterTasksForm(request.GET or None)
 
-    # B) Figure out year & month (GET or today)
-    year  = request.GET.get('year')
-    month = request.GET.get('month')
-    if year and month:
-        year, month = int(year), int(month)
-    else:
-        today = datetime.today()
-        year, month = today.year, today.month
-
-    # C) Base querysets
-    monthly_tasks = Task.objects.filter(
+    # C) Base querysets, bounded by the month's local [start, end) range
+    month_start, month_end = month_range(year, month)
+    monthly_tasks = Task.objects.for_listing().filter(
         Q(creator=request.user) | Q(assigned_users=request.user),
-        due_date__year=year,
-        due_date__month=month,
+        due_date__gte=month_start,
+        due_date__lt=month_end,
     ).distinct().order_by('due_date')
 
     sidebar_tasks = Task.objects.filter(
@@ -580,9 +644,13 @@ def calender_view(request):
 
     selected_day = request.GET.get('day')
     if selected_day and selected_day.isdigit():
-        sidebar_tasks = sidebar_tasks.filter(due_date__day=int(selected_day))
+        day = int(selected_day)
+        if 1 <= day <= calendar.monthrange(year, month)[1]:
+            day_start, day_end = day_range(year, month, day)
+            sidebar_tasks = sidebar_tasks.filter(due_date__gte=day_start, due_date__lt=day_end)
 
     # D) Apply category filter if submitted
+    cats = None
     if 'make-filter' in request.GET and form.is_valid():
         cats = form.cleaned_data['user_category_filter']
         if cats:
@@ -593,33 +661,75 @@ def calender_view(request):
                 Q(categories__in=cats) | Q(categories=None)
             ).distinct()
 
+    # Evaluated here, on the sync thread, so the page only reads the list
+    return form, cats, monthly_tasks, list(sidebar_tasks)
+
+
+def get_calendar_html(request, year, month, cats, monthly_tasks, holiday_country,
+                      holiday_dict):
+    '''
+    Return the month calendar html, reusing the rendered month until one of the
+    user's tasks changes
+    '''
+    cache_key = calendar_cache_key(
+        request.user.id, year, month,
+        [cat.pk for cat in cats] if cats else [],
+        holiday_country, timezone.localdate()
+    )
+    html_calendar = cache.get(cache_key)
+    if html_calendar is None:
+        cal = TaskCalendar(
+            monthly_tasks,
+            year=year,
+            month=month,
+            holidays=holiday_dict,
+            user=request.user
+        )
+        html_calendar = cal.formatmonth(year, month)
+        cache.set(cache_key, html_calendar, timeout=CALENDAR_CACHE_TIMEOUT)
+    return html_calendar
+
+
+@async_login_required(login_url='index')
+@require_GET
+async def calender_view(request):
+    """Function to show tasks on the calendar on the calendar page.
+
+    The holidays are looked up on a worker thread while the task queries run on the
+    sync thread. The quote is awaited afterwards, its cache reads need the sync thread
+    too and only a missing quote is fetched over aiohttp."""
+    # B) Figure out year & month (GET or today)
+    year  = request.GET.get('year')
+    month = request.GET.get('month')
+    if year and month:
+        year, month = int(year), int(month)
+    else:
+        today = timezone.localdate()
+        year, month = today.year, today.month
+
     # E) Prev/next pointers
     prev_month = 12 if month == 1 else month - 1
     prev_year  = year - 1 if month == 1 else year
     next_month = 1  if month == 12 else month + 1
     next_year  = year + 1 if month == 12 else year
 
-    # F) Holiday dict
-    us_hols = holidays.CountryHoliday('US', years=[year])
-    holiday_dict = {
-        dt.day: name
-        for dt, name in us_hols.items()
-        if dt.month == month
-    }
+    # F) Holiday dict (cached per country/year/month) alongside the tasks, then the quote
+    holiday_country = get_holiday_country(request)
+    (form, cats, monthly_tasks, sidebar_tasks), holiday_dict = await asyncio.gather(
+        sync_to_async(get_calendar_tasks)(request, year, month),
+        sync_to_async(get_month_holidays, thread_sensitive=False)(
+            holiday_country, year, month
+        ),
+    )
+    today_quote = await aget_today_quote()
 
     # G) Build calendar HTML
-    cal = TaskCalendar(
-        monthly_tasks,
-        year=year,
-        month=month,
-        holidays=holiday_dict,
-        user=request.user
+    html_calendar = await sync_to_async(get_calendar_html)(
+        request, year, month, cats, monthly_tasks, holiday_country, holiday_dict
     )
-    html_calendar = cal.formatmonth(year, month)
 
-    today_quote = show_quote()
     # H) Render once with all context
-    return render(request, 'home.html', {
+    return await sync_to_async(render)(request, 'home.html', {
         'calendar':     html_calendar,
         'year':         year,
         'month':        month,